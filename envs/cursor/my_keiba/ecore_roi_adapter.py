@@ -1,3 +1,13 @@
+"""ecore.db専用ROIアダプタ
+
+払戻の精算は ml.evaluation.settlement（N_HARAI 公式払戻・返還）に共通化。
+N_HARAI に単勝/複勝の払戻列が無いときだけ V_ROI_INPUT（オッズ換算）で集計する。
+旧 roi_calculation_*.py は `python -m ml.evaluation.settlement` に置き換え済み。
+
+`ml` をパイプライン側のパッケージとして解決するため、リポジトリ直下からモジュールとして実行する:
+    python -m envs.cursor.my_keiba.ecore_roi_adapter --ecore envs/cursor/my_keiba/ecore.db
+"""
+import argparse
 import sqlite3
 import pandas as pd
 import numpy as np
@@ -5,6 +15,9 @@ from datetime import datetime
 import json
 import os
 import sys
+from pathlib import Path
+
+from ml.evaluation.settlement import load_payouts_for, settle_entries, summarize_returns
 
 # 文字化け対策
 sys.stdout.reconfigure(encoding='utf-8')
@@ -169,6 +182,41 @@ class EcoreROIAdapter:
             print(f"サニティチェックエラー: {e}")
             return False
     
+    def calculate_roi_from_payouts(self, start_date="2024-11-02", end_date="2025-09-28"):
+        """KPI（N_HARAI 公式払戻で精算）。払戻列が無ければ None"""
+        print("=== KPI（N_HARAI 公式払戻） ===")
+
+        table = load_payouts_for(Path(self.db_path), start_date, end_date, ["win", "place"])
+        if table is None:
+            print("N_HARAI に単勝/複勝の払戻列がありません（オッズ換算にフォールバック）")
+            return None
+
+        entries = pd.read_sql_query(
+            """
+            SELECT Year, MonthDay, JyoCD, RaceNum, Umaban
+            FROM N_UMA_RACE
+            WHERE Year || MonthDay BETWEEN ? AND ?
+            """,
+            self.conn,
+            params=[start_date.replace('-', ''), end_date.replace('-', '')],
+        )
+        summary = summarize_returns(settle_entries(entries, table, 100.0), 100.0)
+        bettype_names = {"win": "tansho", "place": "fukusho"}
+        result = pd.DataFrame(
+            [
+                {
+                    "bettype": bettype_names[name],
+                    "stake_yen": row["stake"],
+                    "payoff_yen": row["return"],
+                    "roi_pct": round(100.0 * row["return"] / row["stake"], 2) if row["stake"] else None,
+                }
+                for name, row in summary.items()
+            ]
+        )
+        print("KPI結果:")
+        print(result.to_string(index=False))
+        return result
+
     def calculate_roi(self, start_date="2024-11-02", end_date="2025-09-28"):
         """KPI（黄金式：勝者だけ合算）"""
         print("=== KPI（黄金式：勝者だけ合算） ===")
@@ -242,6 +290,11 @@ class EcoreROIAdapter:
         print("=== ecore.db専用ROIアダプタ実行 ===")
         
         try:
+            # 0) N_HARAI の公式払戻があればそれで精算（列追加・オッズ換算は不要）
+            if self.calculate_roi_from_payouts(start_date, end_date) is not None:
+                print("✅ ecore.db専用ROIアダプタ完了（N_HARAI）")
+                return True
+
             # 1) 最小スキーマ（3列）を追加
             if not self.create_minimal_schema():
                 return False
@@ -270,8 +323,14 @@ class EcoreROIAdapter:
             return False
 
 def main():
-    adapter = EcoreROIAdapter()
-    success = adapter.run_ecore_roi_adapter()
+    parser = argparse.ArgumentParser(description="ecore.db専用ROIアダプタ")
+    parser.add_argument("--ecore", type=Path, default=Path("envs/cursor/my_keiba/ecore.db"))
+    parser.add_argument("--date-from", default="2024-11-02", help="開始日 YYYY-MM-DD")
+    parser.add_argument("--date-to", default="2025-09-28", help="終了日 YYYY-MM-DD")
+    args = parser.parse_args()
+
+    adapter = EcoreROIAdapter(str(args.ecore))
+    success = adapter.run_ecore_roi_adapter(args.date_from, args.date_to)
     
     if success:
         print("\n✅ ecore.db専用ROIアダプタ成功")
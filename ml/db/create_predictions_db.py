@@ -2,6 +2,13 @@
 
 Usage:
     python -m ml.db.create_predictions_db --db ../predictions.db
+
+Race lookups use the leading columns of idx_predictions_unique; the older
+idx_predictions_race is dropped by `ml.db.maintain_predictions_db`.
+
+Writers should open the database through `connect_predictions_db`, which
+applies the write-tuned PRAGMAs (WAL + synchronous=NORMAL, in-memory temp
+tables for staging).
 """
 from __future__ import annotations
 
@@ -38,23 +45,90 @@ SCHEMA_SQL = dedent(
 
     CREATE UNIQUE INDEX IF NOT EXISTS idx_predictions_unique
         ON Predictions (Year, MonthDay, JyoCD, RaceNum, Umaban, Scenario, ModelVersion);
+    """
+).strip()
+
+# Secondary indexes matched to the readers; applied after the RankGrade upgrade.
+INDEX_SQL = dedent(
+    """
+    -- Evaluation / cache fingerprint scans: one scenario over a date range.
+    CREATE INDEX IF NOT EXISTS idx_predictions_scenario_day
+        ON Predictions (Scenario, Year, MonthDay, ModelVersion, InvestFlag);
+
+    -- Covers the JVMonitor race browser read (race key + Umaban -> RankGrade).
+    CREATE INDEX IF NOT EXISTS idx_predictions_grade
+        ON Predictions (Year, MonthDay, JyoCD, RaceNum, Umaban, RankGrade);
+    """
+).strip()
 
-    CREATE INDEX IF NOT EXISTS idx_predictions_race
-        ON Predictions (Year, MonthDay, JyoCD, RaceNum, Scenario);
+# Per-day evaluation aggregates (see ml.db.evaluation_cache). Rows are sums per
+# grade / invest flag / model version; EvaluationDailyState holds the
+# fingerprints of the predictions and results each day was computed from.
+EVALUATION_CACHE_SQL = dedent(
+    """
+    CREATE TABLE IF NOT EXISTS EvaluationDaily (
+        Year          TEXT    NOT NULL,
+        MonthDay      TEXT    NOT NULL,
+        Scenario      TEXT    NOT NULL,
+        Stake         REAL    NOT NULL,
+        ModelVersion  TEXT    NOT NULL,
+        RankGrade     TEXT    NOT NULL,
+        InvestFlag    INTEGER NOT NULL,
+        Predictions   INTEGER NOT NULL, -- all rows
+        Joined        INTEGER NOT NULL, -- rows with a finishing position
+        WinHits       INTEGER NOT NULL,
+        PlaceHits     INTEGER NOT NULL,
+        OddsWinReturn REAL    NOT NULL, -- odds x stake fallback
+        PaidBets      INTEGER NOT NULL, -- joined rows settled in N_HARAI
+        WinReturn     REAL    NOT NULL,
+        PlaceReturn   REAL    NOT NULL,
+        PayoutSource  TEXT    NOT NULL, -- N_HARAI or odds
+        PRIMARY KEY (Year, MonthDay, Scenario, Stake, ModelVersion, RankGrade, InvestFlag)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS EvaluationDailyState (
+        Year                   TEXT NOT NULL,
+        MonthDay               TEXT NOT NULL,
+        Scenario               TEXT NOT NULL,
+        Stake                  REAL NOT NULL,
+        PredictionsFingerprint TEXT NOT NULL,
+        ResultsFingerprint     TEXT NOT NULL,
+        ComputedAt             TEXT NOT NULL DEFAULT (datetime('now')),
+        PRIMARY KEY (Year, MonthDay, Scenario, Stake)
+    ) WITHOUT ROWID;
     """
 ).strip()
 
+# Per-connection settings for bulk writers. WAL + synchronous=NORMAL only syncs
+# at checkpoints; a power loss can drop the last commits but never corrupts the file.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",  # 64 MiB
+)
+
+
+def connect_predictions_db(db_path: Path) -> sqlite3.Connection:
+    """Open predictions.db with the write-tuned PRAGMAs applied."""
+    conn = sqlite3.connect(db_path)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 
 def initialize_database(db_path: Path) -> None:
     conn = sqlite3.connect(db_path)
     try:
         with conn:
             conn.executescript(SCHEMA_SQL)
+            conn.executescript(EVALUATION_CACHE_SQL)
             existing_cols = {
                 row[1] for row in conn.execute("PRAGMA table_info(Predictions)").fetchall()
             }
             if "RankGrade" not in existing_cols:
                 conn.execute("ALTER TABLE Predictions ADD COLUMN RankGrade TEXT DEFAULT 'E'")
+            conn.executescript(INDEX_SQL)
     finally:
         conn.close()
 
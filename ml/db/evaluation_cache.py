@@ -0,0 +1,211 @@
+"""Per-day evaluation aggregates stored in predictions.db.
+
+`evaluate_predictions` keeps one row per (day, scenario, stake, model
+version, grade, invest flag) in EvaluationDaily: prediction count, joined
+results, hits and returns. Period summaries are sums of these rows. Each day also
+records two fingerprints in EvaluationDailyState:
+
+* predictions: row count, latest UpdatedAt and checksums of the scored
+  columns from Predictions;
+* results: finishing positions (N_UMA_RACE, covered by
+  IDX_ML_UMA_RACE_RESULT) and win/place payouts and refund flags (N_HARAI)
+  in ecore.db.
+
+A day is recomputed only when either fingerprint differs from the stored one.
+Both are cheap GROUP BY aggregates over the span, so re-evaluating a year
+after today's races reads only today's predictions and results.
+
+Example:
+    stored = stored_fingerprints(conn, "PRE", 100.0, "2025-01-01", "2025-09-30")
+    for year, month_day in stale_days(current, stored):
+        ...
+"""
+from __future__ import annotations
+
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from ml.db.create_predictions_db import EVALUATION_CACHE_SQL
+from ml.evaluation.settlement import harai_columns, payout_columns, refund_columns
+from ml.features.build_features import date_filter_sql
+
+Day = Tuple[str, str]  # (Year, MonthDay)
+Fingerprints = Dict[Day, Tuple[str, str]]  # day -> (predictions, results)
+
+AGGREGATE_KEYS = ["Year", "MonthDay", "ModelVersion", "RankGrade", "InvestFlag"]
+AGGREGATE_VALUES = [
+    "Predictions",
+    "Joined",
+    "WinHits",
+    "PlaceHits",
+    "OddsWinReturn",
+    "PaidBets",
+    "WinReturn",
+    "PlaceReturn",
+    "PayoutSource",
+]
+
+# Float totals are rounded so the summation order (hot table vs. archive view)
+# does not change the fingerprint.
+PREDICTION_FINGERPRINT_SQL = """
+    SELECT
+        Year,
+        MonthDay,
+        count(*) || ':' || ifnull(max(UpdatedAt), '') || ':' ||
+        round(total(WinScore), 6) || ':' || round(total(Odds), 6) || ':' ||
+        total(InvestFlag * CAST(Umaban AS INTEGER)) || ':' ||
+        total(ifnull(unicode(RankGrade), 0) * CAST(Umaban AS INTEGER)) || ':' ||
+        count(DISTINCT ModelVersion)
+    FROM {source}
+    WHERE Scenario = ?{date_clause}
+    GROUP BY Year, MonthDay
+"""
+
+# KakuteiJyuni x Umaban changes when any finishing position is corrected.
+RESULT_FINGERPRINT_SQL = """
+    SELECT
+        Year,
+        MonthDay,
+        count(*) || ':' ||
+        total(CAST(KakuteiJyuni AS INTEGER)) || ':' ||
+        total(CAST(KakuteiJyuni AS INTEGER) * CAST(Umaban AS INTEGER))
+    FROM N_UMA_RACE{where}
+    GROUP BY Year, MonthDay
+"""
+
+PAYOUT_BET_TYPES = ("win", "place")
+
+
+def ensure_cache_tables(conn: sqlite3.Connection) -> None:
+    conn.executescript(EVALUATION_CACHE_SQL)
+
+
+def _where(clause: str, joiner: str) -> str:
+    return f" {joiner} {clause}" if clause else ""
+
+
+def prediction_fingerprints(
+    conn: sqlite3.Connection,
+    scenario: str,
+    date_from: Optional[str],
+    date_to: Optional[str],
+    source: str = "Predictions",
+) -> Dict[Day, str]:
+    """Fingerprint of the Predictions rows of every predicted day in the span."""
+    clause, params = date_filter_sql(date_from, date_to)
+    query = PREDICTION_FINGERPRINT_SQL.format(source=source, date_clause=_where(clause, "AND"))
+    return {(year, month_day): fp for year, month_day, fp in conn.execute(query, [scenario, *params])}
+
+
+def result_fingerprints(
+    ecore_conn: sqlite3.Connection,
+    date_from: Optional[str],
+    date_to: Optional[str],
+) -> Dict[Day, str]:
+    """Fingerprint of finishing positions and win/place payouts per race day."""
+    clause, params = date_filter_sql(date_from, date_to)
+    fingerprints = {
+        (year, month_day): fp
+        for year, month_day, fp in ecore_conn.execute(
+            RESULT_FINGERPRINT_SQL.format(where=_where(clause, "WHERE")), params
+        )
+    }
+
+    existing = harai_columns(ecore_conn)
+    columns = payout_columns(existing, PAYOUT_BET_TYPES)
+    if not columns:
+        return fingerprints
+    terms = [
+        f"total(CAST({pay} AS INTEGER) * CAST({selection} AS INTEGER))"
+        for pairs in columns.values()
+        for selection, pay in pairs
+    ]
+    # Refund flags (返還 / 不成立) change returns as well.
+    terms += [
+        f"total(CAST({column} AS INTEGER) * {number})"
+        for kind, numbered in refund_columns(existing).items()
+        if kind in ("void", "uma")
+        for number, column in numbered.items()
+    ]
+    checksum = " || ':' || ".join(["count(*)", *terms])
+    payout_sql = f"SELECT Year, MonthDay, {checksum} FROM N_HARAI{_where(clause, 'WHERE')} GROUP BY Year, MonthDay"
+    for year, month_day, fp in ecore_conn.execute(payout_sql, params):
+        fingerprints[(year, month_day)] = f"{fingerprints.get((year, month_day), '')}|{fp}"
+    return fingerprints
+
+
+def stored_fingerprints(
+    conn: sqlite3.Connection,
+    scenario: str,
+    stake: float,
+    date_from: Optional[str],
+    date_to: Optional[str],
+) -> Fingerprints:
+    clause, params = date_filter_sql(date_from, date_to)
+    query = (
+        "SELECT Year, MonthDay, PredictionsFingerprint, ResultsFingerprint FROM EvaluationDailyState "
+        f"WHERE Scenario = ? AND Stake = ?{_where(clause, 'AND')}"
+    )
+    return {
+        (year, month_day): (pred_fp, result_fp)
+        for year, month_day, pred_fp, result_fp in conn.execute(query, [scenario, stake, *params])
+    }
+
+
+def stale_days(current: Fingerprints, stored: Fingerprints) -> List[Day]:
+    """Days whose fingerprints changed, are new, or no longer have predictions."""
+    changed = {day for day, fingerprint in current.items() if stored.get(day) != fingerprint}
+    removed = set(stored) - set(current)
+    return sorted(changed | removed)
+
+
+def replace_days(
+    conn: sqlite3.Connection,
+    scenario: str,
+    stake: float,
+    days: Iterable[Day],
+    current: Fingerprints,
+    aggregates: pd.DataFrame,
+) -> None:
+    """Swap the cached rows and fingerprints of `days` for freshly computed ones."""
+    days = list(days)
+    with conn:
+        conn.executemany(
+            "DELETE FROM EvaluationDaily WHERE Year = ? AND MonthDay = ? AND Scenario = ? AND Stake = ?",
+            [(year, month_day, scenario, stake) for year, month_day in days],
+        )
+        conn.executemany(
+            "DELETE FROM EvaluationDailyState WHERE Year = ? AND MonthDay = ? AND Scenario = ? AND Stake = ?",
+            [(year, month_day, scenario, stake) for year, month_day in days],
+        )
+        if not aggregates.empty:
+            columns = [*AGGREGATE_KEYS, *AGGREGATE_VALUES]
+            rows = aggregates[columns].astype(object).itertuples(index=False, name=None)
+            conn.executemany(
+                f"INSERT INTO EvaluationDaily (Scenario, Stake, {', '.join(columns)}) "
+                f"VALUES (?, ?, {', '.join('?' for _ in columns)})",
+                ((scenario, stake, *row) for row in rows),
+            )
+        conn.executemany(
+            "INSERT INTO EvaluationDailyState "
+            "(Year, MonthDay, Scenario, Stake, PredictionsFingerprint, ResultsFingerprint) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(*day, scenario, stake, *current[day]) for day in days if day in current],
+        )
+
+
+def load_aggregates(
+    conn: sqlite3.Connection,
+    scenario: str,
+    stake: float,
+    date_from: Optional[str],
+    date_to: Optional[str],
+) -> pd.DataFrame:
+    clause, params = date_filter_sql(date_from, date_to)
+    query = (
+        f"SELECT {', '.join([*AGGREGATE_KEYS, *AGGREGATE_VALUES])} FROM EvaluationDaily "
+        f"WHERE Scenario = ? AND Stake = ?{_where(clause, 'AND')}"
+    )
+    return pd.read_sql_query(query, conn, params=[scenario, stake, *params])
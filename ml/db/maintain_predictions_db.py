@@ -0,0 +1,333 @@
+"""Retention, archiving and housekeeping for predictions.db.
+
+`Predictions` is kept as a hot table of recent rows. A maintenance run moves
+three kinds of rows into per-season archive databases
+(`<archive-dir>/predictions_<Year>.db`, same schema):
+
+* every row older than `--hot-days`;
+* LIVE snapshots older than `--live-days` (PRE and later runs supersede them);
+* superseded model versions older than `--superseded-days`. For each day and
+  scenario, the version written last is kept hot and the others are archived.
+
+Rows are copied with INSERT OR REPLACE and then deleted from the hot table.
+An interrupted run is therefore safe to repeat. Readers that need history
+(`evaluate_predictions`, `analyze_rank_metrics`, `tune_rank_rules`) call
+`attach_archives`. It attaches the seasons of the requested range and exposes
+hot and archived rows through one temp view.
+
+The run also:
+
+* creates the reader-matched indexes and drops superseded ones;
+* runs ANALYZE (`PRAGMA optimize`) on every run;
+* runs VACUUM and a WAL checkpoint once `--vacuum-days` have passed since the
+  last VACUUM.
+
+This makes it cheap to schedule after every prediction run, or daily from
+Windows Task Scheduler.
+
+Usage:
+    python -m ml.db.maintain_predictions_db --db envs/cursor/my_keiba/predictions.db
+    python -m ml.db.maintain_predictions_db --hot-days 200 --dry-run
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from textwrap import dedent
+from typing import Dict, List, Optional, Tuple
+
+from ml.db.create_predictions_db import INDEX_SQL, connect_predictions_db, initialize_database
+
+ARCHIVE_COLUMNS = (
+    "Year",
+    "MonthDay",
+    "JyoCD",
+    "RaceNum",
+    "Umaban",
+    "Scenario",
+    "WinScore",
+    "PlaceScore",
+    "Odds",
+    "InvestFlag",
+    "RankGrade",
+    "M5Value",
+    "TrainerScore",
+    "FeaturesHash",
+    "ModelVersion",
+    "CreatedAt",
+    "UpdatedAt",
+)
+UNIQUE_KEY = ("Year", "MonthDay", "JyoCD", "RaceNum", "Umaban", "Scenario", "ModelVersion")
+
+# Indexes replaced by a reader-matched index in INDEX_SQL / the unique index.
+SUPERSEDED_INDEXES: Tuple[str, ...] = ("idx_predictions_race",)
+
+# SQLite attaches at most 10 databases by default; keep room for main/temp use.
+MAX_ATTACHED_SEASONS = 8
+ARCHIVE_VIEW = "PredictionsAll"
+
+MAINTENANCE_LOG_SQL = dedent(
+    """
+    CREATE TABLE IF NOT EXISTS MaintenanceLog (
+        Task      TEXT PRIMARY KEY,
+        LastRunAt TEXT NOT NULL
+    )
+    """
+).strip()
+
+# (Year, MonthDay, Scenario, ModelVersion) groups to archive. Versions are
+# ranked per day and scenario by their last write; rank 1 is the current one.
+ARCHIVE_KEYS_SQL = dedent(
+    """
+    CREATE TEMP TABLE ArchiveKeys AS
+    WITH versions AS (
+        SELECT Year, MonthDay, Scenario, ModelVersion, max(UpdatedAt) AS LastWrite
+        FROM main.Predictions
+        GROUP BY Year, MonthDay, Scenario, ModelVersion
+    ),
+    ranked AS (
+        SELECT
+            *,
+            row_number() OVER (
+                PARTITION BY Year, MonthDay, Scenario
+                ORDER BY LastWrite DESC, ModelVersion DESC
+            ) AS VersionRank
+        FROM versions
+    )
+    SELECT Year, MonthDay, Scenario, ModelVersion
+    FROM ranked
+    WHERE Year || MonthDay < :hot_cutoff
+       OR (Scenario = 'LIVE' AND Year || MonthDay < :live_cutoff)
+       OR (VersionRank > 1 AND Year || MonthDay < :superseded_cutoff)
+    """
+).strip()
+
+_ARCHIVE_MATCH = """
+    EXISTS (
+        SELECT 1 FROM temp.ArchiveKeys AS K
+        WHERE K.Year = P.Year AND K.MonthDay = P.MonthDay
+          AND K.Scenario = P.Scenario AND K.ModelVersion = P.ModelVersion
+    )
+"""
+
+
+@dataclass
+class RetentionPolicy:
+    hot_days: int = 400  # a full season plus the start of the next
+    live_days: int = 14
+    superseded_days: int = 30
+    vacuum_days: int = 7
+
+
+def default_archive_dir(predictions_db: Path) -> Path:
+    return Path(predictions_db).parent / "predictions_archive"
+
+
+def season_archive_path(archive_dir: Path, year: str) -> Path:
+    return Path(archive_dir) / f"predictions_{year}.db"
+
+
+def _cutoff(today: date, days: int) -> str:
+    return (today - timedelta(days=days)).strftime("%Y%m%d")
+
+
+def plan_archive(conn: sqlite3.Connection, policy: RetentionPolicy, today: date) -> Dict[str, int]:
+    """Fill temp.ArchiveKeys and return the number of rows to archive per season."""
+    conn.execute("DROP TABLE IF EXISTS temp.ArchiveKeys")
+    conn.execute(
+        ARCHIVE_KEYS_SQL,
+        {
+            "hot_cutoff": _cutoff(today, policy.hot_days),
+            "live_cutoff": _cutoff(today, policy.live_days),
+            "superseded_cutoff": _cutoff(today, policy.superseded_days),
+        },
+    )
+    rows = conn.execute(
+        f"SELECT P.Year, count(*) FROM main.Predictions AS P WHERE {_ARCHIVE_MATCH} GROUP BY P.Year ORDER BY P.Year"
+    ).fetchall()
+    return {year: count for year, count in rows}
+
+
+def archive_predictions(conn: sqlite3.Connection, archive_dir: Path, seasons: List[str]) -> Dict[str, int]:
+    """Move the rows selected by `plan_archive` into their season archives."""
+    columns = ", ".join(ARCHIVE_COLUMNS)
+    moved: Dict[str, int] = {}
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    for year in seasons:
+        path = season_archive_path(archive_dir, year)
+        initialize_database(path)
+        conn.execute("ATTACH DATABASE ? AS archive", (str(path),))
+        try:
+            with conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO archive.Predictions ({columns}) "
+                    f"SELECT {columns} FROM main.Predictions AS P WHERE P.Year = ? AND {_ARCHIVE_MATCH}",
+                    (year,),
+                )
+                moved[year] = conn.execute(
+                    f"DELETE FROM main.Predictions AS P WHERE P.Year = ? AND {_ARCHIVE_MATCH}",
+                    (year,),
+                ).rowcount
+        finally:
+            conn.execute("DETACH DATABASE archive")
+    return moved
+
+
+def ensure_indexes(conn: sqlite3.Connection) -> List[str]:
+    actions: List[str] = []
+    with conn:
+        conn.executescript(INDEX_SQL)
+        for index_name in SUPERSEDED_INDEXES:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)).fetchone():
+                conn.execute(f"DROP INDEX {index_name}")
+                actions.append(f"dropped superseded {index_name}")
+    return actions
+
+
+def _last_run(conn: sqlite3.Connection, task: str) -> Optional[datetime]:
+    row = conn.execute("SELECT LastRunAt FROM MaintenanceLog WHERE Task = ?", (task,)).fetchone()
+    return datetime.fromisoformat(row[0]) if row else None
+
+
+def _record_run(conn: sqlite3.Connection, task: str, when: datetime) -> None:
+    with conn:
+        conn.execute(
+            "INSERT INTO MaintenanceLog (Task, LastRunAt) VALUES (?, ?) "
+            "ON CONFLICT(Task) DO UPDATE SET LastRunAt = excluded.LastRunAt",
+            (task, when.isoformat(timespec="seconds")),
+        )
+
+
+def housekeeping(conn: sqlite3.Connection, policy: RetentionPolicy, now: datetime, force_vacuum: bool = False) -> List[str]:
+    """ANALYZE every run; VACUUM + WAL checkpoint when the vacuum interval has passed."""
+    actions: List[str] = []
+    conn.execute("PRAGMA analysis_limit=1000")
+    conn.execute("PRAGMA optimize")
+    actions.append("PRAGMA optimize (ANALYZE) done")
+
+    with conn:
+        conn.execute(MAINTENANCE_LOG_SQL)
+    last_vacuum = _last_run(conn, "vacuum")
+    if force_vacuum or last_vacuum is None or now - last_vacuum >= timedelta(days=policy.vacuum_days):
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        _record_run(conn, "vacuum", now)
+        actions.append("VACUUM + WAL checkpoint done")
+    else:
+        actions.append(f"VACUUM skipped (last run {last_vacuum:%Y-%m-%d %H:%M})")
+    return actions
+
+
+def maintain(
+    db_path: Path,
+    archive_dir: Path,
+    policy: RetentionPolicy,
+    today: Optional[date] = None,
+    dry_run: bool = False,
+    force_vacuum: bool = False,
+) -> List[str]:
+    """Archive, re-index and vacuum predictions.db; return a log of actions."""
+    now = datetime.now()
+    today = today or now.date()
+    actions: List[str] = []
+    conn = connect_predictions_db(db_path)
+    try:
+        planned = plan_archive(conn, policy, today)
+        if dry_run:
+            for year, count in planned.items():
+                actions.append(f"would archive {count} row(s) -> {season_archive_path(archive_dir, year)}")
+            if not planned:
+                actions.append("nothing to archive")
+            return actions
+
+        for year, count in archive_predictions(conn, archive_dir, list(planned)).items():
+            actions.append(f"archived {count} row(s) -> {season_archive_path(archive_dir, year)}")
+        if not planned:
+            actions.append("nothing to archive")
+        actions.extend(ensure_indexes(conn))
+        actions.extend(housekeeping(conn, policy, now, force_vacuum))
+    finally:
+        conn.close()
+    return actions
+
+
+def attach_archives(
+    conn: sqlite3.Connection,
+    archive_dir: Optional[Path],
+    date_from: Optional[str],
+    date_to: Optional[str],
+) -> str:
+    """Attach the season archives covering a date range.
+
+    Returns the relation to read predictions from: "Predictions" when no
+    archive applies, otherwise a temp view over the hot table and the attached
+    seasons. Archived rows that were later re-written to the hot table (a
+    backfill between maintenance runs) are read from the hot table only.
+    """
+    if archive_dir is None or not Path(archive_dir).is_dir():
+        return "Predictions"
+    if date_from or date_to:
+        first = int((date_from or date_to)[:4])
+        last = int((date_to or date_from)[:4])
+        paths = [season_archive_path(archive_dir, str(year)) for year in range(first, last + 1)]
+        paths = [path for path in paths if path.exists()]
+    else:
+        paths = sorted(Path(archive_dir).glob("predictions_*.db"))
+    if not paths:
+        return "Predictions"
+    if len(paths) > MAX_ATTACHED_SEASONS:
+        raise ValueError(f"Range spans {len(paths)} archived seasons; at most {MAX_ATTACHED_SEASONS} can be attached.")
+
+    columns = ", ".join(ARCHIVE_COLUMNS)
+    selects = [f"SELECT {columns} FROM main.Predictions"]
+    attached = {row[1] for row in conn.execute("PRAGMA database_list").fetchall()}
+    for path in paths:
+        alias = f"archive_{path.stem.rsplit('_', 1)[-1]}"
+        if alias not in attached:
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (str(path),))
+        hot_match = " AND ".join(f"H.{column} = A.{column}" for column in UNIQUE_KEY)
+        selects.append(
+            f"SELECT {columns} FROM {alias}.Predictions AS A "
+            f"WHERE NOT EXISTS (SELECT 1 FROM main.Predictions AS H WHERE {hot_match})"
+        )
+    conn.execute(f"DROP VIEW IF EXISTS temp.{ARCHIVE_VIEW}")
+    conn.execute(f"CREATE TEMP VIEW {ARCHIVE_VIEW} AS {' UNION ALL '.join(selects)}")
+    return f"temp.{ARCHIVE_VIEW}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive old predictions and tidy predictions.db.")
+    parser.add_argument("--db", type=Path, default=Path("envs/cursor/my_keiba/predictions.db"))
+    parser.add_argument("--archive-dir", type=Path, help="Season archive directory (default: <db dir>/predictions_archive)")
+    parser.add_argument("--hot-days", type=int, default=RetentionPolicy.hot_days, help="Keep this many days hot.")
+    parser.add_argument("--live-days", type=int, default=RetentionPolicy.live_days, help="Archive LIVE rows older than this.")
+    parser.add_argument(
+        "--superseded-days",
+        type=int,
+        default=RetentionPolicy.superseded_days,
+        help="Archive non-current model versions older than this.",
+    )
+    parser.add_argument("--vacuum-days", type=int, default=RetentionPolicy.vacuum_days, help="Minimum days between VACUUMs.")
+    parser.add_argument("--today", type=str, help="Reference date YYYY-MM-DD (default: today)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived.")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM now regardless of the interval.")
+    args = parser.parse_args()
+
+    policy = RetentionPolicy(
+        hot_days=args.hot_days,
+        live_days=args.live_days,
+        superseded_days=args.superseded_days,
+        vacuum_days=args.vacuum_days,
+    )
+    archive_dir = args.archive_dir or default_archive_dir(args.db)
+    today = date.fromisoformat(args.today) if args.today else None
+    for action in maintain(args.db, archive_dir, policy, today, dry_run=args.dry_run, force_vacuum=args.vacuum):
+        print(f"[INFO] {action}")
+    print(f"[OK] predictions.db maintained -> {args.db}")
+
+
+if __name__ == "__main__":
+    main()
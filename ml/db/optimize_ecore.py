@@ -0,0 +1,142 @@
+"""Add derived lookup tables and covering indexes to ecore.db for feature queries.
+
+Creates (idempotently):
+- `ML_RACE_KEYS`: persisted RaceKey (YYYYMMDDJJRR) and ISO RaceDate per race,
+  kept in sync with N_RACE. `build_features` joins it when present instead of
+  rebuilding both columns in pandas.
+- Indexes on N_RACE / N_UMA_RACE / N_ODDS_TANPUKU led by (Year, MonthDay, ...)
+  so day-level feature, odds and trainer-stat queries become index seeks.
+
+Usage:
+    python -m ml.db.optimize_ecore --ecore envs/cursor/my_keiba/ecore.db
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+from pathlib import Path
+from textwrap import dedent
+from typing import List, Tuple
+
+RACE_KEYS_TABLE = "ML_RACE_KEYS"
+
+RACE_KEYS_SQL = dedent(
+    f"""
+    CREATE TABLE IF NOT EXISTS {RACE_KEYS_TABLE} (
+        Year     TEXT NOT NULL,
+        MonthDay TEXT NOT NULL,
+        JyoCD    TEXT NOT NULL,
+        RaceNum  TEXT NOT NULL,
+        RaceKey  TEXT NOT NULL, -- YYYYMMDD + JyoCD(2) + RaceNum(2)
+        RaceDate TEXT NOT NULL, -- YYYY-MM-DD
+        PRIMARY KEY (Year, MonthDay, JyoCD, RaceNum)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_ml_race_keys_date ON {RACE_KEYS_TABLE} (RaceDate);
+    """
+).strip()
+
+SYNC_RACE_KEYS_SQL = dedent(
+    f"""
+    INSERT OR IGNORE INTO {RACE_KEYS_TABLE} (Year, MonthDay, JyoCD, RaceNum, RaceKey, RaceDate)
+    SELECT
+        Year,
+        MonthDay,
+        JyoCD,
+        RaceNum,
+        Year || substr('0000' || MonthDay, -4) || substr('00' || JyoCD, -2) || substr('00' || RaceNum, -2),
+        Year || '-' || substr(substr('0000' || MonthDay, -4), 1, 2) || '-' || substr(MonthDay, -2)
+    FROM N_RACE
+    WHERE Year || MonthDay >= IFNULL((SELECT MAX(Year || MonthDay) FROM {RACE_KEYS_TABLE}), '')
+    """
+).strip()
+
+# (table, index name, columns). Wide indexes cover the feature queries entirely.
+INDEXES: List[Tuple[str, str, Tuple[str, ...]]] = [
+    (
+        "N_RACE",
+        "IDX_ML_RACE_FEATURES",
+        ("Year", "MonthDay", "JyoCD", "RaceNum", "TrackCD", "Kyori", "Hondai", "HassoTime"),
+    ),
+    # Also covers result lookups (evaluate_predictions.attach_results) without touching the table.
+    (
+        "N_UMA_RACE",
+        "IDX_ML_UMA_RACE_RESULT",
+        ("Year", "MonthDay", "JyoCD", "RaceNum", "Umaban", "KakuteiJyuni"),
+    ),
+    ("N_UMA_RACE", "IDX_ML_UMA_RACE_TRAINER", ("Year", "MonthDay", "ChokyosiCode", "KakuteiJyuni")),
+    (
+        "N_ODDS_TANPUKU",
+        "IDX_ML_ODDS_TANPUKU",
+        ("Year", "MonthDay", "JyoCD", "RaceNum", "Umaban", "TanOdds", "TanNinki"),
+    ),
+]
+
+# Indexes made redundant by a wider entry in INDEXES; dropped when found.
+SUPERSEDED_INDEXES: Tuple[str, ...] = ("IDX_ML_UMA_RACE_KEY",)
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def _has_index_prefix(conn: sqlite3.Connection, table: str, columns: Tuple[str, ...]) -> bool:
+    """True when an existing index (incl. primary key) already starts with `columns`."""
+    for index_row in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        indexed = [info[2] for info in conn.execute(f"PRAGMA index_info('{index_row[1]}')").fetchall()]
+        if tuple(indexed[: len(columns)]) == columns:
+            return True
+    return False
+
+
+def optimize(conn: sqlite3.Connection, analyze: bool = True) -> List[str]:
+    """Create/refresh the lookup table and indexes; return a log of actions."""
+    actions: List[str] = []
+    with conn:
+        conn.executescript(RACE_KEYS_SQL)
+        inserted = conn.execute(SYNC_RACE_KEYS_SQL).rowcount
+        actions.append(f"{RACE_KEYS_TABLE}: {inserted} race(s) added")
+
+        for table, index_name, columns in INDEXES:
+            if not _table_exists(conn, table):
+                actions.append(f"{table}: missing, skipped {index_name}")
+                continue
+            if _has_index_prefix(conn, table, columns):
+                continue
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({', '.join(columns)})")
+            actions.append(f"{table}: created {index_name}")
+
+        for index_name in SUPERSEDED_INDEXES:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)).fetchone():
+                conn.execute(f"DROP INDEX {index_name}")
+                actions.append(f"dropped superseded {index_name}")
+
+    if analyze:
+        conn.execute("ANALYZE")
+        actions.append("ANALYZE done")
+    return actions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Add feature lookup tables and indexes to ecore.db.")
+    parser.add_argument(
+        "--ecore",
+        type=Path,
+        default=Path("envs/cursor/my_keiba/ecore.db"),
+        help="Path to ecore.db (default: envs/cursor/my_keiba/ecore.db)",
+    )
+    parser.add_argument("--no-analyze", action="store_true", help="Skip ANALYZE after creating indexes.")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.ecore)
+    try:
+        for action in optimize(conn, analyze=not args.no_analyze):
+            print(f"[INFO] {action}")
+    finally:
+        conn.close()
+    print(f"[OK] ecore.db optimised -> {args.ecore}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,48 @@
-"""Summarise hit/ROI statistics per rank grade for a date range."""
+"""Summarise hit/ROI statistics per rank grade for a date range.
+
+Besides the point estimates, each grade gets bootstrap percentile intervals
+for win ROI, win hit rate and lift. Lift is the grade's hit rate over the hit
+rate of every settled prediction. All rows are preloaded into per-unit sum
+arrays, so one resample is a weight vector and a block of resamples is one
+matrix product.
+
+* `--cluster race` (default) resamples whole races. Entries of one race are
+  not independent (exactly one winner), so these intervals are the honest ones.
+* `--cluster row` resamples bets independently within each grade.
+
+Blocks of resamples can be spread over `--workers` processes. Each block has
+its own seed from `--seed`, so results do not depend on the worker count.
+
+Example:
+    python -m ml.evaluation.analyze_rank_metrics \
+        --date-from 2025-01-01 --date-to 2025-09-30 --bootstrap 10000 --workers 4
+"""
 from __future__ import annotations
 
-import sqlite3
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
 from ml.evaluation.evaluate_predictions import (
     EvalConfig,
+    attach_payouts,
     attach_results,
-    load_predictions,
+    read_predictions,
+    return_metrics,
 )
 
 
+RACE_KEYS = ["Year", "MonthDay", "JyoCD", "RaceNum"]
+# Resamples per block; each block gets its own child seed.
+BLOCK_RESAMPLES = 500
+# Per-grade unit sums: joined bets, win hits, paid bets, return.
+GRADE_FIELDS = 4
+
+
 def grade_summary(df: pd.DataFrame, cfg: EvalConfig) -> pd.DataFrame:
     grades: List[str] = sorted(df["RankGrade"].fillna("UNKNOWN").unique().tolist())
     records = []
@@ -33,12 +60,7 @@ def grade_summary(df: pd.DataFrame, cfg: EvalConfig) -> pd.DataFrame:
         win_rate = float(win_hits / joined_total) if joined_total else None
         place_rate = float(place_hits / joined_total) if joined_total else None
 
-        odds = joined_df["Odds"].fillna(0.0).clip(lower=0.0)
-        stakes = cfg.stake
-        returns = np.where(joined_df["Finish"] == 1, odds * stakes, 0.0)
-        total_return = float(returns.sum())
-        total_stake = stakes * joined_total
-        win_roi = float((total_return - total_stake) / total_stake) if total_stake > 0 else None
+        roi = return_metrics(joined_df, cfg.stake)
 
         records.append(
             {
@@ -49,7 +71,8 @@ def grade_summary(df: pd.DataFrame, cfg: EvalConfig) -> pd.DataFrame:
                 "win_hits": int(win_hits),
                 "win_hit_rate": win_rate,
                 "place_hit_rate": place_rate,
-                "win_roi": win_roi,
+                "win_roi": roi["win_roi"],
+                "place_roi": roi["place_roi"],
                 "avg_win_score": float(grade_df["WinScore"].mean()) if not grade_df.empty else None,
                 "median_win_score": float(grade_df["WinScore"].median()) if not grade_df.empty else None,
                 "avg_m5": float(grade_df["M5Value"].mean()) if "M5Value" in grade_df else None,
@@ -62,21 +85,186 @@ def grade_summary(df: pd.DataFrame, cfg: EvalConfig) -> pd.DataFrame:
 
     summary_df = pd.DataFrame(records)
     summary_df.sort_values(by="RankGrade", inplace=True)
+    baseline = _baseline_hit_rate(df)
+    summary_df["win_lift"] = [
+        rate / baseline if rate is not None and baseline else None for rate in summary_df["win_hit_rate"]
+    ]
     return summary_df
 
 
+def _baseline_hit_rate(df: pd.DataFrame) -> Optional[float]:
+    finish = pd.to_numeric(df["Finish"], errors="coerce").dropna()
+    return float((finish == 1).mean()) if len(finish) else None
+
+
+def bootstrap_arrays(df: pd.DataFrame, cfg: EvalConfig) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """Per-row sums for the resampler.
+
+    Returns (grades, row_sums, race_codes, grade_codes). row_sums has
+    GRADE_FIELDS columns per grade, then the number of settled rows and
+    winners for the lift baseline. Only settled rows are kept.
+    """
+    settled = df[pd.to_numeric(df["Finish"], errors="coerce").notna()]
+    grades: List[str] = sorted(df["RankGrade"].fillna("UNKNOWN").unique().tolist())
+    grade_codes = pd.Categorical(settled["RankGrade"].fillna("UNKNOWN"), categories=grades).codes.astype(np.int64)
+    race_codes = settled.groupby(RACE_KEYS, sort=False, observed=True).ngroup().to_numpy(dtype=np.int64)
+
+    finish = pd.to_numeric(settled["Finish"], errors="coerce").to_numpy(dtype=float)
+    hit = (finish == 1).astype(float)
+    bet = (settled["InvestFlag"] >= cfg.min_invest_flag).to_numpy(dtype=float)
+    # Same ticket definition as `return_metrics`: every row is a paid bet,
+    # returning the N_HARAI payout when settled and odds x stake otherwise.
+    paid = np.ones(len(settled))
+    odds = settled["Odds"].fillna(0.0).clip(lower=0.0).to_numpy(dtype=float)
+    returns = np.where(hit > 0, odds * cfg.stake, 0.0)
+    if "WinReturn" in settled.columns:
+        payout_settled = settled["PayoutSettled"].to_numpy(dtype=bool)
+        returns = np.where(payout_settled, settled["WinReturn"].to_numpy(dtype=float), returns)
+
+    rows = np.arange(len(settled))
+    row_sums = np.zeros((len(settled), GRADE_FIELDS * len(grades) + 2))
+    base = GRADE_FIELDS * grade_codes
+    row_sums[rows, base] = bet
+    row_sums[rows, base + 1] = bet * hit
+    row_sums[rows, base + 2] = bet * paid
+    row_sums[rows, base + 3] = bet * paid * returns
+    row_sums[:, -2] = 1.0
+    row_sums[:, -1] = hit
+    return grades, row_sums, race_codes, grade_codes
+
+
+# Worker-side state; set once per process by `_init_worker`.
+_STATE: Dict[str, object] = {}
+
+
+def _init_worker(
+    unit_sums: List[np.ndarray],
+    columns: List[np.ndarray],
+    width: int,
+    baseline: Optional[Tuple[int, float]],
+) -> None:
+    _STATE["unit_sums"] = unit_sums
+    _STATE["columns"] = columns
+    _STATE["width"] = width
+    _STATE["baseline"] = baseline
+
+
+def _resample_weights(rng: np.random.Generator, size: int, units: int) -> np.ndarray:
+    """(size, units) draw counts: each row is one bootstrap resample of `units` units."""
+    draws = rng.integers(0, units, size=(size, units)) + units * np.arange(size)[:, None]
+    return np.bincount(draws.ravel(), minlength=size * units).reshape(size, units).astype(np.float64)
+
+
+def _resample_block(task: Tuple[np.random.SeedSequence, int]) -> np.ndarray:
+    """Summed columns of `size` resamples.
+
+    Each stratum is resampled on its own and fills its columns. With a
+    baseline, the settled-row count is fixed and the winner count is binomial,
+    which is the row-level bootstrap of a 0/1 column.
+    """
+    seed, size = task
+    rng = np.random.default_rng(seed)
+    unit_sums: List[np.ndarray] = _STATE["unit_sums"]  # type: ignore[assignment]
+    columns: List[np.ndarray] = _STATE["columns"]  # type: ignore[assignment]
+    baseline: Optional[Tuple[int, float]] = _STATE["baseline"]  # type: ignore[assignment]
+
+    totals = np.zeros((size, int(_STATE["width"])))
+    for sums, cols in zip(unit_sums, columns):
+        totals[:, cols] = _resample_weights(rng, size, len(sums)) @ sums
+    if baseline is not None:
+        rows, rate = baseline
+        totals[:, -2] = rows
+        totals[:, -1] = rng.binomial(rows, rate, size=size)
+    return totals
+
+
+def bootstrap_intervals(
+    df: pd.DataFrame,
+    cfg: EvalConfig,
+    resamples: int,
+    cluster: str = "race",
+    confidence: float = 0.95,
+    seed: int = 42,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """Percentile intervals of win ROI / hit rate / lift per grade."""
+    grades, row_sums, race_codes, grade_codes = bootstrap_arrays(df, cfg)
+    if not len(row_sums):
+        return pd.DataFrame({"RankGrade": grades})
+
+    if cluster == "race":
+        # One unit per race: sum the rows of each race.
+        race_sums = np.zeros((int(race_codes.max()) + 1, row_sums.shape[1]))
+        np.add.at(race_sums, race_codes, row_sums)
+        unit_sums = [race_sums]
+        columns = [np.arange(row_sums.shape[1])]
+        baseline = None
+    else:
+        unit_sums, columns = [], []
+        for code in range(len(grades)):
+            cols = np.arange(GRADE_FIELDS * code, GRADE_FIELDS * (code + 1))
+            stratum = row_sums[(grade_codes == code) & (row_sums[:, cols[0]] > 0)][:, cols]
+            if len(stratum):
+                unit_sums.append(stratum)
+                columns.append(cols)
+        baseline = (len(row_sums), float(row_sums[:, -1].mean()))
+        if not unit_sums:
+            return pd.DataFrame({"RankGrade": grades})
+
+    sizes = [BLOCK_RESAMPLES] * (resamples // BLOCK_RESAMPLES)
+    if resamples % BLOCK_RESAMPLES:
+        sizes.append(resamples % BLOCK_RESAMPLES)
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(unit_sums, columns, row_sums.shape[1], baseline),
+        ) as pool:
+            blocks = list(pool.map(_resample_block, tasks))
+    else:
+        _init_worker(unit_sums, columns, row_sums.shape[1], baseline)
+        blocks = [_resample_block(task) for task in tasks]
+    totals = np.vstack(blocks)
+
+    per_grade = totals[:, : GRADE_FIELDS * len(grades)].reshape(len(totals), len(grades), GRADE_FIELDS)
+    bets, hits, paid, returns = (per_grade[:, :, field] for field in range(GRADE_FIELDS))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hit_rate = np.where(bets > 0, hits / bets, np.nan)
+        roi = np.where(paid > 0, (returns - cfg.stake * paid) / (cfg.stake * paid), np.nan)
+        baseline_rate = totals[:, -1] / totals[:, -2]
+        lift = np.where(baseline_rate[:, None] > 0, hit_rate / baseline_rate[:, None], np.nan)
+
+    tail = (1.0 - confidence) / 2.0 * 100.0
+    intervals: Dict[str, object] = {"RankGrade": grades}
+    for name, values in (("win_roi", roi), ("win_hit_rate", hit_rate), ("win_lift", lift)):
+        defined = ~np.isnan(values).all(axis=0)
+        bounds = np.full((2, len(grades)), np.nan)
+        if defined.any():
+            bounds[:, defined] = np.nanpercentile(values[:, defined], [tail, 100.0 - tail], axis=0)
+        intervals[f"{name}_lo"] = bounds[0]
+        intervals[f"{name}_hi"] = bounds[1]
+    return pd.DataFrame(intervals)
+
+
 def format_percentage(value: float | None) -> str:
-    if value is None:
+    if value is None or pd.isna(value):
         return "-"
     return f"{value*100:.1f}%"
 
 
 def format_ratio(value: float | None) -> str:
-    if value is None:
+    if value is None or pd.isna(value):
         return "-"
     return f"{value:.2f}"
 
 
+def format_interval(low: float, high: float, formatter=format_ratio) -> str:
+    if pd.isna(low) or pd.isna(high):
+        return "-"
+    return f"[{formatter(low)}, {formatter(high)}]"
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Analyse prediction performance per rank grade.")
     parser.add_argument("--date-from", type=str, required=True, help="Start date YYYY-MM-DD")
@@ -86,6 +274,11 @@ def main() -> None:
     parser.add_argument("--ecore", type=Path, default=Path("envs/cursor/my_keiba/ecore.db"))
     parser.add_argument("--stake", type=float, default=100.0)
     parser.add_argument("--output-csv", type=Path, help="Optional path to export the summary CSV.")
+    parser.add_argument("--bootstrap", type=int, default=2000, help="Bootstrap resamples for intervals (0 = off).")
+    parser.add_argument("--cluster", choices=["race", "row"], default="race", help="Resampling unit (default: race).")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Interval coverage (default: 0.95).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for resampling.")
     args = parser.parse_args()
 
     cfg = EvalConfig(
@@ -97,21 +290,48 @@ def main() -> None:
         stake=args.stake,
     )
 
-    with sqlite3.connect(cfg.predictions_db) as conn:  # type: ignore[name-defined]
-        preds = load_predictions(conn, cfg)
-    preds_with_results = attach_results(preds, cfg)
+    preds = read_predictions(cfg)
+    preds_with_results = attach_payouts(attach_results(preds, cfg), cfg)
     if preds_with_results.empty:
         print("[WARN] No prediction rows found for the specified range.")
         return
 
     summary_df = grade_summary(preds_with_results, cfg)
+    if args.bootstrap > 0:
+        intervals = bootstrap_intervals(
+            preds_with_results,
+            cfg,
+            args.bootstrap,
+            cluster=args.cluster,
+            confidence=args.confidence,
+            seed=args.seed,
+            workers=max(1, args.workers),
+        )
+        summary_df = summary_df.merge(intervals, how="left", on="RankGrade")
+
     display_df = summary_df.copy()
+    if args.bootstrap > 0:
+        display_df["win_roi_ci"] = [
+            format_interval(lo, hi) for lo, hi in zip(summary_df["win_roi_lo"], summary_df["win_roi_hi"])
+        ]
+        display_df["win_hit_rate_ci"] = [
+            format_interval(lo, hi, format_percentage)
+            for lo, hi in zip(summary_df["win_hit_rate_lo"], summary_df["win_hit_rate_hi"])
+        ]
+        display_df["win_lift_ci"] = [
+            format_interval(lo, hi) for lo, hi in zip(summary_df["win_lift_lo"], summary_df["win_lift_hi"])
+        ]
+        display_df.drop(columns=[c for c in summary_df.columns if c.endswith(("_lo", "_hi"))], inplace=True)
     display_df["win_hit_rate"] = display_df["win_hit_rate"].apply(format_percentage)
     display_df["place_hit_rate"] = display_df["place_hit_rate"].apply(format_percentage)
     display_df["win_roi"] = display_df["win_roi"].apply(format_ratio)
+    display_df["place_roi"] = display_df["place_roi"].apply(format_ratio)
+    display_df["win_lift"] = display_df["win_lift"].apply(format_ratio)
 
     print("=== Rank Grade Summary ===")
     print(display_df.to_string(index=False))
+    if args.bootstrap > 0:
+        print(f"[INFO] {args.confidence:.0%} intervals from {args.bootstrap} {args.cluster}-level bootstrap resamples")
 
     if args.output_csv:
         args.output_csv.parent.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,299 @@
+"""Walk-forward backtest: score, grade, bet and settle day by day.
+
+The feature frame for the whole span (plus the training history when the
+model is refit) is loaded once. Days are grouped into segments that share a
+model. With `--retrain-days N` the model is refit on every settled race before
+each segment's first day; otherwise the stored artifacts are reused for
+the whole run. Each segment is scored in one `predict_proba` call and graded
+with the vectorised rank engine. Settlement covers every bet of the span in one
+pass, so a multi-year run costs a few model fits plus array arithmetic.
+
+Bets are one ticket per bet type (`--bet-types`, default win) for every entry
+whose grade is an invest grade for the scenario. Tickets are settled against
+the official N_HARAI payouts (`ml.evaluation.settlement`); without N_HARAI,
+win tickets fall back to odds x stake. The per-day equity curve (stake,
+return, profit, bankroll) is written to CSV.
+
+Example:
+    python -m ml.evaluation.backtest --date-from 2024-01-01 --date-to 2025-09-30 \
+        --feature-store ml/feature_store --retrain-days 28 --output-csv backtest_equity.csv
+"""
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ml.evaluation.settlement import PayoutTable, load_payouts_for, settle
+from ml.features.build_features import FeatureConfig, build_feature_frame
+from ml.features.feature_store import FeatureStore
+from ml.models.registry import DEFAULT_BACKEND, available_backends
+from ml.models.train_win_model import fit_win_model, predict_win_scores, select_feature_columns
+from ml.predict_today import PredictionConfig, load_model_artifacts
+from ml.rank_engine import assign_rank_grades, load_rank_config
+
+
+@dataclass
+class BacktestConfig:
+    ecore_db: Path
+    excel_db: Optional[Path]
+    feature_store: Optional[Path]
+    date_from: str
+    date_to: str
+    scenario: str = "PRE"
+    rank_rules_path: Optional[Path] = None
+    model_dir: Path = Path("ml/model_artifacts")
+    model_version: Optional[str] = None
+    retrain_days: int = 0  # 0 = reuse the stored model for the whole run
+    train_window_days: int = 0  # 0 = expanding window from the first loaded date
+    history_from: Optional[str] = None
+    backend: str = DEFAULT_BACKEND  # model backend when retraining
+    bet_types: Tuple[str, ...] = ("win",)
+    stake: float = 100.0
+    bankroll: float = 100_000.0
+    output_csv: Optional[Path] = None
+    bets_csv: Optional[Path] = None
+
+
+def load_backtest_frame(cfg: BacktestConfig) -> pd.DataFrame:
+    """Feature rows from the history start (or date_from) to date_to, in date order."""
+    start = cfg.history_from if cfg.retrain_days else cfg.date_from
+    if cfg.feature_store:
+        frame = FeatureStore(cfg.feature_store).load(start, cfg.date_to)
+    else:
+        excel_db = cfg.excel_db if cfg.excel_db and cfg.excel_db.exists() else None
+        frame = build_feature_frame(
+            FeatureConfig(
+                ecore_db=cfg.ecore_db,
+                excel_db=excel_db,
+                output_path=None,
+                date_from=start,
+                date_to=cfg.date_to,
+                read_only=True,
+            )
+        )
+    if frame.empty:
+        return frame
+    frame["Finish"] = pd.to_numeric(frame["KakuteiJyuni"].astype(object), errors="coerce")
+    return frame.sort_values("RaceDate", kind="stable").reset_index(drop=True)
+
+
+def _segments(days: List[pd.Timestamp], retrain_days: int) -> List[List[pd.Timestamp]]:
+    """Consecutive race days sharing one model (a single segment when not retraining)."""
+    if not retrain_days:
+        return [days]
+    segments: List[List[pd.Timestamp]] = []
+    for day in days:
+        if not segments or (day - segments[-1][0]).days >= retrain_days:
+            segments.append([])
+        segments[-1].append(day)
+    return segments
+
+
+def _training_rows(frame: pd.DataFrame, cutoff: pd.Timestamp, window_days: int) -> pd.DataFrame:
+    mask = (frame["RaceDate"] < cutoff) & frame["Finish"].notna()
+    if window_days:
+        mask &= frame["RaceDate"] >= cutoff - timedelta(days=window_days)
+    return frame[mask]
+
+
+def run_backtest(cfg: BacktestConfig, frame: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Return (bets, equity curve) for the configured span."""
+    rank_rules, invest_grades, fallback_grade, _ = load_rank_config(cfg.scenario, cfg.rank_rules_path)
+    in_span = frame["RaceDate"].between(pd.Timestamp(cfg.date_from), pd.Timestamp(cfg.date_to))
+    days = sorted(frame.loc[in_span, "RaceDate"].unique())
+
+    model = scaler = None
+    feature_columns: List[str] = []
+    version = None
+    backend: Optional[str] = cfg.backend
+    if not cfg.retrain_days:
+        probe = PredictionConfig(
+            ecore_db=cfg.ecore_db,
+            excel_db=cfg.excel_db,
+            predictions_db=Path(),
+            model_dir=cfg.model_dir,
+            model_version=cfg.model_version,
+            scenario=cfg.scenario,
+            target_date=cfg.date_from,
+            rank_rules=rank_rules,
+            invest_grades=invest_grades,
+            fallback_grade=fallback_grade,
+            rank_config_source="",
+        )
+        model, scaler, metadata = load_model_artifacts(probe)
+        feature_columns = metadata.get("features", [])
+        version = metadata["version"]
+        backend = metadata.get("backend")
+    else:
+        feature_columns = select_feature_columns(frame.columns)
+
+    scored: List[pd.DataFrame] = []
+    for segment in _segments([pd.Timestamp(d) for d in days], cfg.retrain_days):
+        if cfg.retrain_days:
+            train = _training_rows(frame, segment[0], cfg.train_window_days)
+            if train.empty or train["WinLabel"].nunique() < 2:
+                print(f"[WARN] {segment[0].date()}: not enough settled history to train; segment skipped.")
+                continue
+            model, scaler, _ = fit_win_model(train, feature_columns, validation_size=0, backend=cfg.backend)
+            version = f"wf-{segment[0]:%Y%m%d}"
+            print(f"[INFO] {segment[0].date()}: model refit on {len(train)} rows ({len(segment)} day(s) ahead)")
+
+        rows = frame[frame["RaceDate"].between(segment[0], segment[-1])].copy()
+        rows["WinScore"] = predict_win_scores(rows, model, scaler, feature_columns, backend)
+        rows["RankGrade"] = assign_rank_grades(rows, rank_rules, fallback_grade)
+        rows["ModelVersion"] = version
+        scored.append(rows)
+
+    if not scored:
+        return pd.DataFrame(), pd.DataFrame()
+    graded = pd.concat(scored, ignore_index=True)
+    selected = graded[graded["RankGrade"].isin(invest_grades)]
+    payouts = load_payouts_for(cfg.ecore_db, cfg.date_from, cfg.date_to, cfg.bet_types)
+    bets = settle_bets(selected, payouts, cfg.stake, cfg.bet_types)
+    return bets, equity_curve(bets, days, cfg.bankroll)
+
+
+def settle_bets(
+    selected: pd.DataFrame,
+    payouts: Optional[PayoutTable],
+    stake: float,
+    bet_types: Tuple[str, ...] = ("win",),
+) -> pd.DataFrame:
+    """One settled ticket per selected entry and bet type (unsettled races dropped)."""
+    if payouts is None:
+        if set(bet_types) != {"win"}:
+            raise ValueError("N_HARAI is required to settle bet types other than win.")
+        tickets = selected[selected["Finish"].notna()].copy()
+        odds = pd.to_numeric(tickets["PreTanOdds"], errors="coerce").fillna(0.0).clip(lower=0.0).to_numpy(dtype=float)
+        hit = tickets["Finish"].to_numpy(dtype=float) == 1
+        tickets["BetType"] = "win"
+        tickets["Stake"] = stake
+        tickets["Hit"] = hit.astype(int)
+        tickets["Return"] = np.where(hit, odds * stake, 0.0)
+        return tickets
+
+    missing = [name for name in bet_types if name not in payouts.available]
+    if missing:
+        raise ValueError(f"N_HARAI has no payout columns for bet type(s) {missing}.")
+    frames = []
+    for name in bet_types:
+        tickets = selected.copy()
+        tickets["BetType"] = name
+        tickets["Selection"] = tickets["Umaban"].astype(str)
+        tickets["Stake"] = stake
+        frames.append(settle(tickets, payouts))
+    tickets = pd.concat(frames, ignore_index=True)
+    return tickets[tickets["Settled"]].copy()
+
+
+def equity_curve(bets: pd.DataFrame, days: List[pd.Timestamp], bankroll: float) -> pd.DataFrame:
+    """Per-day stake / return / profit and the running bankroll (days without bets included)."""
+    daily = (
+        bets.groupby("RaceDate")
+        .agg(bets=("Stake", "size"), hits=("Hit", "sum"), stake=("Stake", "sum"), returns=("Return", "sum"))
+        .reindex(pd.DatetimeIndex(days, name="RaceDate"), fill_value=0)
+    )
+    daily["profit"] = daily["returns"] - daily["stake"]
+    daily["cumulative_profit"] = daily["profit"].cumsum()
+    daily["bankroll"] = bankroll + daily["cumulative_profit"]
+    daily["drawdown"] = daily["bankroll"] - daily["bankroll"].cummax().clip(lower=bankroll)
+    return daily.reset_index()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Walk-forward backtest over features, rank rules and results.")
+    parser.add_argument("--date-from", required=True, help="First backtest date YYYY-MM-DD")
+    parser.add_argument("--date-to", required=True, help="Last backtest date YYYY-MM-DD")
+    parser.add_argument("--scenario", type=str, default="PRE")
+    parser.add_argument("--ecore", type=Path, default=Path("envs/cursor/my_keiba/ecore.db"))
+    parser.add_argument("--excel", type=Path, default=Path("envs/cursor/my_keiba/excel_data.db"))
+    parser.add_argument("--feature-store", type=Path, help="Load features from a feature store directory.")
+    parser.add_argument("--rank-rules", type=Path, help="Rank rule JSON (default: ml/config/rank_rules.json).")
+    parser.add_argument("--model-dir", type=Path, default=Path("ml/model_artifacts"))
+    parser.add_argument("--model-version", type=str, help="Stored model to reuse when not retraining.")
+    parser.add_argument("--retrain-days", type=int, default=0, help="Refit the model every N days (0: reuse stored model).")
+    parser.add_argument("--train-window-days", type=int, default=0, help="Training window in days (0: expanding).")
+    parser.add_argument(
+        "--history-from",
+        type=str,
+        help="First date of training history when retraining (default: 365 days before --date-from).",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=available_backends(),
+        default=DEFAULT_BACKEND,
+        help="Model backend when retraining (a stored model uses the backend in its metadata).",
+    )
+    parser.add_argument(
+        "--bet-types",
+        nargs="+",
+        choices=["win", "place"],
+        default=["win"],
+        help="Single-horse ticket types bought per selected entry (default: win).",
+    )
+    parser.add_argument("--stake", type=float, default=100.0)
+    parser.add_argument("--bankroll", type=float, default=100_000.0, help="Starting bankroll for the equity curve.")
+    parser.add_argument("--output-csv", type=Path, help="Write the per-day equity curve here.")
+    parser.add_argument("--bets-csv", type=Path, help="Optionally write every settled bet here.")
+    args = parser.parse_args()
+
+    history_from = args.history_from or (date.fromisoformat(args.date_from) - timedelta(days=365)).isoformat()
+    cfg = BacktestConfig(
+        ecore_db=args.ecore,
+        excel_db=args.excel,
+        feature_store=args.feature_store,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        scenario=args.scenario.upper(),
+        rank_rules_path=args.rank_rules,
+        model_dir=args.model_dir,
+        model_version=args.model_version,
+        retrain_days=max(0, args.retrain_days),
+        train_window_days=max(0, args.train_window_days),
+        history_from=history_from,
+        backend=args.backend,
+        bet_types=tuple(args.bet_types),
+        stake=args.stake,
+        bankroll=args.bankroll,
+        output_csv=args.output_csv,
+        bets_csv=args.bets_csv,
+    )
+
+    frame = load_backtest_frame(cfg)
+    if frame.empty:
+        print("[WARN] No feature rows found for the specified range.")
+        return
+    bets, curve = run_backtest(cfg, frame)
+    if curve.empty:
+        print("[WARN] Nothing was scored; check the training history and date range.")
+        return
+
+    total_stake = float(curve["stake"].sum())
+    total_return = float(curve["returns"].sum())
+    print("=== Walk-forward Backtest ===")
+    print(f"Scenario        : {cfg.scenario}")
+    print(f"Date Range      : {cfg.date_from} -> {cfg.date_to} ({len(curve)} race day(s))")
+    print(f"Bets            : {int(curve['bets'].sum())} (hits {int(curve['hits'].sum())})")
+    print(f"Stake / Return  : {total_stake:,.0f} / {total_return:,.0f}")
+    print(f"ROI             : {(total_return - total_stake) / total_stake:.3f}" if total_stake else "ROI             : -")
+    print(f"Final bankroll  : {curve['bankroll'].iloc[-1]:,.0f} (max drawdown {curve['drawdown'].min():,.0f})")
+
+    if cfg.output_csv:
+        cfg.output_csv.parent.mkdir(parents=True, exist_ok=True)
+        curve.to_csv(cfg.output_csv, index=False, encoding="utf-8")
+        print(f"[OK] equity curve written -> {cfg.output_csv}")
+    if cfg.bets_csv:
+        cfg.bets_csv.parent.mkdir(parents=True, exist_ok=True)
+        columns = ["RaceDate", "RaceKey", "Umaban", "Bamei", "WinScore", "RankGrade", "PreTanOdds", "Finish", "BetType", "Stake", "Return", "ModelVersion"]
+        bets[[c for c in columns if c in bets.columns]].to_csv(cfg.bets_csv, index=False, encoding="utf-8")
+        print(f"[OK] bets written -> {cfg.bets_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,18 @@
 
 The script reads rows from predictions.db (Predictions table), joins them with
 official results in ecore.db (N_UMA_RACE), and computes hit rates / ROI.
+Win and place returns are settled against the official N_HARAI payouts
+(`ml.evaluation.settlement`); without N_HARAI the win ROI falls back to
+odds x stake.
+
+Seasons archived by `ml.db.maintain_predictions_db` are attached
+automatically, so ranges older than the hot table still evaluate in full.
+
+Metrics are summed from per-day aggregates cached in predictions.db
+(`ml.db.evaluation_cache`). Only days whose predictions or results changed
+since the last run are re-read, so a year-to-date summary after today's races
+costs one day of work. `--no-cache` evaluates the rows directly;
+`--rebuild-cache` recomputes every day of the range.
 
 Example:
     python -m ml.evaluation.evaluate_predictions \
@@ -12,14 +24,31 @@ from __future__ import annotations
 import argparse
 import json
 import sqlite3
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Sequence
+from typing import List, Optional, Tuple
 
 import pandas as pd
 import numpy as np
 
+from ml.db.create_predictions_db import connect_predictions_db
+from ml.db.maintain_predictions_db import attach_archives, default_archive_dir
+from ml.db.evaluation_cache import (
+    AGGREGATE_KEYS,
+    AGGREGATE_VALUES,
+    Day,
+    ensure_cache_tables,
+    load_aggregates,
+    prediction_fingerprints,
+    replace_days,
+    result_fingerprints,
+    stale_days,
+    stored_fingerprints,
+)
+from ml.evaluation.settlement import load_payouts_for, settle_entries
+from ml.features.build_features import connect_db, date_filter_sql
+
 
 @dataclass
 class EvalConfig:
@@ -31,9 +60,13 @@ class EvalConfig:
     min_invest_flag: int = 1
     stake: float = 100.0  # 円
     output_json: Optional[Path] = None
+    archive_dir: Optional[Path] = None  # season archives; None = <predictions dir>/predictions_archive
 
+    def archives(self) -> Path:
+        return self.archive_dir or default_archive_dir(self.predictions_db)
 
-def load_predictions(conn: sqlite3.Connection, cfg: EvalConfig) -> pd.DataFrame:
+
+def load_predictions(conn: sqlite3.Connection, cfg: EvalConfig, source: str = "Predictions") -> pd.DataFrame:
     query = """
         SELECT
             Year,
@@ -44,25 +77,20 @@ def load_predictions(conn: sqlite3.Connection, cfg: EvalConfig) -> pd.DataFrame:
             Scenario,
             WinScore,
             Odds,
+            M5Value,
+            TrainerScore,
             InvestFlag,
             RankGrade,
             ModelVersion
-        FROM Predictions
+        FROM {source}
         WHERE Scenario = ?
-    """
+    """.format(source=source)
     params: list = [cfg.scenario]
-    if cfg.date_from and cfg.date_to:
-        y_from, m_from, d_from = cfg.date_from.split("-")
-        y_to, m_to, d_to = cfg.date_to.split("-")
-        mmdd_from = f"{m_from}{d_from}"
-        mmdd_to = f"{m_to}{d_to}"
-        query += " AND (Year || MonthDay) BETWEEN ? AND ?"
-        params.extend([f"{y_from}{mmdd_from}", f"{y_to}{mmdd_to}"])
-    elif cfg.date_from:
-        y, m, d = cfg.date_from.split("-")
-        mmdd = f"{m}{d}"
-        query += " AND Year = ? AND MonthDay = ?"
-        params.extend([y, mmdd])
+    # Single date when only date_from is given; the predicate stays index-friendly.
+    date_clause, date_params = date_filter_sql(cfg.date_from, cfg.date_to or cfg.date_from)
+    if date_clause:
+        query += f" AND {date_clause}"
+        params.extend(date_params)
 
     try:
         df = pd.read_sql_query(query, conn, params=params)
@@ -80,31 +108,68 @@ def load_predictions(conn: sqlite3.Connection, cfg: EvalConfig) -> pd.DataFrame:
     return df
 
 
+def read_predictions(cfg: EvalConfig) -> pd.DataFrame:
+    """load_predictions over the hot table plus any archived seasons in range."""
+    conn = sqlite3.connect(cfg.predictions_db)
+    try:
+        source = attach_archives(conn, cfg.archives(), cfg.date_from, cfg.date_to or cfg.date_from)
+        return load_predictions(conn, cfg, source)
+    finally:
+        conn.close()
+
+
+RACE_KEY_COLUMNS = ["Year", "MonthDay", "JyoCD", "RaceNum"]
+
+RACE_KEYS_TEMP_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS EvalRaceKeys (
+        Year     TEXT NOT NULL,
+        MonthDay TEXT NOT NULL,
+        JyoCD    TEXT NOT NULL,
+        RaceNum  TEXT NOT NULL,
+        PRIMARY KEY (Year, MonthDay, JyoCD, RaceNum)
+    ) WITHOUT ROWID
+"""
+
+# Driven by the predicted races; N_UMA_RACE is probed per race through
+# IDX_ML_UMA_RACE_RESULT (see ml.db.optimize_ecore) or its primary key.
+RESULTS_SQL = """
+    SELECT
+        U.Year,
+        U.MonthDay,
+        U.JyoCD,
+        U.RaceNum,
+        U.Umaban,
+        U.KakuteiJyuni
+    FROM temp.EvalRaceKeys AS K
+    CROSS JOIN N_UMA_RACE AS U
+        ON U.Year = K.Year
+       AND U.MonthDay = K.MonthDay
+       AND U.JyoCD = K.JyoCD
+       AND U.RaceNum = K.RaceNum
+"""
+
+
+def load_race_results(conn: sqlite3.Connection, races: pd.DataFrame) -> pd.DataFrame:
+    """Finishing positions for exactly the given races (Year/MonthDay/JyoCD/RaceNum)."""
+    conn.execute(RACE_KEYS_TEMP_SQL)
+    conn.execute("DELETE FROM temp.EvalRaceKeys")
+    conn.executemany(
+        "INSERT OR IGNORE INTO temp.EvalRaceKeys VALUES (?, ?, ?, ?)",
+        races[RACE_KEY_COLUMNS].astype(str).itertuples(index=False, name=None),
+    )
+    return pd.read_sql_query(RESULTS_SQL, conn)
+
+
 def attach_results(predictions: pd.DataFrame, cfg: EvalConfig) -> pd.DataFrame:
     if predictions.empty:
         return predictions
 
-    query = """
-        SELECT
-            Year,
-            MonthDay,
-            JyoCD,
-            RaceNum,
-            Umaban,
-            KakuteiJyuni
-        FROM N_UMA_RACE
-        WHERE Year IN ({years})
-          AND MonthDay IN ({mdays})
-    """
-    years = sorted(predictions["Year"].unique())
-    monthdays = sorted(predictions["MonthDay"].unique())
-    placeholders_years = ",".join("?" for _ in years)
-    placeholders_md = ",".join("?" for _ in monthdays)
-    query = query.format(years=placeholders_years or "''", mdays=placeholders_md or "''")
-    params: Sequence[str] = [*years, *monthdays]
-
-    with sqlite3.connect(cfg.ecore_db) as conn:
-        results = pd.read_sql_query(query, conn, params=params)
+    races = predictions[RACE_KEY_COLUMNS].drop_duplicates()
+    conn = connect_db(cfg.ecore_db, read_only=True)
+    try:
+        results = load_race_results(conn, races)
+    finally:
+        conn.close()
 
     if results.empty:
         predictions["Finish"] = pd.NA
@@ -117,15 +182,101 @@ def attach_results(predictions: pd.DataFrame, cfg: EvalConfig) -> pd.DataFrame:
         how="left",
         on=["Year", "MonthDay", "JyoCD", "RaceNum", "Umaban"],
     )
-    merged["Finish"] = merged["KakuteiJyuni"].apply(
-        lambda x: int(x) if isinstance(x, str) and x.isdigit() else pd.NA
-    )
+    finish = merged["KakuteiJyuni"].astype("string").str.strip()
+    merged["Finish"] = pd.to_numeric(finish.where(finish.str.isdigit()), errors="coerce").astype("Int64")
     merged.drop(columns=["KakuteiJyuni"], inplace=True)
     return merged
 
 
-def compute_metrics(df: pd.DataFrame, cfg: EvalConfig) -> dict:
+def attach_payouts(df: pd.DataFrame, cfg: EvalConfig) -> pd.DataFrame:
+    """Add WinReturn / PlaceReturn (yen for cfg.stake) from N_HARAI when available."""
     if df.empty:
+        return df
+    table = load_payouts_for(cfg.ecore_db, cfg.date_from, cfg.date_to or cfg.date_from, ["win", "place"])
+    if table is None or table.races.empty or "win" not in table.available:
+        return df
+    return settle_entries(df, table, cfg.stake, ["win", "place"])
+
+
+def _payout_source(settled_bets: int, odds_bets: int) -> str:
+    if not odds_bets:
+        return "N_HARAI"
+    return "N_HARAI+odds" if settled_bets else "odds"
+
+
+def return_metrics(joined_df: pd.DataFrame, stake: float) -> dict:
+    """Win / place ROI of one ticket per row.
+
+    Rows settled in N_HARAI use the official payouts; the others fall back to
+    odds x stake for the win ROI. The place ROI covers the settled rows only.
+    """
+    odds = joined_df["Odds"].fillna(0.0).clip(lower=0.0)
+    returns = np.where(joined_df["Finish"] == 1, odds * stake, 0.0)
+    place_roi = None
+    settled_bets = 0
+    if "WinReturn" in joined_df.columns:
+        settled = joined_df["PayoutSettled"].to_numpy(dtype=bool)
+        returns = np.where(settled, joined_df["WinReturn"].to_numpy(dtype=float), returns)
+        settled_bets = int(settled.sum())
+        if settled_bets and "PlaceReturn" in joined_df.columns:
+            place_stake = stake * settled_bets
+            place_roi = float((joined_df.loc[settled, "PlaceReturn"].sum() - place_stake) / place_stake)
+
+    total_stake = stake * len(joined_df)
+    win_roi = float((float(returns.sum()) - total_stake) / total_stake) if total_stake > 0 else None
+    return {
+        "win_roi": win_roi,
+        "place_roi": place_roi,
+        "settled_bets": settled_bets,
+        "payout_source": _payout_source(settled_bets, len(joined_df) - settled_bets),
+    }
+
+
+def daily_aggregates(df: pd.DataFrame, cfg: EvalConfig) -> pd.DataFrame:
+    """Sum prediction rows per day / model version / grade / invest flag."""
+    if df.empty:
+        return pd.DataFrame(columns=[*AGGREGATE_KEYS, *AGGREGATE_VALUES])
+
+    finish = pd.to_numeric(df["Finish"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    joined = ~np.isnan(finish)
+    odds = df["Odds"].fillna(0.0).clip(lower=0.0).to_numpy(dtype=float)
+    rows = pd.DataFrame(
+        {
+            "Year": df["Year"].astype(str),
+            "MonthDay": df["MonthDay"].astype(str),
+            "ModelVersion": df["ModelVersion"].astype(str),
+            "RankGrade": df["RankGrade"].fillna("UNKNOWN").astype(str),
+            "InvestFlag": pd.to_numeric(df["InvestFlag"], errors="coerce").fillna(0).astype(int),
+            "Predictions": 1,
+            "Joined": joined.astype(int),
+            "WinHits": (finish == 1).astype(int),
+            "PlaceHits": (finish <= 3).astype(int),
+            "OddsWinReturn": np.where(finish == 1, odds * cfg.stake, 0.0),
+        }
+    )
+    if "WinReturn" in df.columns:
+        paid = joined & df["PayoutSettled"].to_numpy(dtype=bool)
+        rows["PaidBets"] = paid.astype(int)
+        rows["WinReturn"] = np.where(paid, df["WinReturn"].to_numpy(dtype=float), 0.0)
+        place = df["PlaceReturn"].to_numpy(dtype=float) if "PlaceReturn" in df.columns else 0.0
+        rows["PlaceReturn"] = np.where(paid, place, 0.0)
+    else:
+        rows["PaidBets"] = 0
+        rows["WinReturn"] = 0.0
+        rows["PlaceReturn"] = 0.0
+
+    aggregates = rows.groupby(AGGREGATE_KEYS, as_index=False, sort=False).sum()
+    if "WinReturn" not in df.columns:
+        aggregates["PayoutSource"] = "odds"
+    else:
+        # "N_HARAI-win": N_HARAI without place payout columns; PlaceReturn is not meaningful.
+        aggregates["PayoutSource"] = "N_HARAI" if "PlaceReturn" in df.columns else "N_HARAI-win"
+    return aggregates
+
+
+def metrics_from_aggregates(aggregates: pd.DataFrame, cfg: EvalConfig) -> dict:
+    """Period metrics from (cached or freshly computed) daily aggregates."""
+    if aggregates.empty:
         return {
             "total_predictions": 0,
             "invest_selections": 0,
@@ -135,26 +286,22 @@ def compute_metrics(df: pd.DataFrame, cfg: EvalConfig) -> dict:
             "win_roi": None,
             "place_hits": 0,
             "place_hit_rate": None,
+            "place_roi": None,
+            "settled_bets": 0,
             "invest_grade_counts": {},
         }
 
-    invest_df = df[df["InvestFlag"] >= cfg.min_invest_flag].copy()
-    joined_df = invest_df.dropna(subset=["Finish"])
-
+    invest = aggregates[aggregates["InvestFlag"] >= cfg.min_invest_flag]
+    total_bets = int(invest["Joined"].sum())
+    grade_counts = invest.groupby("RankGrade")["Predictions"].sum().sort_index()
     summary = {
-        "total_predictions": int(len(df)),
-        "invest_selections": int(len(invest_df)),
-        "joined_results": int(len(joined_df)),
+        "total_predictions": int(aggregates["Predictions"].sum()),
+        "invest_selections": int(invest["Predictions"].sum()),
+        "joined_results": total_bets,
+        "invest_grade_counts": {str(grade): int(count) for grade, count in grade_counts.items() if count > 0},
     }
-    if "RankGrade" in invest_df.columns:
-        grade_series = invest_df["RankGrade"].fillna("UNKNOWN")
-        summary["invest_grade_counts"] = {
-            str(grade): int(count) for grade, count in grade_series.value_counts().sort_index().items()
-        }
-    else:
-        summary["invest_grade_counts"] = {}
 
-    if joined_df.empty:
+    if total_bets == 0:
         summary.update(
             {
                 "win_hits": 0,
@@ -162,29 +309,101 @@ def compute_metrics(df: pd.DataFrame, cfg: EvalConfig) -> dict:
                 "win_roi": None,
                 "place_hits": 0,
                 "place_hit_rate": None,
+                "place_roi": None,
+                "settled_bets": 0,
             }
         )
         return summary
 
-    win_hits = (joined_df["Finish"] == 1).sum()
-    place_hits = joined_df["Finish"].apply(lambda x: 1 if pd.notna(x) and x <= 3 else 0).sum()
-    total_bets = len(joined_df)
-
-    summary["win_hits"] = int(win_hits)
-    summary["place_hits"] = int(place_hits)
+    win_hits = int(invest["WinHits"].sum())
+    place_hits = int(invest["PlaceHits"].sum())
+    summary["win_hits"] = win_hits
+    summary["place_hits"] = place_hits
     summary["win_hit_rate"] = float(win_hits / total_bets)
     summary["place_hit_rate"] = float(place_hits / total_bets)
 
-    odds = joined_df["Odds"].fillna(0.0).clip(lower=0.0)
-    stakes = cfg.stake
-    returns = np.where(joined_df["Finish"] == 1, odds * stakes, 0.0)
-    total_return = float(returns.sum())
-    total_stake = stakes * total_bets
-    summary["win_roi"] = float((total_return - total_stake) / total_stake) if total_stake > 0 else None
-
+    # Days settled in N_HARAI use the official payouts; days without any settled
+    # bet (payouts not imported yet) fall back to odds x stake for the win ROI.
+    # The place ROI needs official payouts and covers the settled days only.
+    settled = invest["PayoutSource"].str.startswith("N_HARAI") & (invest["PaidBets"] > 0)
+    settled_bets = int(invest.loc[settled, "PaidBets"].sum())
+    odds_bets = int(invest.loc[~settled, "Joined"].sum())
+    win_return = invest.loc[settled, "WinReturn"].sum() + invest.loc[~settled, "OddsWinReturn"].sum()
+    win_stake = cfg.stake * (settled_bets + odds_bets)
+    place_stake = cfg.stake * settled_bets
+    has_place = settled_bets > 0 and not (invest.loc[settled, "PayoutSource"] == "N_HARAI-win").any()
+    summary.update(
+        {
+            "win_roi": float((win_return - win_stake) / win_stake) if win_stake > 0 else None,
+            "place_roi": (
+                float((invest.loc[settled, "PlaceReturn"].sum() - place_stake) / place_stake) if has_place else None
+            ),
+            "settled_bets": settled_bets,
+            "payout_source": _payout_source(settled_bets, odds_bets),
+        }
+    )
     return summary
 
 
+def compute_metrics(df: pd.DataFrame, cfg: EvalConfig) -> dict:
+    return metrics_from_aggregates(daily_aggregates(df, cfg), cfg)
+
+
+def _iso(day: Day) -> str:
+    year, month_day = day
+    return f"{year}-{month_day[:2]}-{month_day[2:]}"
+
+
+def _stale_runs(stale: List[Day], days: List[Day]) -> List[Tuple[Day, Day]]:
+    """(first, last) of each run of `stale` days that are adjacent within the sorted `days`.
+
+    A date range over one run reads only stale days, since any fresh day in
+    between would have split the run.
+    """
+    position = {day: index for index, day in enumerate(days)}
+    runs: List[Tuple[Day, Day]] = []
+    for day in stale:
+        if runs and position[day] == position[runs[-1][1]] + 1:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+def cached_metrics(cfg: EvalConfig, rebuild: bool = False) -> Tuple[dict, List[Day]]:
+    """Metrics for the range from the per-day cache; returns (metrics, recomputed days)."""
+    date_to = cfg.date_to or cfg.date_from
+    conn = connect_predictions_db(cfg.predictions_db)
+    try:
+        ensure_cache_tables(conn)
+        source = attach_archives(conn, cfg.archives(), cfg.date_from, date_to)
+        ecore = connect_db(cfg.ecore_db, read_only=True)
+        try:
+            results = result_fingerprints(ecore, cfg.date_from, date_to)
+        finally:
+            ecore.close()
+        current = {
+            day: (fingerprint, results.get(day, ""))
+            for day, fingerprint in prediction_fingerprints(conn, cfg.scenario, cfg.date_from, date_to, source).items()
+        }
+        stored = stored_fingerprints(conn, cfg.scenario, cfg.stake, cfg.date_from, date_to)
+        stale = sorted(set(current) | set(stored)) if rebuild else stale_days(current, stored)
+
+        refresh = [day for day in stale if day in current]
+        runs = []
+        for first, last in _stale_runs(refresh, sorted(current)):
+            span = replace(cfg, date_from=_iso(first), date_to=_iso(last))
+            preds = load_predictions(conn, span, source)
+            runs.append(daily_aggregates(attach_payouts(attach_results(preds, span), span), span))
+        aggregates = pd.concat(runs, ignore_index=True) if runs else daily_aggregates(pd.DataFrame(), cfg)
+        if stale:
+            replace_days(conn, cfg.scenario, cfg.stake, stale, current, aggregates)
+        cached = load_aggregates(conn, cfg.scenario, cfg.stake, cfg.date_from, date_to)
+    finally:
+        conn.close()
+    return metrics_from_aggregates(cached, cfg), refresh
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Evaluate prediction performance.")
     parser.add_argument("--pred-db", type=Path, default=Path("envs/cursor/my_keiba/predictions.db"))
@@ -194,6 +413,10 @@ def main() -> None:
     parser.add_argument("--date-to", type=str, help="End date YYYY-MM-DD")
     parser.add_argument("--stake", type=float, default=100.0, help="Stake per wager (for ROI calculation)")
     parser.add_argument("--output-json", type=Path, help="Optional path to write metrics as JSON")
+    parser.add_argument("--archive-dir", type=Path, help="Season archives (default: <pred-db dir>/predictions_archive)")
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument("--no-cache", action="store_true", help="Evaluate rows directly without the daily cache.")
+    cache_group.add_argument("--rebuild-cache", action="store_true", help="Recompute every cached day in the range.")
     args = parser.parse_args()
 
     cfg = EvalConfig(
@@ -204,13 +427,16 @@ def main() -> None:
         date_to=args.date_to,
         stake=args.stake,
         output_json=args.output_json,
+        archive_dir=args.archive_dir,
     )
 
-    with sqlite3.connect(cfg.predictions_db) as conn:
-        preds = load_predictions(conn, cfg)
-
-    preds_with_results = attach_results(preds, cfg)
-    metrics = compute_metrics(preds_with_results, cfg)
+    if args.no_cache:
+        preds = read_predictions(cfg)
+        preds_with_results = attach_payouts(attach_results(preds, cfg), cfg)
+        metrics = compute_metrics(preds_with_results, cfg)
+    else:
+        metrics, recomputed = cached_metrics(cfg, rebuild=args.rebuild_cache)
+        print(f"[INFO] evaluation cache: {len(recomputed)} day(s) recomputed")
 
     print("=== Prediction Evaluation ===")
     print(f"Scenario       : {cfg.scenario}")
@@ -232,6 +458,8 @@ def main() -> None:
     print(f"Win ROI         : {metrics.get('win_roi')}")
     print(f"Place hits      : {metrics.get('place_hits', 0)}")
     print(f"Place hit rate  : {metrics.get('place_hit_rate')}")
+    print(f"Place ROI       : {metrics.get('place_roi')}")
+    print(f"Payout source   : {metrics.get('payout_source', '-')} ({metrics.get('settled_bets', 0)} bets settled in N_HARAI)")
 
     if cfg.output_json:
         cfg.output_json.parent.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,401 @@
+"""Settle bets against the official payouts in N_HARAI.
+
+`load_payouts` reads N_HARAI once for a date range and turns the wide
+payout columns into a long table indexed by
+(Year, MonthDay, JyoCD, RaceNum, BetType, Selection). The columns are
+resolved from the actual table: JVLinkToSQLite's 0-based
+`Pay<Type><i><Field>` layout (PayTansyo0Umaban / PayTansyo0Pay, as with
+OddsTansyoInfo0Umaban in JVMonitor) and the `Pay<Type><Field><i>` layout
+(PayTansyoUmaban1 / PayTansyoPay1) are both accepted. A bet type without
+columns is simply not available; its tickets stay unsettled. `settle` then joins
+any selection frame against it in one vectorised pass. The frame needs one
+row per ticket with the race key columns, BetType, Selection and Stake.
+Payouts are yen per 100 yen staked, as JV-Data stores them, so no
+odds-times-stake or unit guessing is involved.
+
+Selections are horse numbers for win/place, and concatenated numbers for
+combination bets (e.g. "0307" or "3-7" for a quinella). Unordered bet types
+are normalised, so "0703" and "0307" match.
+
+Refunds (返還) come from the same record: a ticket gets its stake back when
+its bet type was not formed (FuseirituFlag), when any of its horses was
+scratched or excluded (HenkanUma), or, for bracket quinellas, when a bracket
+has no runner left (HenkanWaku / HenkanDoWaku). These repeated flags are
+resolved like the payout columns, 0-based (HenkanUma0 = horse 1) or 1-based.
+
+Example:
+    python -m ml.evaluation.settlement --date-from 2025-01-01 --date-to 2025-06-30
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ml.features.build_features import connect_db, date_filter_sql
+
+RACE_KEY_COLUMNS = ["Year", "MonthDay", "JyoCD", "RaceNum"]
+
+
+@dataclass(frozen=True)
+class BetType:
+    group: str  # N_HARAI column group, e.g. "Tansyo" for PayTansyo0Umaban / PayTansyo0Pay
+    field: str  # column holding the winning selection ("Umaban" or "Kumi")
+    legs: int  # numbers per selection
+    width: int  # digits per number in the selection (枠番 1, 馬番 2)
+    ordered: bool  # True when the order of numbers matters
+    code: int  # JV-Data 券種 number, the bet type's FuseirituFlag slot (1 = 単勝 … 9 = 3連単)
+
+
+BET_TYPES: Dict[str, BetType] = {
+    "win": BetType("Tansyo", "Umaban", 1, 2, True, 1),
+    "place": BetType("Fukusyo", "Umaban", 1, 2, True, 2),
+    "bracket_quinella": BetType("Wakuren", "Kumi", 2, 1, False, 3),
+    "quinella": BetType("Umaren", "Kumi", 2, 2, False, 4),
+    "wide": BetType("Wide", "Kumi", 2, 2, False, 5),
+    "exacta": BetType("Umatan", "Kumi", 2, 2, True, 7),
+    "trio": BetType("Sanrenpuku", "Kumi", 3, 2, False, 8),
+    "trifecta": BetType("Sanrentan", "Kumi", 3, 2, True, 9),
+}
+
+# Refund kind -> N_HARAI flag group; the number is the horse, the bracket or the 券種.
+REFUND_FLAGS: Dict[str, str] = {
+    "void": "FuseirituFlag",
+    "uma": "HenkanUma",
+    "waku": "HenkanWaku",
+    "dowaku": "HenkanDoWaku",
+}
+REFUND_COLUMNS = [*RACE_KEY_COLUMNS, "Kind", "Number"]
+
+
+def normalize_selection(values: pd.Series, bet_type: str) -> pd.Series:
+    """Canonical selection text: zero-padded numbers, sorted for unordered bets."""
+    spec = BET_TYPES[bet_type]
+    text = values.astype("string").str.strip()
+    if spec.legs == 1:
+        number = text.str.replace(r"\D", "", regex=True).str.lstrip("0")
+        return number.where(number.str.len() > 0).str.zfill(spec.width)
+
+    def _canonical(found: object) -> object:
+        if not isinstance(found, list) or not found:
+            return pd.NA
+        if len(found) == 1:  # separator-free input such as "0307"
+            digits = found[0]
+            if len(digits) != spec.legs * spec.width:
+                return pd.NA
+            found = [digits[i : i + spec.width] for i in range(0, len(digits), spec.width)]
+        numbers = [part.lstrip("0") for part in found]
+        if len(numbers) != spec.legs or not all(numbers):
+            return pd.NA
+        padded = [number.zfill(spec.width) for number in numbers]
+        if not spec.ordered:
+            padded.sort()
+        return "".join(padded)
+
+    return text.str.findall(r"\d+").map(_canonical).astype("string")
+
+
+@dataclass
+class PayoutTable:
+    """Official payouts for a set of races, one row per paid selection."""
+
+    payouts: pd.DataFrame  # RACE_KEY_COLUMNS + BetType, Selection, Pay
+    races: pd.DataFrame  # RACE_KEY_COLUMNS of every race with a payout record
+    available: Tuple[str, ...] = ()  # bet types whose payout columns exist in N_HARAI
+    refunds: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=REFUND_COLUMNS))  # set flags
+
+    def __post_init__(self) -> None:
+        self.payouts = self.payouts.set_index([*RACE_KEY_COLUMNS, "BetType", "Selection"]).sort_index()
+
+    @property
+    def bet_types(self) -> List[str]:
+        return sorted(self.payouts.index.get_level_values("BetType").unique())
+
+
+def payout_columns(existing: Iterable[str], bet_types: Iterable[str]) -> Dict[str, List[Tuple[str, str]]]:
+    """(selection, pay) column pairs per bet type, in slot order; types without columns are left out."""
+    names = set(existing)
+    columns: Dict[str, List[Tuple[str, str]]] = {}
+    for name in bet_types:
+        spec = BET_TYPES[name]
+        slot_first = re.compile(rf"Pay{spec.group}(\d+){spec.field}")  # PayTansyo0Umaban
+        field_first = re.compile(rf"Pay{spec.group}{spec.field}(\d+)")  # PayTansyoUmaban1
+        pairs: List[Tuple[int, str, str]] = []
+        for column in names:
+            match = slot_first.fullmatch(column)
+            if match and f"Pay{spec.group}{match.group(1)}Pay" in names:
+                pairs.append((int(match.group(1)), column, f"Pay{spec.group}{match.group(1)}Pay"))
+                continue
+            match = field_first.fullmatch(column)
+            if match and f"Pay{spec.group}Pay{match.group(1)}" in names:
+                pairs.append((int(match.group(1)), column, f"Pay{spec.group}Pay{match.group(1)}"))
+        if pairs:
+            columns[name] = [(selection, pay) for _, selection, pay in sorted(pairs)]
+    return columns
+
+
+def numbered_columns(existing: Iterable[str], prefix: str) -> Dict[int, str]:
+    """1-based JV-Data number -> column of a repeated flag (HenkanUma0… or HenkanUma1…)."""
+    pattern = re.compile(rf"{prefix}(\d+)")
+    found = {int(match.group(1)): name for name in existing if (match := pattern.fullmatch(name))}
+    offset = 1 if 0 in found else 0
+    return {number + offset: name for number, name in found.items()}
+
+
+def refund_columns(existing: Iterable[str]) -> Dict[str, Dict[int, str]]:
+    """Flag columns per refund kind (see REFUND_FLAGS); kinds without columns are left out."""
+    names = list(existing)
+    columns = {kind: numbered_columns(names, prefix) for kind, prefix in REFUND_FLAGS.items()}
+    return {kind: numbered for kind, numbered in columns.items() if numbered}
+
+
+def harai_columns(conn: sqlite3.Connection) -> List[str]:
+    """Column names of N_HARAI; empty when the table does not exist."""
+    return [row[1] for row in conn.execute("PRAGMA table_info(N_HARAI)").fetchall()]
+
+
+def load_payouts(
+    conn: sqlite3.Connection,
+    date_from: Optional[str],
+    date_to: Optional[str],
+    bet_types: Optional[Iterable[str]] = None,
+) -> PayoutTable:
+    """Read N_HARAI for an inclusive date range into a long, indexed payout table.
+
+    When none of the requested bet types has payout columns, the table has no
+    races, so nothing is settled against it.
+    """
+    wanted = list(bet_types) if bet_types is not None else list(BET_TYPES)
+    unknown = [name for name in wanted if name not in BET_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown bet type(s): {unknown}")
+
+    existing = harai_columns(conn)
+    columns = payout_columns(existing, wanted)
+    if not columns:
+        return PayoutTable(
+            payouts=pd.DataFrame(columns=[*RACE_KEY_COLUMNS, "BetType", "Selection", "Pay"]),
+            races=pd.DataFrame(columns=RACE_KEY_COLUMNS),
+        )
+    flags = refund_columns(existing)
+    selected = [column for pairs in columns.values() for pair in pairs for column in pair]
+    selected += [column for numbered in flags.values() for column in numbered.values()]
+    clause, params = date_filter_sql(date_from, date_to)
+    query = f"SELECT {', '.join([*RACE_KEY_COLUMNS, *selected])} FROM N_HARAI"
+    if clause:
+        query += f" WHERE {clause}"
+    wide = pd.read_sql_query(query, conn, params=params)
+
+    parts: List[pd.DataFrame] = []
+    for name, pairs in columns.items():
+        for selection_column, pay_column in pairs:
+            part = wide[RACE_KEY_COLUMNS].copy()
+            part["BetType"] = name
+            part["Selection"] = normalize_selection(wide[selection_column], name)
+            part["Pay"] = pd.to_numeric(wide[pay_column], errors="coerce")
+            parts.append(part[part["Selection"].notna() & (part["Pay"] > 0)])
+
+    payouts = (
+        pd.concat(parts, ignore_index=True)
+        if parts
+        else pd.DataFrame(columns=[*RACE_KEY_COLUMNS, "BetType", "Selection", "Pay"])
+    )
+    # 同着 can list the same selection twice for one race; keep one row per ticket.
+    payouts = payouts.drop_duplicates(subset=[*RACE_KEY_COLUMNS, "BetType", "Selection"])
+
+    refund_parts: List[pd.DataFrame] = []
+    for kind, numbered in flags.items():
+        for number, column in numbered.items():
+            part = wide.loc[pd.to_numeric(wide[column], errors="coerce") == 1, RACE_KEY_COLUMNS].astype(str)
+            part["Kind"] = kind
+            part["Number"] = number
+            refund_parts.append(part)
+    refunds = pd.concat(refund_parts, ignore_index=True) if refund_parts else pd.DataFrame(columns=REFUND_COLUMNS)
+    return PayoutTable(
+        payouts=payouts,
+        races=wide[RACE_KEY_COLUMNS].drop_duplicates().reset_index(drop=True),
+        available=tuple(columns),
+        refunds=refunds,
+    )
+
+
+def _refunded(tickets: pd.DataFrame, keys: pd.DataFrame, canonical: pd.Series, refunds: pd.DataFrame) -> np.ndarray:
+    """True for tickets whose stake is refunded (返還 / 不成立)."""
+    refunded = np.zeros(len(tickets), dtype=bool)
+    if refunds.empty:
+        return refunded
+    flagged_index = pd.MultiIndex.from_frame(refunds[REFUND_COLUMNS].astype({"Number": int}))
+    bet_type = tickets["BetType"].astype(str).to_numpy()
+    valid = canonical.notna().to_numpy()
+    for name in pd.unique(bet_type):
+        spec = BET_TYPES.get(name)
+        rows = np.flatnonzero((bet_type == name) & valid)
+        if spec is None or not len(rows):
+            continue
+        race_keys = [keys[column].to_numpy()[rows] for column in RACE_KEY_COLUMNS]
+
+        def flagged(kind: str, numbers: np.ndarray) -> np.ndarray:
+            lookup = pd.MultiIndex.from_arrays([*race_keys, np.full(len(rows), kind), numbers])
+            return lookup.isin(flagged_index)
+
+        text = canonical.to_numpy()[rows].astype(str)
+        legs = [
+            np.array([int(value[leg * spec.width : (leg + 1) * spec.width]) for value in text])
+            for leg in range(spec.legs)
+        ]
+        hit = flagged("void", np.full(len(rows), spec.code))
+        if spec.width == 1:  # bracket numbers: a bracket without runners, or a pair within one bracket
+            same = legs[0] == legs[1]
+            hit |= same & flagged("dowaku", legs[0])
+            hit |= ~same & (flagged("waku", legs[0]) | flagged("waku", legs[1]))
+        else:
+            for numbers in legs:
+                hit |= flagged("uma", numbers)
+        refunded[rows] = hit
+    return refunded
+
+
+def settle(selections: pd.DataFrame, table: PayoutTable, stake_column: str = "Stake") -> pd.DataFrame:
+    """Add Settled / Hit / Refund / Return columns to a ticket frame.
+
+    `selections` needs RACE_KEY_COLUMNS, BetType, Selection and `stake_column`.
+    Settled is False when the race has no payout record yet (not run, or
+    N_HARAI not imported) or N_HARAI has no columns for the ticket's bet type;
+    such tickets return 0 and should be excluded from ROI. Refunded tickets
+    return their stake.
+    """
+    settled = selections.copy()
+    keys = settled[RACE_KEY_COLUMNS].astype(str)
+    canonical = pd.Series(pd.NA, index=settled.index, dtype="string")
+    for name in settled["BetType"].unique():
+        mask = settled["BetType"] == name
+        canonical[mask] = normalize_selection(settled.loc[mask, "Selection"], name)
+
+    lookup = pd.MultiIndex.from_arrays(
+        [*(keys[c] for c in RACE_KEY_COLUMNS), settled["BetType"].astype(str), canonical.fillna("")]
+    )
+    pay = table.payouts["Pay"].reindex(lookup).to_numpy(dtype=np.float64, na_value=np.nan)
+    race_index = pd.MultiIndex.from_frame(table.races[RACE_KEY_COLUMNS].astype(str))
+    settled_mask = pd.MultiIndex.from_frame(keys).isin(race_index) & settled["BetType"].isin(table.available).to_numpy()
+
+    stake = pd.to_numeric(settled[stake_column], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+    hit = ~np.isnan(pay) & settled_mask
+    refund = _refunded(settled, keys, canonical, table.refunds) & settled_mask & ~hit
+    settled["Settled"] = settled_mask
+    settled["Hit"] = hit.astype(int)
+    settled["Refund"] = refund.astype(int)
+    settled["Return"] = np.where(hit, np.nan_to_num(pay) * stake / 100.0, np.where(refund, stake, 0.0))
+    return settled
+
+
+def settle_entries(
+    entries: pd.DataFrame,
+    table: PayoutTable,
+    stake: float,
+    bet_types: Iterable[str] = ("win", "place"),
+) -> pd.DataFrame:
+    """One single-horse ticket per entry and bet type; adds <Type>Return / <Type>Hit / <Type>Refund and PayoutSettled.
+
+    Bet types without payout columns in N_HARAI get no columns at all, rather
+    than a return of 0.
+    """
+    result = entries.copy()
+    settled_any = np.zeros(len(entries), dtype=bool)
+    for name in [name for name in bet_types if name in table.available]:
+        tickets = entries[RACE_KEY_COLUMNS].copy()
+        tickets["BetType"] = name
+        tickets["Selection"] = entries["Umaban"].astype(str)
+        tickets["Stake"] = stake
+        settled = settle(tickets, table)
+        label = name.capitalize()
+        result[f"{label}Return"] = settled["Return"].to_numpy()
+        result[f"{label}Hit"] = settled["Hit"].to_numpy()
+        result[f"{label}Refund"] = settled["Refund"].to_numpy()
+        settled_any |= settled["Settled"].to_numpy()
+    result["PayoutSettled"] = settled_any
+    return result
+
+
+def load_payouts_for(
+    ecore_db: Path,
+    date_from: Optional[str],
+    date_to: Optional[str],
+    bet_types: Optional[Iterable[str]] = None,
+) -> Optional[PayoutTable]:
+    """load_payouts on a read-only ecore.db.
+
+    None when N_HARAI is missing or has no payout columns for any requested
+    bet type, so callers fall back to odds x stake.
+    """
+    wanted = list(bet_types) if bet_types is not None else list(BET_TYPES)
+    conn = connect_db(ecore_db, read_only=True)
+    try:
+        if not payout_columns(harai_columns(conn), wanted):
+            return None
+        return load_payouts(conn, date_from, date_to, wanted)
+    finally:
+        conn.close()
+
+
+def summarize_returns(
+    frame: pd.DataFrame,
+    stake: float,
+    bet_types: Iterable[str] = ("win", "place"),
+) -> Dict[str, Dict[str, Optional[float]]]:
+    """Bets / hits / refunds / stake / return / ROI per bet type over settled rows of `settle_entries` output."""
+    settled = frame[frame["PayoutSettled"]]
+    summary: Dict[str, Dict[str, Optional[float]]] = {}
+    for name in bet_types:
+        label = name.capitalize()
+        if f"{label}Return" not in settled.columns:
+            continue
+        bets = len(settled)
+        total_stake = stake * bets
+        total_return = float(settled[f"{label}Return"].sum())
+        summary[name] = {
+            "bets": bets,
+            "hits": int(settled[f"{label}Hit"].sum()),
+            "refunds": int(settled[f"{label}Refund"].sum()),
+            "stake": total_stake,
+            "return": total_return,
+            "roi": (total_return - total_stake) / total_stake if total_stake > 0 else None,
+        }
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Flat-stake ROI of every starter, settled with N_HARAI payouts.")
+    parser.add_argument("--ecore", type=Path, default=Path("envs/cursor/my_keiba/ecore.db"))
+    parser.add_argument("--date-from", required=True, help="Start date YYYY-MM-DD")
+    parser.add_argument("--date-to", required=True, help="End date YYYY-MM-DD")
+    parser.add_argument("--stake", type=float, default=100.0)
+    args = parser.parse_args()
+
+    table = load_payouts_for(args.ecore, args.date_from, args.date_to, ["win", "place"])
+    if table is None:
+        print("[WARN] N_HARAI (with win/place payout columns) not found in ecore.db.")
+        return
+    clause, params = date_filter_sql(args.date_from, args.date_to)
+    conn = connect_db(args.ecore, read_only=True)
+    try:
+        entries = pd.read_sql_query(
+            f"SELECT Year, MonthDay, JyoCD, RaceNum, Umaban FROM N_UMA_RACE WHERE {clause}", conn, params=params
+        )
+    finally:
+        conn.close()
+
+    summary = summarize_returns(settle_entries(entries, table, args.stake), args.stake)
+    print(f"=== Flat-stake ROI {args.date_from} -> {args.date_to} ({len(table.races)} settled race(s)) ===")
+    for name, row in summary.items():
+        roi = "-" if row["roi"] is None else f"{row['roi']:.3f}"
+        print(f"{name:6s} bets={row['bets']:>8} hits={row['hits']:>7} refunds={row['refunds']:>5} stake={row['stake']:>12,.0f} return={row['return']:>12,.0f} roi={roi}")
+
+
+if __name__ == "__main__":
+    main()
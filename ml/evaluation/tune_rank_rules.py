@@ -0,0 +1,418 @@
+"""Grid-search rank-rule thresholds against stored predictions and results.
+
+Predictions (predictions.db), finishing positions and official win payouts
+(ecore.db N_RACE / N_HARAI; odds x stake when N_HARAI is absent) and the mark
+columns the rules reference (ZM_VALUE / ZI_INDEX from the feature pipeline)
+are loaded once into NumPy arrays. Every threshold of every swept condition
+is turned into a bit-packed row mask, so a candidate rule is just the AND of
+a few packed rows plus a popcount. Thousands of candidates per grade are
+scored in seconds, optionally split across worker processes.
+
+Grades are tuned greedily in rule order: the best S rule claims its rows,
+then A is tuned on what is left, and so on. This is the same first-match-wins
+order `assign_rank_grades` applies. By default each grade sweeps the
+conditions it already has; `--keys` sweeps additional conditions for every grade.
+
+Example:
+    python -m ml.evaluation.tune_rank_rules \
+        --date-from 2025-01-01 --date-to 2025-09-30 --scenario PRE \
+        --output-json ml/config/rank_rules.tuned.json
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ml.evaluation.evaluate_predictions import EvalConfig, attach_payouts, attach_results, read_predictions
+from ml.features.build_features import FeatureConfig, build_feature_frame
+from ml.features.feature_store import FeatureStore
+from ml.rank_engine import (
+    CONDITION_DISPATCH,
+    GRADE_ORDER,
+    RankRule,
+    assign_rank_grades,
+    load_merged_rank_config,
+    load_rank_config,
+    numeric_column,
+)
+
+# Threshold grid per condition key. Values outside the data range simply
+# reproduce "no condition", so the grids need not be tight.
+DEFAULT_GRID: Dict[str, List[float]] = {
+    "min_win_score": [round(v, 2) for v in np.arange(0.20, 0.92, 0.02)],
+    "max_win_score": [0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
+    "min_m5": [1.0, 1.5, 2.0, 2.5, 3.0],
+    "max_m5": [1.0, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0],
+    "min_zm": [40.0, 45.0, 48.0, 50.0, 52.0, 55.0, 58.0, 60.0, 65.0],
+    "max_zm": [50.0, 60.0, 70.0, 80.0],
+    "min_zi": [40.0, 45.0, 50.0, 52.0, 55.0, 58.0, 60.0, 65.0],
+    "max_zi": [50.0, 60.0, 70.0, 80.0],
+    "min_trainer_win": [0.0, 0.05, 0.08, 0.10, 0.12, 0.15, 0.20],
+    "max_trainer_win": [0.10, 0.15, 0.20, 0.30],
+    "min_odds": [1.5, 2.0, 3.0, 5.0, 8.0],
+    "max_odds": [3.0, 4.0, 6.0, 8.0, 12.0, 20.0, 50.0],
+}
+
+# Predictions column -> rule column (CONDITION_DISPATCH names the feature columns).
+PREDICTION_RENAMES = {"Odds": "PreTanOdds", "TrainerScore": "TrainerWinRate"}
+MARK_COLUMNS = ("ZM_VALUE", "ZI_INDEX")
+RACE_KEYS = ["Year", "MonthDay", "JyoCD", "RaceNum", "Umaban"]
+# Upper bound for the (candidates, packed bytes) temporaries of one evaluation block.
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class TuneConfig:
+    predictions_db: Path
+    ecore_db: Path
+    excel_db: Optional[Path]
+    feature_store: Optional[Path]
+    scenario: str
+    date_from: str
+    date_to: str
+    model_version: Optional[str] = None
+    rank_rules_path: Optional[Path] = None
+    grid_path: Optional[Path] = None
+    extra_keys: List[str] = field(default_factory=list)
+    stake: float = 100.0
+    min_bets: int = 30
+    objective: str = "roi"  # roi | profit
+    workers: int = 1
+    output_json: Optional[Path] = None
+
+
+def load_tuning_frame(cfg: TuneConfig, need_marks: bool = True) -> pd.DataFrame:
+    """Predictions for the span joined with results and (optionally) mark columns."""
+    eval_cfg = EvalConfig(
+        predictions_db=cfg.predictions_db,
+        ecore_db=cfg.ecore_db,
+        scenario=cfg.scenario,
+        date_from=cfg.date_from,
+        date_to=cfg.date_to,
+        stake=cfg.stake,
+    )
+    preds = read_predictions(eval_cfg)
+    if preds.empty:
+        return preds
+
+    version = cfg.model_version or preds["ModelVersion"].max()
+    preds = preds[preds["ModelVersion"] == version].copy()
+    frame = attach_payouts(attach_results(preds, eval_cfg), eval_cfg).rename(columns=PREDICTION_RENAMES)
+
+    if need_marks:
+        frame = frame.merge(_load_marks(cfg), how="left", on=RACE_KEYS)
+    return frame
+
+
+def _load_marks(cfg: TuneConfig) -> pd.DataFrame:
+    if cfg.feature_store:
+        features = FeatureStore(cfg.feature_store).load(cfg.date_from, cfg.date_to)
+    else:
+        excel_db = cfg.excel_db if cfg.excel_db and cfg.excel_db.exists() else None
+        features = build_feature_frame(
+            FeatureConfig(
+                ecore_db=cfg.ecore_db,
+                excel_db=excel_db,
+                output_path=None,
+                date_from=cfg.date_from,
+                date_to=cfg.date_to,
+                read_only=True,
+            )
+        )
+    if features.empty:
+        return pd.DataFrame(columns=[*RACE_KEYS, *MARK_COLUMNS])
+    marks = features[[*RACE_KEYS, *[c for c in MARK_COLUMNS if c in features.columns]]].copy()
+    for column in RACE_KEYS:
+        marks[column] = marks[column].astype(str)
+    marks["Umaban"] = marks["Umaban"].str.lstrip("0")
+    return marks.drop_duplicates(subset=RACE_KEYS)
+
+
+def win_returns(frame: pd.DataFrame, stake: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-row win return for `stake` and the mask of settled rows.
+
+    Uses the N_HARAI payouts from `attach_payouts` (attached for the same
+    stake) when present; otherwise odds x stake on rows with a known finish.
+    """
+    if "WinReturn" in frame.columns:
+        return frame["WinReturn"].to_numpy(dtype=np.float64), frame["PayoutSettled"].to_numpy(dtype=bool)
+    finish = pd.to_numeric(frame["Finish"], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    odds = pd.to_numeric(frame["PreTanOdds"], errors="coerce").fillna(0.0).clip(lower=0.0).to_numpy(dtype=np.float64)
+    return np.where(finish == 1, odds * stake, 0.0), ~np.isnan(finish)
+
+
+# Set bits per byte value, for NumPy < 2.0 which has no np.bitwise_count.
+_BYTE_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1, dtype=np.uint8)
+
+
+def _popcount(packed: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(packed).sum(axis=-1, dtype=np.int64)
+    return _BYTE_POPCOUNT[packed].sum(axis=-1, dtype=np.int64)
+
+
+def _byte_return_table(winner_returns: np.ndarray) -> np.ndarray:
+    """(packed bytes, 256) table: total return of the winners set in each byte value.
+
+    Summing table[j, byte_j] over a packed winner mask gives the candidate's
+    return without unpacking it.
+    """
+    padded = np.zeros(-(-len(winner_returns) // 8) * 8, dtype=np.float64)
+    padded[: len(winner_returns)] = winner_returns
+    bits = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(np.float64)
+    return padded.reshape(-1, 8) @ bits.T
+
+
+# Worker-side state; set once per process by `_init_worker`.
+_STATE: Dict[str, object] = {}
+
+
+def _init_worker(packed: List[np.ndarray], packed_winners: List[np.ndarray], return_table: np.ndarray) -> None:
+    _STATE["packed"] = packed
+    _STATE["packed_winners"] = packed_winners
+    _STATE["return_table"] = return_table
+
+
+def _combine(masks: List[np.ndarray], prefix_index: np.ndarray) -> np.ndarray:
+    """AND the prefix keys' masks, then expand by every threshold of the last key.
+
+    Rows come out in `itertools.product` order (last key varies fastest).
+    """
+    last = masks[-1]
+    if len(masks) == 1:
+        return last
+    prefix = masks[0][prefix_index[:, 0]]
+    for position in range(1, len(masks) - 1):
+        prefix = prefix & masks[position][prefix_index[:, position]]
+    return (prefix[:, None, :] & last[None, :, :]).reshape(-1, last.shape[1])
+
+
+def _evaluate_block(prefix_index: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(bets, hits, returns) for all candidates sharing a block of prefix thresholds."""
+    packed: List[np.ndarray] = _STATE["packed"]  # type: ignore[assignment]
+    packed_winners: List[np.ndarray] = _STATE["packed_winners"]  # type: ignore[assignment]
+    return_table: np.ndarray = _STATE["return_table"]  # type: ignore[assignment]
+
+    rows = _combine(packed, prefix_index)
+    winners = _combine(packed_winners, prefix_index)
+    offsets = np.arange(winners.shape[1], dtype=np.intp) * 256
+    returns = np.take(return_table.ravel(), winners.astype(np.intp) + offsets).sum(axis=1)
+    return _popcount(rows), _popcount(winners), returns
+
+
+def evaluate_candidates(
+    columns: Dict[str, np.ndarray],
+    returns: np.ndarray,
+    eligible: np.ndarray,
+    grid: Dict[str, Sequence[float]],
+    workers: int = 1,
+) -> pd.DataFrame:
+    """Score every combination of `grid` thresholds on the eligible rows.
+
+    Returns one row per candidate with its thresholds, bets, hits and total
+    return. Rows with NaN in a swept column fail that condition, as in
+    `RankRule.mask`.
+    """
+    keys = list(grid)
+    thresholds = [np.asarray(grid[key], dtype=np.float64) for key in keys]
+    winners = eligible & (returns > 0)
+    packed: List[np.ndarray] = []
+    packed_winners: List[np.ndarray] = []
+    for key, values in zip(keys, thresholds):
+        column, comparator = CONDITION_DISPATCH[key]
+        packed.append(np.packbits(comparator(columns[column][eligible][None, :], values[:, None]), axis=1))
+        packed_winners.append(np.packbits(comparator(columns[column][winners][None, :], values[:, None]), axis=1))
+    return_table = _byte_return_table(returns[winners])
+
+    prefixes = list(itertools.product(*(range(len(values)) for values in thresholds[:-1])))
+    prefix_index = np.array(prefixes, dtype=np.int64).reshape(len(prefixes), len(keys) - 1)
+    row_bytes = len(thresholds[-1]) * max(packed[0].shape[1], 1)
+    block_size = max(1, BLOCK_BYTES // row_bytes)
+    blocks = [prefix_index[start : start + block_size] for start in range(0, len(prefix_index), block_size)]
+    if workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(packed, packed_winners, return_table),
+        ) as pool:
+            results = list(pool.map(_evaluate_block, blocks))
+    else:
+        _init_worker(packed, packed_winners, return_table)
+        results = [_evaluate_block(block) for block in blocks]
+
+    index = np.array(list(itertools.product(*(range(len(values)) for values in thresholds))), dtype=np.int64)
+    candidates = pd.DataFrame({key: values[index[:, position]] for position, (key, values) in enumerate(zip(keys, thresholds))})
+    candidates["bets"] = np.concatenate([r[0] for r in results])
+    candidates["hits"] = np.concatenate([r[1] for r in results])
+    candidates["returns"] = np.concatenate([r[2] for r in results])
+    return candidates
+
+
+def _score(candidates: pd.DataFrame, stake: float) -> pd.DataFrame:
+    stakes = candidates["bets"] * stake
+    candidates["profit"] = candidates["returns"] - stakes
+    candidates["roi"] = np.where(stakes > 0, candidates["profit"] / stakes.where(stakes > 0, 1.0), np.nan)
+    candidates["hit_rate"] = np.where(candidates["bets"] > 0, candidates["hits"] / candidates["bets"].clip(lower=1), np.nan)
+    return candidates
+
+
+def grade_metrics(grades: np.ndarray, returns: np.ndarray, settled: np.ndarray, stake: float) -> pd.DataFrame:
+    """Bets / hits / hit rate / ROI per grade over the settled rows of a grade array."""
+    summary = pd.DataFrame({"RankGrade": grades[settled], "hit": returns[settled] > 0, "returns": returns[settled]})
+    grouped = summary.groupby("RankGrade").agg(bets=("hit", "size"), hits=("hit", "sum"), returns=("returns", "sum"))
+    return _score(grouped.reset_index(), stake)
+
+
+def tune_rules(
+    frame: pd.DataFrame,
+    rules: List[RankRule],
+    grid: Dict[str, List[float]],
+    extra_keys: Sequence[str],
+    stake: float,
+    min_bets: int,
+    objective: str = "roi",
+    workers: int = 1,
+) -> List[RankRule]:
+    """Greedy per-grade search in rule order; returns the tuned rules."""
+    returns, settled = win_returns(frame, stake)
+    columns = {column: numeric_column(frame, column) for column, _ in CONDITION_DISPATCH.values() if column in frame.columns}
+    claimed = np.zeros(len(frame), dtype=bool)
+
+    tuned: List[RankRule] = []
+    for rule in rules:
+        keys = [key for key in dict.fromkeys([*rule.conditions, *extra_keys]) if key in grid]
+        keys = [key for key in keys if CONDITION_DISPATCH[key][0] in columns]
+        fixed = {key: value for key, value in rule.conditions.items() if key not in keys}
+        eligible = settled & ~claimed
+        for key, threshold in fixed.items():
+            column, comparator = CONDITION_DISPATCH[key]
+            eligible &= comparator(columns[column], threshold) if column in columns else False
+
+        best = dict(rule.conditions)
+        if keys and eligible.any():
+            candidates = _score(evaluate_candidates(columns, returns, eligible, {k: grid[k] for k in keys}, workers), stake)
+            candidates = candidates[candidates["bets"] >= min_bets]
+            if not candidates.empty:
+                top = candidates.sort_values([objective, "hits"], ascending=False).iloc[0]
+                best = {**fixed, **{key: float(top[key]) for key in keys}}
+                print(
+                    f"[INFO] grade {rule.grade}: {len(candidates)} feasible candidate(s); best "
+                    f"bets={int(top['bets'])} hit={top['hit_rate']:.3f} roi={top['roi']:.3f}"
+                )
+            else:
+                print(f"[WARN] grade {rule.grade}: no candidate reaches {min_bets} bets; keeping current thresholds.")
+
+        tuned_rule = RankRule(grade=rule.grade, conditions=best)
+        claimed |= tuned_rule.mask(frame)
+        tuned.append(tuned_rule)
+    return tuned
+
+
+def _load_grid(path: Optional[Path]) -> Dict[str, List[float]]:
+    grid = {key: list(values) for key, values in DEFAULT_GRID.items()}
+    if path:
+        for key, values in json.loads(path.read_text(encoding="utf-8")).items():
+            if key not in CONDITION_DISPATCH:
+                raise ValueError(f"Unknown rank condition '{key}' in grid {path}.")
+            grid[key] = [float(v) for v in values]
+    return grid
+
+
+def _print_metrics(title: str, metrics: pd.DataFrame, invest_grades: set) -> None:
+    print(f"=== {title} ===")
+    display = metrics.copy()
+    order = {grade: position for position, grade in enumerate(GRADE_ORDER)}
+    display = display.sort_values("RankGrade", key=lambda grades: grades.map(lambda g: order.get(g, len(order))))
+    display["invest"] = display["RankGrade"].isin(invest_grades).map({True: "*", False: ""})
+    print(display[["RankGrade", "invest", "bets", "hits", "hit_rate", "roi", "profit"]].to_string(index=False))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Grid-search rank-rule thresholds on stored predictions.")
+    parser.add_argument("--date-from", required=True, help="Start date YYYY-MM-DD")
+    parser.add_argument("--date-to", required=True, help="End date YYYY-MM-DD")
+    parser.add_argument("--scenario", type=str, default="PRE")
+    parser.add_argument("--pred-db", type=Path, default=Path("envs/cursor/my_keiba/predictions.db"))
+    parser.add_argument("--ecore", type=Path, default=Path("envs/cursor/my_keiba/ecore.db"))
+    parser.add_argument("--excel", type=Path, default=Path("envs/cursor/my_keiba/excel_data.db"))
+    parser.add_argument("--feature-store", type=Path, help="Read ZM/ZI from a feature store instead of rebuilding.")
+    parser.add_argument("--model-version", type=str, help="Prediction model version (default: latest in range).")
+    parser.add_argument("--rank-rules", type=Path, help="Starting rank rule JSON (default: ml/config/rank_rules.json).")
+    parser.add_argument("--grid", type=Path, help="Optional JSON {condition: [thresholds, ...]} overriding the grid.")
+    parser.add_argument("--keys", nargs="*", default=[], help="Extra condition keys to sweep for every grade.")
+    parser.add_argument("--stake", type=float, default=100.0)
+    parser.add_argument("--min-bets", type=int, default=30, help="Minimum settled bets for a candidate (default: 30)")
+    parser.add_argument("--objective", choices=["roi", "profit"], default="roi")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for candidate evaluation.")
+    parser.add_argument("--output-json", type=Path, help="Write the tuned rank rule config here.")
+    args = parser.parse_args()
+
+    unknown = [key for key in args.keys if key not in CONDITION_DISPATCH]
+    if unknown:
+        parser.error(f"unknown condition key(s): {unknown}")
+
+    cfg = TuneConfig(
+        predictions_db=args.pred_db,
+        ecore_db=args.ecore,
+        excel_db=args.excel,
+        feature_store=args.feature_store,
+        scenario=args.scenario.upper(),
+        date_from=args.date_from,
+        date_to=args.date_to,
+        model_version=args.model_version,
+        rank_rules_path=args.rank_rules,
+        grid_path=args.grid,
+        extra_keys=list(args.keys),
+        stake=args.stake,
+        min_bets=args.min_bets,
+        objective=args.objective,
+        workers=max(1, args.workers),
+        output_json=args.output_json,
+    )
+
+    rules, invest_grades, fallback_grade, rank_source = load_rank_config(cfg.scenario, cfg.rank_rules_path)
+    swept = {key for rule in rules for key in rule.conditions} | set(cfg.extra_keys)
+    need_marks = any(CONDITION_DISPATCH[key][0] in MARK_COLUMNS for key in swept)
+    frame = load_tuning_frame(cfg, need_marks=need_marks)
+    if frame.empty:
+        print("[WARN] No prediction rows found for the specified range.")
+        return
+    print(f"[INFO] {len(frame)} prediction rows, rank config source: {rank_source}")
+
+    returns, settled = win_returns(frame, cfg.stake)
+    baseline = grade_metrics(assign_rank_grades(frame, rules, fallback_grade), returns, settled, cfg.stake)
+    _print_metrics("Current rules", baseline, invest_grades)
+
+    tuned = tune_rules(
+        frame,
+        rules,
+        _load_grid(cfg.grid_path),
+        cfg.extra_keys,
+        cfg.stake,
+        cfg.min_bets,
+        cfg.objective,
+        cfg.workers,
+    )
+    result = grade_metrics(assign_rank_grades(frame, tuned, fallback_grade), returns, settled, cfg.stake)
+    _print_metrics("Tuned rules", result, invest_grades)
+
+    if cfg.output_json:
+        output, _ = load_merged_rank_config(cfg.rank_rules_path)
+        output["scenarios"].setdefault(cfg.scenario, {})["rules"] = [
+            {"grade": rule.grade, "conditions": rule.conditions} for rule in tuned
+        ]
+        cfg.output_json.parent.mkdir(parents=True, exist_ok=True)
+        cfg.output_json.write_text(json.dumps(output, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"[OK] tuned rank rules written -> {cfg.output_json}")
+
+
+if __name__ == "__main__":
+    main()
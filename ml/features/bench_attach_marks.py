@@ -0,0 +1,114 @@
+"""Benchmark the as-of mark join against the previous merge-explode-dedupe join.
+
+Generates a synthetic entry history plus HORSE_MARKS rows in memory (no SQLite),
+runs both implementations on the same input, checks they pick the same marks
+and prints wall time and peak intermediate size.
+
+Example:
+    python -m ml.features.bench_attach_marks --rows 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from ml.features.build_features import match_marks, normalize_horse_name, prepare_marks
+
+
+def make_history(rows: int, seed: int = 42) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Synthetic entries (~25 starts per horse over 5 seasons) and their marks."""
+    rng = np.random.default_rng(seed)
+    horses = max(rows // 25, 1)
+    horse_ids = rng.integers(0, horses, size=rows)
+    race_dates = pd.Timestamp("2020-01-04") + pd.to_timedelta(rng.integers(0, 5 * 365, size=rows), unit="D")
+    entries = pd.DataFrame(
+        {
+            "NormalizedHorseName": pd.Series(horse_ids).map(lambda i: f"ホース{i}"),
+            "Umaban": rng.integers(1, 19, size=rows).astype(str),
+            "RaceDate": race_dates,
+        }
+    )
+
+    # ~70% of entries get a mark 0/1/3 days before the race (3 is outside the window).
+    with_mark = rng.random(rows) < 0.7
+    offsets = rng.choice([0, 0, 1, 3], size=int(with_mark.sum()))
+    marks = pd.DataFrame(
+        {
+            "NormalizedHorseName": entries.loc[with_mark, "NormalizedHorseName"].to_numpy(),
+            "Umaban": entries.loc[with_mark, "Umaban"].str.zfill(2).to_numpy(),
+            "SourceDate": (
+                entries.loc[with_mark, "RaceDate"] - pd.to_timedelta(offsets, unit="D")
+            ).dt.strftime("%Y%m%d").to_numpy(),
+        }
+    )
+    size = len(marks)
+    marks["Mark5"] = rng.integers(1, 6, size=size).astype(str)
+    marks["Mark6"] = rng.integers(1, 6, size=size).astype(str)
+    marks["ZI_INDEX"] = rng.integers(30, 70, size=size).astype(str)
+    marks["ZM_VALUE"] = rng.integers(30, 70, size=size).astype(str)
+    marks["TRAINER_NAME"] = "T"
+    # HORSE_MARKS is unique per (SourceDate, NormalizedHorseName).
+    marks.drop_duplicates(subset=["SourceDate", "NormalizedHorseName"], inplace=True)
+    return entries, marks
+
+
+def legacy_attach(df: pd.DataFrame, marks: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+    """Previous attach_marks body: cross merge per horse, filter DaysDiff, dedupe."""
+    marks = marks.copy()
+    marks["NormalizedHorseName"] = normalize_horse_name(marks["NormalizedHorseName"])
+    marks["Umaban"] = marks["Umaban"].astype(str).str.lstrip("0")
+    marks["SourceDate_dt"] = pd.to_datetime(marks["SourceDate"], format="%Y%m%d", errors="coerce")
+    marks["Mark5"] = pd.to_numeric(marks["Mark5"], errors="coerce")
+    marks["Mark6"] = pd.to_numeric(marks["Mark6"], errors="coerce")
+
+    enriched = df.copy()
+    enriched["Umaban"] = enriched["Umaban"].astype(str).str.lstrip("0")
+    enriched["RowId"] = np.arange(len(enriched))
+
+    merged = enriched.merge(marks, how="left", on=["NormalizedHorseName", "Umaban"], suffixes=("", "_mark"))
+    intermediate_rows = len(merged)
+
+    merged["DaysDiff"] = (merged["RaceDate"] - merged["SourceDate_dt"]).dt.days
+    valid_mask = merged["DaysDiff"].between(0, 2)
+    merged.loc[~valid_mask, ["Mark5", "Mark6", "ZI_INDEX", "ZM_VALUE", "TRAINER_NAME", "SourceDate_dt"]] = np.nan
+    merged.sort_values(["RowId", "SourceDate_dt"], ascending=[True, False], inplace=True)
+    merged = merged.drop_duplicates(subset=["RowId"], keep="first")
+    merged.rename(columns={"Mark5": "M5Value", "Mark6": "M6Value", "TRAINER_NAME": "MarkTrainerName"}, inplace=True)
+    merged["MarkSourceDate"] = merged["SourceDate_dt"]
+    merged.drop(columns=["SourceDate_dt", "DaysDiff", "RowId"], inplace=True)
+    return merged.reset_index(drop=True), intermediate_rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark attach_marks join strategies.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Synthetic entry rows (default: 1,000,000)")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the as-of join.")
+    args = parser.parse_args()
+
+    entries, marks = make_history(args.rows)
+    print(f"[INFO] entries={len(entries):,} marks={len(marks):,}")
+
+    started = time.perf_counter()
+    asof = match_marks(entries, prepare_marks(marks))
+    asof_seconds = time.perf_counter() - started
+    print(f"as-of join      : {asof_seconds:8.2f}s  rows={len(asof):,}")
+
+    if args.skip_legacy:
+        return
+
+    started = time.perf_counter()
+    legacy, intermediate_rows = legacy_attach(entries, marks)
+    legacy_seconds = time.perf_counter() - started
+    print(f"merge+dedupe    : {legacy_seconds:8.2f}s  rows={len(legacy):,} intermediate={intermediate_rows:,}")
+
+    same_m5 = asof["M5Value"].astype("float64").equals(legacy["M5Value"].astype("float64"))
+    same_date = asof["MarkSourceDate"].astype("datetime64[ns]").equals(legacy["MarkSourceDate"].astype("datetime64[ns]"))
+    print(f"results match   : {same_m5 and same_date}")
+    print(f"speed-up        : {legacy_seconds / asof_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
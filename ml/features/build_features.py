@@ -7,20 +7,32 @@ This module pulls data from `ecore.db` (公式データ) と `excel_data.db`
 - レース基本情報: コース、距離、馬場、発走時刻など
 - オッズ情報: `N_ODDS_TANPUKU` の単勝オッズ/人気
 - 馬印情報: HORSE_MARKS から M5/M6、ZI、ZM 等を抽出
-- 調教師成績: 登録数、勝率、連対率、平均着順
+- 調教師成績: レース日より前の出走数、勝率、複勝率、平均着順 (as-of 結合)
 - ラベル: `WinLabel` (1着) と `PlaceLabel` (1〜3着)
 """
 from __future__ import annotations
 
 import argparse
 import sqlite3
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
+from ml.features.schema import to_arrow_table, write_feature_parquet
+from ml.features.trainer_stats import load_trainer_asof, refresh_trainer_stats
+
+TRAINER_STAT_COLUMNS = (
+    "TrainerStarts",
+    "TrainerWins",
+    "TrainerTop3",
+    "TrainerAvgFinish",
+    "TrainerWinRate",
+    "TrainerTop3Rate",
+)
+
 
 @dataclass
 class FeatureConfig:
@@ -28,6 +40,60 @@ class FeatureConfig:
     excel_db: Optional[Path] = None
     output_path: Optional[Path] = None
     target_date: Optional[str] = None  # YYYY-MM-DD
+    date_from: Optional[str] = None  # YYYY-MM-DD (target_date 指定時は無視)
+    date_to: Optional[str] = None  # YYYY-MM-DD
+    mark_lookback_days: int = 2  # 馬印 SourceDate をレース日から何日前まで許容するか
+    read_only: bool = False  # True: SQLite を読み取り専用で開き、索引作成・集計表更新を行わない
+
+    def date_range(self) -> Tuple[Optional[str], Optional[str]]:
+        """Return the inclusive (from, to) range; a single target_date wins."""
+        if self.target_date:
+            return self.target_date, self.target_date
+        return self.date_from, self.date_to
+
+
+def connect_db(path: Path, read_only: bool = False) -> sqlite3.Connection:
+    """Open a SQLite database, optionally through a read-only URI."""
+    if read_only:
+        return sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    return sqlite3.connect(path)
+
+
+def date_filter_sql(
+    date_from: Optional[str],
+    date_to: Optional[str],
+    alias: str = "",
+) -> Tuple[str, List[str]]:
+    """Build an index-friendly Year/MonthDay predicate for an inclusive date range.
+
+    Returns an empty clause when neither bound is given. Dates are YYYY-MM-DD.
+    """
+    prefix = f"{alias}." if alias else ""
+    year_col = f"{prefix}Year"
+    mmdd_col = f"{prefix}MonthDay"
+
+    def _split(value: str) -> Tuple[str, str]:
+        year, month, day = value.split("-")
+        return year, f"{month}{day}"
+
+    if date_from and date_to:
+        y_from, md_from = _split(date_from)
+        y_to, md_to = _split(date_to)
+        if (y_from, md_from) == (y_to, md_to):
+            return f"{year_col} = ? AND {mmdd_col} = ?", [y_from, md_from]
+        if y_from == y_to:
+            return f"{year_col} = ? AND {mmdd_col} BETWEEN ? AND ?", [y_from, md_from, md_to]
+        return (
+            f"{year_col} BETWEEN ? AND ? AND ({year_col} || {mmdd_col}) BETWEEN ? AND ?",
+            [y_from, y_to, y_from + md_from, y_to + md_to],
+        )
+    if date_from:
+        y_from, md_from = _split(date_from)
+        return f"{year_col} >= ? AND ({year_col} || {mmdd_col}) >= ?", [y_from, y_from + md_from]
+    if date_to:
+        y_to, md_to = _split(date_to)
+        return f"{year_col} <= ? AND ({year_col} || {mmdd_col}) <= ?", [y_to, y_to + md_to]
+    return "", []
 
 
 def normalize_horse_name(series: pd.Series) -> pd.Series:
@@ -35,8 +101,15 @@ def normalize_horse_name(series: pd.Series) -> pd.Series:
     return series.fillna("").astype(str).str.replace(r"\s+", "", regex=True)
 
 
-def load_base_frame(conn: sqlite3.Connection, config: FeatureConfig) -> pd.DataFrame:
-    """Pull core race-entry rows from N_UMA_RACE + N_RACE."""
+def has_race_keys(conn: sqlite3.Connection) -> bool:
+    """True when `python -m ml.db.optimize_ecore` has created ML_RACE_KEYS."""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ML_RACE_KEYS'"
+    ).fetchone()
+    return row is not None
+
+
+def _base_query(config: FeatureConfig, use_race_keys: bool = False) -> Tuple[str, List[str]]:
     query = """
         SELECT
             U.Year,
@@ -65,31 +138,73 @@ def load_base_frame(conn: sqlite3.Connection, config: FeatureConfig) -> pd.DataF
          AND U.MonthDay = R.MonthDay
          AND U.JyoCD = R.JyoCD
          AND U.RaceNum = R.RaceNum
-        WHERE 1 = 1
     """
-    params: tuple = ()
-    if config.target_date:
-        year, month, day = config.target_date.split("-")
-        mmdd = f"{month}{day}"
-        query += " AND U.Year = ? AND U.MonthDay = ?"
-        params = (year, mmdd)
-
-    df = pd.read_sql_query(query, conn, params=params)
+    if use_race_keys:
+        # LEFT JOIN: races imported after the last optimize run fall back to pandas derivation.
+        query = query.replace(
+            "R.HassoTime\n",
+            "R.HassoTime,\n            K.RaceKey,\n            K.RaceDate AS RaceDateISO\n",
+        )
+        query += """
+        LEFT JOIN ML_RACE_KEYS K
+          ON U.Year = K.Year
+         AND U.MonthDay = K.MonthDay
+         AND U.JyoCD = K.JyoCD
+         AND U.RaceNum = K.RaceNum
+    """
+    query += " WHERE 1 = 1"
+    clause, params = date_filter_sql(*config.date_range(), alias="U")
+    if clause:
+        query += f" AND {clause}"
+    return query, params
+
+
+def load_base_frame(conn: sqlite3.Connection, config: FeatureConfig) -> pd.DataFrame:
+    """Pull core race-entry rows from N_UMA_RACE + N_RACE."""
+    query, params = _base_query(config, has_race_keys(conn))
+    return finalize_base_frame(pd.read_sql_query(query, conn, params=params))
+
+
+def iter_base_frames(
+    conn: sqlite3.Connection,
+    config: FeatureConfig,
+    chunk_size: int,
+) -> Iterator[pd.DataFrame]:
+    """Yield base rows in race-date order, `chunk_size` rows at a time."""
+    query, params = _base_query(config, has_race_keys(conn))
+    query += " ORDER BY U.Year, U.MonthDay, U.JyoCD, U.RaceNum, U.Umaban"
+    for chunk in pd.read_sql_query(query, conn, params=params, chunksize=chunk_size):
+        yield finalize_base_frame(chunk)
+
+
+def finalize_base_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Derive keys, dates, normalised names and labels for raw base rows."""
     if df.empty:
         return df
 
     df["Umaban"] = df["Umaban"].astype(str).str.lstrip("0")
-    df["RaceKey"] = (
-        df["Year"].astype(str)
-        + df["MonthDay"].astype(str).str.zfill(4)
-        + df["JyoCD"].astype(str).str.zfill(2)
-        + df["RaceNum"].astype(str).str.zfill(2)
-    )
-    df["RaceDate"] = pd.to_datetime(
-        df["Year"].astype(str) + df["MonthDay"].astype(str).str.zfill(4),
-        format="%Y%m%d",
-        errors="coerce",
-    )
+    if "RaceKey" in df.columns:
+        # Persisted by ML_RACE_KEYS; only races missing from the lookup are derived below.
+        race_date = pd.to_datetime(df.pop("RaceDateISO"), format="%Y-%m-%d", errors="coerce")
+        missing = df["RaceKey"].isna()
+    else:
+        race_date = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+        df["RaceKey"] = None
+        missing = pd.Series(True, index=df.index)
+    if missing.any():
+        todo = df.loc[missing]
+        df.loc[missing, "RaceKey"] = (
+            todo["Year"].astype(str)
+            + todo["MonthDay"].astype(str).str.zfill(4)
+            + todo["JyoCD"].astype(str).str.zfill(2)
+            + todo["RaceNum"].astype(str).str.zfill(2)
+        )
+        race_date.loc[missing] = pd.to_datetime(
+            todo["Year"].astype(str) + todo["MonthDay"].astype(str).str.zfill(4),
+            format="%Y%m%d",
+            errors="coerce",
+        )
+    df["RaceDate"] = race_date
     df["NormalizedHorseName"] = normalize_horse_name(df["Bamei"])
 
     # ラベル: 1着 -> WinLabel, 1〜3着 -> PlaceLabel
@@ -108,12 +223,9 @@ def load_odds_frame(conn: sqlite3.Connection, config: FeatureConfig) -> pd.DataF
         SELECT Year, MonthDay, JyoCD, RaceNum, Umaban, TanOdds, TanNinki
         FROM N_ODDS_TANPUKU
     """
-    params: tuple = ()
-    if config.target_date:
-        year, month, day = config.target_date.split("-")
-        mmdd = f"{month}{day}"
-        query += " WHERE Year = ? AND MonthDay = ?"
-        params = (year, mmdd)
+    clause, params = date_filter_sql(*config.date_range())
+    if clause:
+        query += f" WHERE {clause}"
     odds = pd.read_sql_query(query, conn, params=params)
     if odds.empty:
         return odds
@@ -127,128 +239,244 @@ def load_odds_frame(conn: sqlite3.Connection, config: FeatureConfig) -> pd.DataF
     return odds
 
 
-def load_trainer_stats(conn: sqlite3.Connection) -> pd.DataFrame:
-    """Aggregate trainer performance statistics from historical data."""
-    query = """
-        SELECT
-            ChokyosiCode,
-            COUNT(*) AS TrainerStarts,
-            SUM(CASE WHEN KakuteiJyuni = '01' THEN 1 ELSE 0 END) AS TrainerWins,
-            SUM(CASE WHEN KakuteiJyuni IN ('01','02','03') THEN 1 ELSE 0 END) AS TrainerTop3,
-            AVG(
-                CASE
-                    WHEN KakuteiJyuni GLOB '[0-9][0-9]' THEN CAST(KakuteiJyuni AS INTEGER)
-                    ELSE NULL
-                END
-            ) AS TrainerAvgFinish
-        FROM N_UMA_RACE
-        WHERE IFNULL(ChokyosiCode,'') <> ''
-        GROUP BY ChokyosiCode
+ODDS_KEYS = ["Year", "MonthDay", "JyoCD", "RaceNum", "Umaban"]
+ODDS_COLUMNS = ("PreTanOdds", "PreTanPopularity")
+
+
+def attach_odds(df: pd.DataFrame, odds: pd.DataFrame) -> pd.DataFrame:
+    """Attach (or replace) 単勝オッズ/人気 columns, keeping row order and count."""
+    enriched = df.copy()
+    if odds.empty:
+        for column in ODDS_COLUMNS:
+            enriched[column] = np.nan
+        return enriched
+
+    left_keys = enriched[ODDS_KEYS].astype(str)
+    right = odds.astype({key: str for key in ODDS_KEYS}).drop_duplicates(subset=ODDS_KEYS, keep="last")
+    matched = left_keys.merge(right, how="left", on=ODDS_KEYS)
+    for column in ODDS_COLUMNS:
+        enriched[column] = pd.to_numeric(matched[column], errors="coerce").to_numpy()
+    return enriched
+
+
+def load_trainer_stats(
+    conn: sqlite3.Connection,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    refresh: bool = True,
+) -> pd.DataFrame:
+    """Load point-in-time trainer statistics (see `ml.features.trainer_stats`).
+
+    Rows carry cumulative totals through `StatsDate`; `attach_trainer_stats`
+    joins each entry to the latest row before its race date.
     """
-    stats = pd.read_sql_query(query, conn)
-    if stats.empty:
-        return stats
-    stats["TrainerWinRate"] = stats["TrainerWins"] / stats["TrainerStarts"].replace(0, np.nan)
-    stats["TrainerTop3Rate"] = stats["TrainerTop3"] / stats["TrainerStarts"].replace(0, np.nan)
-    return stats
+    if refresh:
+        refresh_trainer_stats(conn)
+    return load_trainer_asof(conn, date_from, date_to)
 
 
-def attach_marks(df: pd.DataFrame, config: FeatureConfig) -> pd.DataFrame:
-    """Attach horse mark (M5/M6) information from excel_data.db."""
-    if config.excel_db is None or not config.excel_db.exists() or df.empty:
-        df["M5Value"] = pd.NA
-        df["M6Value"] = pd.NA
-        df["ZI_INDEX"] = pd.NA
-        df["ZM_VALUE"] = pd.NA
-        df["MarkSourceDate"] = pd.NaT
-        df["MarkTrainerName"] = pd.NA
-        return df
+def attach_trainer_stats(df: pd.DataFrame, trainer_stats: pd.DataFrame) -> pd.DataFrame:
+    """As-of join: each entry only sees trainer results from earlier race dates."""
+    stat_columns = [c for c in trainer_stats.columns if c not in ("ChokyosiCode", "StatsDate")]
+    enriched = df.copy()
+    if trainer_stats.empty:
+        for column in TRAINER_STAT_COLUMNS:
+            enriched[column] = np.nan
+        return enriched
 
-    with sqlite3.connect(config.excel_db) as excel_conn:
-        marks = pd.read_sql_query(
-            """
-            SELECT
-                NormalizedHorseName,
-                Umaban,
-                SourceDate,
-                Mark5,
-                Mark6,
-                ZI_INDEX,
-                ZM_VALUE,
-                TRAINER_NAME
-            FROM HORSE_MARKS
-            """,
-            excel_conn,
-        )
+    enriched["RowId"] = np.arange(len(enriched))
+    enriched["RaceDate"] = enriched["RaceDate"].astype("datetime64[ns]")
+    has_date = enriched["RaceDate"].notna()
+    right = trainer_stats.copy()
+    right["StatsDate"] = right["StatsDate"].astype("datetime64[ns]")
+    right.sort_values("StatsDate", inplace=True, kind="stable")
+
+    matched = pd.merge_asof(
+        enriched[has_date].sort_values("RaceDate", kind="stable"),
+        right,
+        left_on="RaceDate",
+        right_on="StatsDate",
+        by="ChokyosiCode",
+        direction="backward",
+        allow_exact_matches=False,
+    )
+    unmatched = enriched[~has_date].reindex(columns=matched.columns)
+    merged = pd.concat([matched, unmatched], ignore_index=True) if len(unmatched) else matched
+    merged.sort_values("RowId", inplace=True, kind="stable")
+    merged.drop(columns=["RowId", "StatsDate"], inplace=True)
+    merged.reset_index(drop=True, inplace=True)
+    return merged[[*df.columns, *stat_columns]]
+
+
+def _empty_marks(df: pd.DataFrame) -> pd.DataFrame:
+    df["M5Value"] = pd.NA
+    df["M6Value"] = pd.NA
+    df["ZI_INDEX"] = pd.NA
+    df["ZM_VALUE"] = pd.NA
+    df["MarkSourceDate"] = pd.NaT
+    df["MarkTrainerName"] = pd.NA
+    return df
 
-    if marks.empty:
-        df["M5Value"] = pd.NA
-        df["M6Value"] = pd.NA
-        df["ZI_INDEX"] = pd.NA
-        df["ZM_VALUE"] = pd.NA
-        df["MarkSourceDate"] = pd.NaT
-        df["MarkTrainerName"] = pd.NA
-        return df
 
+MARK_VALUE_COLUMNS = ("M5Value", "M6Value", "ZI_INDEX", "ZM_VALUE", "MarkTrainerName", "MarkSourceDate")
+
+
+def prepare_marks(marks: pd.DataFrame) -> pd.DataFrame:
+    """Normalise raw HORSE_MARKS rows into as-of join input."""
+    marks = marks.copy()
     marks["NormalizedHorseName"] = normalize_horse_name(marks["NormalizedHorseName"])
     marks["Umaban"] = marks["Umaban"].astype(str).str.lstrip("0")
-    marks["SourceDate_dt"] = pd.to_datetime(marks["SourceDate"], format="%Y%m%d", errors="coerce")
+    marks["MarkSourceDate"] = pd.to_datetime(
+        marks.pop("SourceDate"), format="%Y%m%d", errors="coerce"
+    ).astype("datetime64[ns]")
     marks["Mark5"] = pd.to_numeric(marks["Mark5"], errors="coerce")
     marks["Mark6"] = pd.to_numeric(marks["Mark6"], errors="coerce")
+    marks.rename(columns={"Mark5": "M5Value", "Mark6": "M6Value", "TRAINER_NAME": "MarkTrainerName"}, inplace=True)
+    marks.dropna(subset=["MarkSourceDate"], inplace=True)
+    marks.reset_index(drop=True, inplace=True)
+    return marks
+
+
+def match_marks(df: pd.DataFrame, marks: pd.DataFrame, lookback_days: int = 2) -> pd.DataFrame:
+    """Pick, per entry, the latest mark with SourceDate in [RaceDate - lookback, RaceDate].
 
+    `marks` must come from `prepare_marks`. An as-of join by horse name and
+    馬番, so memory stays linear in entries + marks instead of growing with
+    marks-per-horse x starts.
+    """
     enriched = df.copy()
     enriched["Umaban"] = enriched["Umaban"].astype(str).str.lstrip("0")
-    enriched["RowId"] = np.arange(len(enriched))
-
-    merged = enriched.merge(
-        marks,
-        how="left",
-        on=["NormalizedHorseName", "Umaban"],
-        suffixes=("", "_mark"),
+    if marks.empty:
+        return _empty_marks(enriched)
+
+    left = enriched.drop(columns=[c for c in MARK_VALUE_COLUMNS if c in enriched.columns])
+    left["RowId"] = np.arange(len(left))
+    left["RaceDate"] = left["RaceDate"].astype("datetime64[ns]")
+    has_date = left["RaceDate"].notna()
+    right = marks[["NormalizedHorseName", "Umaban", *MARK_VALUE_COLUMNS]].sort_values("MarkSourceDate", kind="stable")
+
+    matched = pd.merge_asof(
+        left[has_date].sort_values("RaceDate", kind="stable"),
+        right,
+        left_on="RaceDate",
+        right_on="MarkSourceDate",
+        by=["NormalizedHorseName", "Umaban"],
+        direction="backward",
+        tolerance=pd.Timedelta(days=lookback_days),
     )
+    unmatched = left[~has_date].reindex(columns=matched.columns)
+    merged = pd.concat([matched, unmatched], ignore_index=True) if len(unmatched) else matched
+    merged.sort_values("RowId", inplace=True, kind="stable")
+    merged.drop(columns=["RowId"], inplace=True)
+    merged.index = enriched.index
+    return merged
 
-    merged["DaysDiff"] = (merged["RaceDate"] - merged["SourceDate_dt"]).dt.days
-    valid_mask = merged["DaysDiff"].between(0, 2)
-    merged.loc[~valid_mask, ["Mark5", "Mark6", "ZI_INDEX", "ZM_VALUE", "TRAINER_NAME", "SourceDate_dt"]] = np.nan
 
-    merged.sort_values(["RowId", "SourceDate_dt"], ascending=[True, False], inplace=True)
-    merged = merged.drop_duplicates(subset=["RowId"], keep="first")
+def ensure_marks_index(conn: sqlite3.Connection) -> None:
+    """Make SourceDate range reads on HORSE_MARKS index seeks.
 
-    merged.rename(columns={"Mark5": "M5Value", "Mark6": "M6Value", "TRAINER_NAME": "MarkTrainerName"}, inplace=True)
-    merged["MarkSourceDate"] = merged["SourceDate_dt"]
-    merged.drop(columns=["SourceDate_dt", "DaysDiff", "RowId"], inplace=True)
-    return merged
+    The importer's primary key (SourceDate, NormalizedHorseName) already
+    qualifies; older excel_data.db files get a matching index. Read-only
+    databases are left untouched.
+    """
+    for index_row in conn.execute("PRAGMA index_list(HORSE_MARKS)").fetchall():
+        index_name = index_row[1]
+        columns = [info[2] for info in conn.execute(f"PRAGMA index_info('{index_name}')").fetchall()]
+        if columns[:1] == ["SourceDate"]:
+            return
+    try:
+        with conn:
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS IDX_HORSE_MARKS_DATE_NAME "
+                "ON HORSE_MARKS (SourceDate, NormalizedHorseName)"
+            )
+    except sqlite3.OperationalError as exc:
+        print(f"[WARN] Could not create HORSE_MARKS SourceDate index: {exc}")
+
+
+def load_marks(
+    conn: sqlite3.Connection,
+    date_from: Optional[pd.Timestamp] = None,
+    date_to: Optional[pd.Timestamp] = None,
+    lookback_days: int = 2,
+) -> pd.DataFrame:
+    """Read HORSE_MARKS rows whose SourceDate can match races in [date_from, date_to]."""
+    query = """
+        SELECT
+            NormalizedHorseName,
+            Umaban,
+            SourceDate,
+            Mark5,
+            Mark6,
+            ZI_INDEX,
+            ZM_VALUE,
+            TRAINER_NAME
+        FROM HORSE_MARKS
+    """
+    clauses: List[str] = []
+    params: List[str] = []
+    if date_from is not None:
+        clauses.append("SourceDate >= ?")
+        params.append((date_from - pd.Timedelta(days=lookback_days)).strftime("%Y%m%d"))
+    if date_to is not None:
+        clauses.append("SourceDate <= ?")
+        params.append(date_to.strftime("%Y%m%d"))
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def attach_marks(df: pd.DataFrame, config: FeatureConfig) -> pd.DataFrame:
+    """Attach horse mark (M5/M6) information from excel_data.db.
+
+    Only the SourceDate window covering the frame's race dates (plus the
+    lookback) is read, so a single-day run loads one day's marks.
+    """
+    if config.excel_db is None or not config.excel_db.exists() or df.empty:
+        return _empty_marks(df)
+
+    race_dates = df["RaceDate"].dropna()
+    if race_dates.empty:
+        return _empty_marks(df)
+
+    excel_conn = connect_db(config.excel_db, config.read_only)
+    try:
+        if not config.read_only:
+            ensure_marks_index(excel_conn)
+        marks = load_marks(excel_conn, race_dates.min(), race_dates.max(), config.mark_lookback_days)
+    finally:
+        excel_conn.close()
+
+    if marks.empty:
+        return _empty_marks(df)
+
+    return match_marks(df, prepare_marks(marks), config.mark_lookback_days)
 
 
-def enrich_features(df: pd.DataFrame, config: FeatureConfig) -> pd.DataFrame:
-    """Compose all feature blocks."""
+def enrich_features(
+    df: pd.DataFrame,
+    config: FeatureConfig,
+    trainer_stats: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """Compose all feature blocks.
+
+    `trainer_stats` may be passed in when several date ranges are built in one
+    run, so the point-in-time table is only refreshed and read once.
+    """
     if df.empty:
         return df
 
-    with sqlite3.connect(config.ecore_db) as conn:
+    conn = connect_db(config.ecore_db, config.read_only)
+    try:
         odds = load_odds_frame(conn, config)
-        trainer_stats = load_trainer_stats(conn)
+        if trainer_stats is None:
+            trainer_stats = load_trainer_stats(conn, *config.date_range(), refresh=not config.read_only)
+    finally:
+        conn.close()
 
-    enriched = df.copy()
-    if not odds.empty:
-        enriched = enriched.merge(
-            odds,
-            how="left",
-            on=["Year", "MonthDay", "JyoCD", "RaceNum", "Umaban"],
-        )
-    else:
-        enriched["PreTanOdds"] = np.nan
-        enriched["PreTanPopularity"] = np.nan
+    enriched = attach_odds(df, odds)
 
-    if not trainer_stats.empty:
-        enriched = enriched.merge(trainer_stats, how="left", on="ChokyosiCode")
-    else:
-        enriched["TrainerStarts"] = np.nan
-        enriched["TrainerWins"] = np.nan
-        enriched["TrainerTop3"] = np.nan
-        enriched["TrainerAvgFinish"] = np.nan
-        enriched["TrainerWinRate"] = np.nan
-        enriched["TrainerTop3Rate"] = np.nan
+    enriched = attach_trainer_stats(enriched, trainer_stats)
 
     enriched = attach_marks(enriched, config)
 
@@ -261,21 +489,94 @@ def enrich_features(df: pd.DataFrame, config: FeatureConfig) -> pd.DataFrame:
     return enriched
 
 
-def build_feature_frame(config: FeatureConfig) -> pd.DataFrame:
+def build_feature_frame(
+    config: FeatureConfig,
+    trainer_stats: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
     """Convenience helper to build the feature DataFrame."""
-    with sqlite3.connect(config.ecore_db) as conn:
+    conn = connect_db(config.ecore_db, config.read_only)
+    try:
         base = load_base_frame(conn, config)
-    features = enrich_features(base, config)
+    finally:
+        conn.close()
+    features = enrich_features(base, config, trainer_stats=trainer_stats)
     return features
 
 
+def stream_feature_frames(config: FeatureConfig, chunk_size: int = 200_000) -> Iterator[pd.DataFrame]:
+    """Build features chunk by chunk in race-date order.
+
+    Each chunk only loads odds, trainer stats and marks for its own date span,
+    so peak memory depends on `chunk_size`, not on the length of the history.
+    """
+    if not config.read_only:
+        conn = sqlite3.connect(config.ecore_db)
+        try:
+            refresh_trainer_stats(conn)
+        finally:
+            conn.close()
+        if config.excel_db is not None and config.excel_db.exists():
+            excel_conn = sqlite3.connect(config.excel_db)
+            try:
+                ensure_marks_index(excel_conn)
+            finally:
+                excel_conn.close()
+    chunk_config = replace(config, read_only=True)
+
+    conn = connect_db(config.ecore_db, read_only=True)
+    try:
+        for base in iter_base_frames(conn, config, chunk_size):
+            if base.empty:
+                continue
+            dates = base["RaceDate"].dropna()
+            if dates.empty:
+                continue
+            span_config = replace(
+                chunk_config,
+                target_date=None,
+                date_from=dates.min().strftime("%Y-%m-%d"),
+                date_to=dates.max().strftime("%Y-%m-%d"),
+            )
+            yield enrich_features(base, span_config)
+    finally:
+        conn.close()
+
+
+def save_streaming(config: FeatureConfig, chunk_size: int = 200_000) -> int:
+    """Stream features into one Parquet file, one row group per chunk; return rows written."""
+    import pyarrow.parquet as pq
+
+    if config.output_path is None:
+        raise ValueError("Streaming export requires an output path.")
+    config.output_path.parent.mkdir(parents=True, exist_ok=True)
+    writer: Optional[pq.ParquetWriter] = None
+    columns: List[str] = []
+    total = 0
+    try:
+        for frame in stream_feature_frames(config, chunk_size):
+            if writer is None:
+                columns = list(frame.columns)
+                table = to_arrow_table(frame)
+                writer = pq.ParquetWriter(config.output_path, table.schema)
+            else:
+                table = to_arrow_table(frame.reindex(columns=columns)).cast(writer.schema)
+            writer.write_table(table)
+            total += len(frame)
+            print(f"[INFO] streamed {total} rows (through {frame['RaceDate'].max():%Y-%m-%d})")
+    finally:
+        if writer is not None:
+            writer.close()
+    print(f"[OK] features streamed -> {config.output_path} ({total} rows)")
+    return total
+
+
 def save_output(df: pd.DataFrame, config: FeatureConfig) -> None:
     if config.output_path is None:
         print(df.head())
         print(f"[INFO] rows: {len(df)} (no output file specified)")
         return
     config.output_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_parquet(config.output_path, index=False)
+    write_feature_parquet(df, config.output_path)
     print(f"[OK] features saved -> {config.output_path}")
 
 
@@ -295,15 +596,61 @@ def main() -> None:
     )
     parser.add_argument("--output", type=Path, help="Where to write features (parquet).")
     parser.add_argument("--date", type=str, help="Target date (YYYY-MM-DD). If omitted, pull all races.")
+    parser.add_argument("--date-from", type=str, help="Start date (YYYY-MM-DD) when building a range.")
+    parser.add_argument("--date-to", type=str, help="End date (YYYY-MM-DD) when building a range.")
+    parser.add_argument(
+        "--store",
+        type=Path,
+        help="Date-partitioned feature store directory; only stale dates are rebuilt.",
+    )
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the store manifest and rebuild every date.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Build store partitions in this many processes (requires --store).",
+    )
+    parser.add_argument(
+        "--mark-lookback-days",
+        type=int,
+        default=2,
+        help="Accept HORSE_MARKS rows up to this many days before the race date (default: 2).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Build in race-date ordered chunks and append row groups to --output (bounded memory).",
+    )
+    parser.add_argument("--chunk-size", type=int, default=200_000, help="Rows per chunk with --stream.")
     args = parser.parse_args()
+    if args.stream and (args.store or not args.output):
+        parser.error("--stream writes a single --output file and cannot be combined with --store.")
+    if args.workers > 1 and not args.store:
+        parser.error("--workers requires --store (partitions are written per date).")
 
     config = FeatureConfig(
         ecore_db=args.ecore,
         excel_db=args.excel,
         output_path=args.output,
         target_date=args.date,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        mark_lookback_days=args.mark_lookback_days,
     )
-    features = build_feature_frame(config)
+    if args.stream:
+        save_streaming(config, args.chunk_size)
+        return
+    if args.store:
+        from ml.features.feature_store import FeatureStore
+
+        store = FeatureStore(args.store)
+        rebuilt = store.refresh(config, force=args.rebuild, workers=args.workers)
+        print(f"[OK] feature store {args.store}: {len(rebuilt)} date(s) rebuilt")
+        if config.output_path is None:
+            return
+        features = store.load(*config.date_range())
+    else:
+        features = build_feature_frame(config)
     save_output(features, config)
 
 
@@ -0,0 +1,374 @@
+"""Date-partitioned feature store backed by Parquet files.
+
+One Parquet file is kept per race date (`<store>/<YYYYMMDD>.parquet`) next to a
+`_manifest.json` that records the source fingerprint each partition was built
+from. `refresh` compares those fingerprints with cheap grouped aggregates over
+`ecore.db` / `excel_data.db` and rebuilds only the dates whose source rows
+changed, so a nightly run touches the new day instead of the whole archive.
+Partitions are written with the declared feature schema, so the directory can
+also be read directly as one Parquet dataset.
+
+Trainer statistics are joined from every earlier race day, so each date's
+fingerprint also covers the History hash that ML_TRAINER_DAILY_STATE chains
+over the result checksums of all days before it (see
+`ml.features.trainer_stats`): a corrected finish in an old race marks every
+later partition stale, and checking one date is a single indexed lookup.
+
+The manifest also keeps a *static* fingerprint (race card + marks window +
+trainer history, without the day's own results and odds). `load_live` reuses the stored snapshot while that
+fingerprint holds and only re-reads N_ODDS_TANPUKU, which is what intraday
+LIVE re-scoring needs. `load_static` exposes the snapshot itself for callers
+that cache it in memory (e.g. `ml.prediction_service`).
+
+Example:
+    python -m ml.features.build_features --store ml/feature_store
+    python -m ml.features.build_features --store ml/feature_store --rebuild --workers 8
+    python -m ml.features.build_features --store ml/feature_store --date 2025-10-13
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from ml.features.build_features import (
+    FeatureConfig,
+    attach_odds,
+    build_feature_frame,
+    connect_db,
+    date_filter_sql,
+    load_odds_frame,
+)
+from ml.features.schema import apply_schema, write_feature_parquet
+from ml.features.trainer_stats import history_fingerprints, refresh_trainer_stats
+
+# Bump when the partition contents change shape so existing stores are rebuilt.
+STORE_VERSION = 3
+# Leading underscore keeps Parquet dataset readers from treating it as data.
+MANIFEST_NAME = "_manifest.json"
+# Segments handed to each worker; several per worker keeps the pool busy at the tail.
+SEGMENTS_PER_WORKER = 4
+
+
+def _iso(date_key: str) -> str:
+    return f"{date_key[:4]}-{date_key[4:6]}-{date_key[6:]}"
+
+
+def _date_key(iso_date: str) -> str:
+    return iso_date.replace("-", "")
+
+
+def _grouped_signatures(conn: sqlite3.Connection, table: str, aggregates: str, where: str, params: list) -> Dict[str, str]:
+    rows = conn.execute(
+        f"SELECT Year || MonthDay, {aggregates} FROM {table} {where} GROUP BY Year, MonthDay",
+        params,
+    ).fetchall()
+    return {row[0]: str(row[1:]) for row in rows}
+
+
+def _source_signatures(
+    conn: sqlite3.Connection, config: FeatureConfig, live: bool = True
+) -> Dict[str, Tuple[str, str, str]]:
+    """Per-date (entries, results, odds) signatures of the ecore.db rows feeding a partition.
+
+    Entries cover the static card (who runs where); results and odds change
+    during a race day and are kept separate so LIVE runs can ignore them.
+    With `live=False` they are not read at all and come back empty.
+    """
+    clause, params = date_filter_sql(*config.date_range())
+    where = f"WHERE {clause}" if clause else ""
+    entries = _grouped_signatures(
+        conn,
+        "N_UMA_RACE",
+        """
+            COUNT(*),
+            TOTAL(CAST(Umaban AS INTEGER) * CAST(RaceNum AS INTEGER)),
+            TOTAL(CAST(KettoNum AS INTEGER) % 1000003),
+            COUNT(DISTINCT ChokyosiCode)
+        """,
+        where,
+        params,
+    )
+    if not live:
+        return {key: (sig, "", "") for key, sig in entries.items()}
+    results = _grouped_signatures(
+        conn,
+        "N_UMA_RACE",
+        """
+            COUNT(NULLIF(KakuteiJyuni, '')),
+            TOTAL(CAST(KakuteiJyuni AS INTEGER) * CAST(Umaban AS INTEGER))
+        """,
+        where,
+        params,
+    )
+    odds = _grouped_signatures(
+        conn,
+        "N_ODDS_TANPUKU",
+        "COUNT(*), TOTAL(CAST(TanOdds AS INTEGER) * CAST(Umaban AS INTEGER))",
+        where,
+        params,
+    )
+    return {key: (sig, results.get(key, ""), odds.get(key, "")) for key, sig in entries.items()}
+
+
+def _mark_signatures(config: FeatureConfig, date_keys: Sequence[str]) -> Dict[str, str]:
+    """Per-SourceDate signature of HORSE_MARKS rows (empty when marks are unavailable)."""
+    if not date_keys or config.excel_db is None or not config.excel_db.exists():
+        return {}
+    first = datetime.strptime(min(date_keys), "%Y%m%d") - timedelta(days=config.mark_lookback_days)
+    conn = sqlite3.connect(config.excel_db)
+    try:
+        rows = conn.execute(
+            """
+            SELECT
+                SourceDate,
+                COUNT(*),
+                TOTAL(LENGTH(IFNULL(Mark5, '')) + LENGTH(IFNULL(Mark6, ''))),
+                TOTAL(CAST(Mark5 AS REAL)) + TOTAL(CAST(Mark6 AS REAL)),
+                TOTAL(CAST(ZI_INDEX AS REAL)) + TOTAL(CAST(ZM_VALUE AS REAL))
+            FROM HORSE_MARKS
+            WHERE SourceDate BETWEEN ? AND ?
+            GROUP BY SourceDate
+            """,
+            (first.strftime("%Y%m%d"), max(date_keys)),
+        ).fetchall()
+    finally:
+        conn.close()
+    return {row[0]: str(row[1:]) for row in rows}
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def _static_fingerprint(
+    date_key: str, entry_sig: str, history_sig: str, mark_sigs: Dict[str, str], lookback_days: int
+) -> str:
+    """Fingerprint of the inputs that do not move on race day (card + trainer history + marks window)."""
+    day = datetime.strptime(date_key, "%Y%m%d")
+    window = [
+        mark_sigs.get((day - timedelta(days=offset)).strftime("%Y%m%d"), "")
+        for offset in range(lookback_days + 1)
+    ]
+    return _hash(str(STORE_VERSION), str(lookback_days), entry_sig, history_sig, *window)
+
+
+def fingerprint_parts(config: FeatureConfig, live: bool = True) -> Dict[str, Tuple[str, str]]:
+    """Current (static, full) fingerprints for every race date in the config's range.
+
+    With `live=False` results and odds are skipped and both parts are the
+    static fingerprint.
+    """
+    conn = connect_db(config.ecore_db, read_only=True)
+    try:
+        source_sigs = _source_signatures(conn, config, live)
+        history = history_fingerprints(conn, source_sigs)
+    finally:
+        conn.close()
+    mark_sigs = _mark_signatures(config, list(source_sigs))
+    parts: Dict[str, Tuple[str, str]] = {}
+    for key, (entry_sig, result_sig, odds_sig) in source_sigs.items():
+        static = _static_fingerprint(key, entry_sig, history[key], mark_sigs, config.mark_lookback_days)
+        parts[key] = (static, _hash(static, result_sig, odds_sig) if live else static)
+    return parts
+
+
+def static_fingerprints(config: FeatureConfig) -> Dict[str, str]:
+    """Current static fingerprints only; reads neither results nor odds."""
+    return {key: static for key, (static, _) in fingerprint_parts(config, live=False).items()}
+
+
+def _contiguous_runs(all_keys: Sequence[str], stale: Sequence[str]) -> List[List[str]]:
+    """Group stale dates that are adjacent in the source calendar into one build."""
+    position = {key: idx for idx, key in enumerate(all_keys)}
+    runs: List[List[str]] = []
+    for key in sorted(stale):
+        if runs and position[key] == position[runs[-1][-1]] + 1:
+            runs[-1].append(key)
+        else:
+            runs.append([key])
+    return runs
+
+
+def _segments(runs: List[List[str]], target_count: int) -> List[List[str]]:
+    """Split contiguous runs into roughly equal segments for the worker pool."""
+    total = sum(len(run) for run in runs)
+    size = max(1, -(-total // max(target_count, 1)))
+    return [run[start:start + size] for run in runs for start in range(0, len(run), size)]
+
+
+def _build_segment(config: FeatureConfig, date_keys: List[str], root: Path) -> Dict[str, int]:
+    """Build and write partitions for one contiguous segment; return rows per date.
+
+    Module-level so it can run in a spawned worker process.
+    """
+    segment_config = replace(config, date_from=_iso(date_keys[0]), date_to=_iso(date_keys[-1]))
+    frame = build_feature_frame(segment_config)
+    written: Dict[str, int] = {}
+    if frame.empty:
+        return written
+    wanted = set(date_keys)
+    date_index = frame["RaceDate"].dt.strftime("%Y%m%d")
+    for key, part in frame.groupby(date_index, sort=True):
+        if key not in wanted:
+            continue
+        write_feature_parquet(part, root / f"{key}.parquet")
+        written[key] = int(len(part))
+    return written
+
+
+class FeatureStore:
+    """Parquet partitions per race date plus a manifest of source fingerprints."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self.manifest_path = self.root / MANIFEST_NAME
+
+    def partition_path(self, date_key: str) -> Path:
+        return self.root / f"{date_key}.parquet"
+
+    def read_manifest(self) -> dict:
+        if not self.manifest_path.exists():
+            return {"version": STORE_VERSION, "partitions": {}}
+        manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("version") != STORE_VERSION:
+            return {"version": STORE_VERSION, "partitions": {}}
+        return manifest
+
+    def write_manifest(self, manifest: dict) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+        tmp_path.replace(self.manifest_path)
+
+    def fingerprint_parts(self, config: FeatureConfig) -> Dict[str, Tuple[str, str]]:
+        return fingerprint_parts(config)
+
+    def fingerprints(self, config: FeatureConfig) -> Dict[str, str]:
+        """Current full source fingerprint for every race date in the config's range."""
+        return {key: full for key, (_, full) in self.fingerprint_parts(config).items()}
+
+    def _stale(self, current: Dict[str, str], partitions: Dict[str, dict], force: bool) -> List[str]:
+        return sorted(
+            key
+            for key, fingerprint in current.items()
+            if force
+            or partitions.get(key, {}).get("fingerprint") != fingerprint
+            or not self.partition_path(key).exists()
+        )
+
+    def stale_dates(self, config: FeatureConfig, force: bool = False) -> List[str]:
+        """Date keys (YYYYMMDD) whose partition is missing or out of date."""
+        return self._stale(self.fingerprints(config), self.read_manifest()["partitions"], force)
+
+    def refresh(self, config: FeatureConfig, force: bool = False, workers: int = 1) -> List[str]:
+        """Rebuild stale partitions within the config's date range; return rebuilt dates.
+
+        With `workers > 1` the stale dates are sharded into contiguous segments
+        and built in a process pool; every worker opens its own read-only
+        SQLite connections and writes its partitions directly.
+        """
+        # Trainer stats first: the fingerprints include their per-day state.
+        conn = sqlite3.connect(config.ecore_db)
+        try:
+            refresh_trainer_stats(conn)
+        finally:
+            conn.close()
+        parts = self.fingerprint_parts(config)
+        current = {key: full for key, (_, full) in parts.items()}
+        manifest = self.read_manifest()
+        partitions: Dict[str, dict] = manifest["partitions"]
+
+        stale = self._stale(current, partitions, force)
+
+        date_from, date_to = config.date_range()
+        for key in list(partitions):
+            in_range = (not date_from or key >= _date_key(date_from)) and (
+                not date_to or key <= _date_key(date_to)
+            )
+            if in_range and key not in current:
+                self.partition_path(key).unlink(missing_ok=True)
+                del partitions[key]
+
+        if not stale:
+            self.write_manifest(manifest)
+            return []
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Segment builds only read; the trainer stats were refreshed above.
+        build_config = replace(config, read_only=True, target_date=None, output_path=None)
+        segments = _segments(_contiguous_runs(sorted(current), stale), max(workers, 1) * SEGMENTS_PER_WORKER)
+
+        def _record(written: Dict[str, int]) -> None:
+            for key, rows in written.items():
+                partitions[key] = {
+                    "fingerprint": current[key],
+                    "static_fingerprint": parts[key][0],
+                    "rows": rows,
+                    "built_at": datetime.utcnow().isoformat(timespec="seconds"),
+                }
+            # Persist after every segment so an interrupted full build resumes where it stopped.
+            self.write_manifest(manifest)
+
+        if workers <= 1:
+            for segment in segments:
+                _record(_build_segment(build_config, segment, self.root))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_build_segment, build_config, segment, self.root) for segment in segments]
+                for future in as_completed(futures):
+                    _record(future.result())
+        return stale
+
+    def load_static(self, config: FeatureConfig) -> Tuple[Optional[str], pd.DataFrame]:
+        """Return (static fingerprint, stored snapshot) for one date.
+
+        The partition is rebuilt only when the card or the marks window changed;
+        result and odds updates during the day keep the stored snapshot.
+        """
+        target_date = config.target_date or config.date_from
+        if not target_date or (config.date_to and config.date_to != target_date):
+            raise ValueError("Static snapshots are loaded for a single target date.")
+        day_config = replace(config, target_date=target_date, date_from=None, date_to=None)
+        key = _date_key(target_date)
+
+        static = static_fingerprints(day_config).get(key)
+        if static is None:
+            return None, pd.DataFrame()
+        entry = self.read_manifest()["partitions"].get(key, {})
+        if entry.get("static_fingerprint") != static or not self.partition_path(key).exists():
+            self.refresh(day_config)
+            # Refreshing the trainer stats may have moved the fingerprint on.
+            static = self.read_manifest()["partitions"].get(key, {}).get("static_fingerprint", static)
+        return static, pd.read_parquet(self.partition_path(key))
+
+    def load_live(self, config: FeatureConfig) -> pd.DataFrame:
+        """Load one date from its static snapshot with N_ODDS_TANPUKU re-read."""
+        _, snapshot = self.load_static(config)
+        if snapshot.empty:
+            return snapshot
+        conn = connect_db(config.ecore_db, read_only=True)
+        try:
+            odds = load_odds_frame(conn, replace(config, target_date=config.target_date or config.date_from))
+        finally:
+            conn.close()
+        return apply_schema(attach_odds(snapshot, odds))
+
+    def load(self, date_from: Optional[str] = None, date_to: Optional[str] = None) -> pd.DataFrame:
+        """Concatenate stored partitions for an inclusive YYYY-MM-DD range."""
+        keys = sorted(self.read_manifest()["partitions"])
+        if date_from:
+            keys = [key for key in keys if key >= _date_key(date_from)]
+        if date_to:
+            keys = [key for key in keys if key <= _date_key(date_to)]
+        frames = [pd.read_parquet(self.partition_path(key)) for key in keys]
+        if not frames:
+            return pd.DataFrame()
+        return apply_schema(pd.concat(frames, ignore_index=True))
@@ -0,0 +1,129 @@
+"""Declared column dtypes for the feature frame.
+
+Codes and names are stored as categoricals, small integers as (nullable)
+int8/int16/int32 and scores as float32. `apply_schema` casts a frame to the
+map (used after loading), `to_arrow_table` additionally pins the Parquet
+types so every file/partition written by the pipeline has the same schema.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+CATEGORY = "category"
+
+FEATURE_SCHEMA: Dict[str, str] = {
+    # レースキー / コード
+    "Year": CATEGORY,
+    "MonthDay": CATEGORY,
+    "JyoCD": CATEGORY,
+    "RaceNum": CATEGORY,
+    "Umaban": CATEGORY,
+    "RaceKey": CATEGORY,
+    "KettoNum": CATEGORY,
+    "ChokyosiCode": CATEGORY,
+    "KisyuCode": CATEGORY,
+    "SexCD": CATEGORY,
+    "TrackCD": CATEGORY,
+    "HassoTime": CATEGORY,
+    "KakuteiJyuni": CATEGORY,
+    # 名称
+    "Bamei": CATEGORY,
+    "NormalizedHorseName": CATEGORY,
+    "ChokyosiRyakusyo": CATEGORY,
+    "KisyuRyakusyo": CATEGORY,
+    "RaceName": CATEGORY,
+    "MarkTrainerName": CATEGORY,
+    # 小さな整数
+    "Barei": "Int8",
+    "Kyori": "Int16",
+    "RaceDistance": "Int16",
+    "TimeDiff": "Int16",
+    "HaronTimeL3": "Int16",
+    "PreTanPopularity": "Int8",
+    "TrainerStarts": "Int32",
+    "TrainerWins": "Int32",
+    "TrainerTop3": "Int32",
+    "WinLabel": "int8",
+    "PlaceLabel": "int8",
+    "IsTurf": "int8",
+    # スコア
+    "PreTanOdds": "float32",
+    "TrainerAvgFinish": "float32",
+    "TrainerWinRate": "float32",
+    "TrainerTop3Rate": "float32",
+    "M5Value": "float32",
+    "M6Value": "float32",
+    "ZI_INDEX": "float32",
+    "ZM_VALUE": "float32",
+    # 日付
+    "RaceDate": "datetime64[ns]",
+    "MarkSourceDate": "datetime64[ns]",
+}
+
+_ARROW_TYPES: Dict[str, pa.DataType] = {
+    CATEGORY: pa.dictionary(pa.int32(), pa.string()),
+    "Int8": pa.int8(),
+    "Int16": pa.int16(),
+    "Int32": pa.int32(),
+    "int8": pa.int8(),
+    "float32": pa.float32(),
+    "datetime64[ns]": pa.timestamp("ns"),
+}
+
+
+def _cast_column(series: pd.Series, dtype: str) -> pd.Series:
+    if dtype == CATEGORY:
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series
+        text = series.astype("string")
+        return text.where(text.notna(), None).astype(CATEGORY)
+    if dtype.startswith("datetime64"):
+        return pd.to_datetime(series, errors="coerce").astype(dtype)
+    numeric = pd.to_numeric(series, errors="coerce")
+    if dtype.lower().startswith("int"):
+        numeric = numeric.round()
+        if dtype.islower():
+            numeric = numeric.fillna(0)
+    return numeric.astype(dtype)
+
+
+def apply_schema(df: pd.DataFrame, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Cast declared columns to FEATURE_SCHEMA dtypes; undeclared columns are left as-is."""
+    targets = FEATURE_SCHEMA if columns is None else {c: FEATURE_SCHEMA[c] for c in columns if c in FEATURE_SCHEMA}
+    typed = df.copy()
+    for column, dtype in targets.items():
+        if column in typed.columns and str(typed[column].dtype) != dtype:
+            try:
+                typed[column] = _cast_column(typed[column], dtype)
+            except (TypeError, ValueError) as exc:
+                raise ValueError(f"Column '{column}' cannot be stored as {dtype}: {exc}") from exc
+    return typed
+
+
+def to_arrow_table(df: pd.DataFrame) -> pa.Table:
+    """Convert a feature frame to Arrow with the declared schema enforced."""
+    table = pa.Table.from_pandas(apply_schema(df), preserve_index=False)
+    fields = [
+        pa.field(field.name, _ARROW_TYPES[FEATURE_SCHEMA[field.name]])
+        if field.name in FEATURE_SCHEMA
+        else field
+        for field in table.schema
+    ]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def write_feature_parquet(df: pd.DataFrame, path: Path) -> None:
+    """Write a feature frame to Parquet with the enforced schema."""
+    import pyarrow.parquet as pq
+
+    pq.write_table(to_arrow_table(df), path)
+
+
+def load_feature_frame(path: Path, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Read a feature Parquet file or partitioned directory and apply the schema."""
+    selected = list(columns) if columns is not None else None
+    return apply_schema(pd.read_parquet(path, columns=selected))
@@ -0,0 +1,361 @@
+"""Point-in-time trainer statistics maintained incrementally in ecore.db.
+
+`ML_TRAINER_DAILY` keeps one row per (ChokyosiCode, race date) with that day's
+counts and the cumulative totals *through* the day. Feature rows are joined to
+the latest row strictly before their race date, so a race never sees its own or
+any later result (leak-free backtests on the normal code path).
+
+`ML_TRAINER_DAILY_STATE` records, per race day, a checksum of the N_UMA_RACE
+rows the day was aggregated from (entries, trainers, finishing positions, as
+in the evaluation cache fingerprints), the highest rowid among them, and a
+hash chained over the checksums of that and every earlier day.
+
+A refresh only re-checksums
+* the days from the last stored day on, or from the earliest day within
+  `PENDING_WINDOW_DAYS` of it that still had entries without a finish, and
+* older days with a row above the stored rowid watermark: JVLinkToSQLite
+  rewrites a corrected record with INSERT OR REPLACE, which gives it a new
+  rowid, so a rowid range scan finds exactly the rewritten days.
+It then re-aggregates from the earliest day whose checksum changed, so
+appending a race day costs O(new rows). Changes the watermark cannot see
+(in-place UPDATEs or deletes of older days) are found by `--verify`, which
+compares the checksum of every day.
+
+Example:
+    python -m ml.features.trainer_stats --ecore envs/cursor/my_keiba/ecore.db
+    python -m ml.features.trainer_stats --ecore envs/cursor/my_keiba/ecore.db --verify
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+TABLE_NAME = "ML_TRAINER_DAILY"
+STATE_TABLE = "ML_TRAINER_DAILY_STATE"
+DAY_COLUMNS = ("DayStarts", "DayWins", "DayTop3", "DayFinishSum", "DayFinishCount")
+CUM_COLUMNS = ("CumStarts", "CumWins", "CumTop3", "CumFinishSum", "CumFinishCount")
+STATE_COLUMNS = ("RaceDate", "Checksum", "MaxRowid", "History")
+# Unsettled entries older than this (取消・除外など) no longer hold back the rescan window.
+PENDING_WINDOW_DAYS = 14
+
+SCHEMA_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+        ChokyosiCode   TEXT    NOT NULL,
+        RaceDate       TEXT    NOT NULL, -- YYYYMMDD
+        DayStarts      INTEGER NOT NULL,
+        DayWins        INTEGER NOT NULL,
+        DayTop3        INTEGER NOT NULL,
+        DayFinishSum   REAL    NOT NULL,
+        DayFinishCount INTEGER NOT NULL,
+        DayPending     INTEGER NOT NULL,
+        CumStarts      INTEGER NOT NULL,
+        CumWins        INTEGER NOT NULL,
+        CumTop3        INTEGER NOT NULL,
+        CumFinishSum   REAL    NOT NULL,
+        CumFinishCount INTEGER NOT NULL,
+        PRIMARY KEY (ChokyosiCode, RaceDate)
+    );
+    CREATE INDEX IF NOT EXISTS idx_ml_trainer_daily_date ON {TABLE_NAME} (RaceDate);
+
+    CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+        RaceDate TEXT    NOT NULL PRIMARY KEY, -- YYYYMMDD
+        Checksum TEXT    NOT NULL,             -- N_UMA_RACE rows the day was aggregated from
+        MaxRowid INTEGER NOT NULL,             -- highest N_UMA_RACE rowid of the day
+        History  TEXT    NOT NULL              -- Checksum chained over this and every earlier day
+    ) WITHOUT ROWID;
+"""
+
+# Changes when an entry, its trainer or its finishing position changes.
+RESULT_CHECKSUM_SQL = """
+    SELECT
+        Year || MonthDay,
+        COUNT(*) || ':' ||
+        TOTAL(CAST(KakuteiJyuni AS INTEGER)) || ':' ||
+        TOTAL(CAST(KakuteiJyuni AS INTEGER) * CAST(Umaban AS INTEGER)) || ':' ||
+        TOTAL(CAST(ChokyosiCode AS INTEGER) * CAST(Umaban AS INTEGER)),
+        MAX(rowid)
+    FROM N_UMA_RACE{where}
+    GROUP BY Year, MonthDay
+"""
+
+DayState = Tuple[str, int]  # (Checksum, MaxRowid)
+
+
+def _day_states(conn: sqlite3.Connection, where: str = "", params: Iterable[str] = ()) -> Dict[str, DayState]:
+    rows = conn.execute(RESULT_CHECKSUM_SQL.format(where=where), list(params)).fetchall()
+    return {day: (checksum, max_rowid) for day, checksum, max_rowid in rows}
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def history_fingerprints(conn: sqlite3.Connection, date_keys: Iterable[str]) -> Dict[str, str]:
+    """Per date key (YYYYMMDD), the History hash of the last stored race day strictly before it.
+
+    Trainer statistics for a date are joined from exactly those days, so the
+    hash changes whenever an earlier day is re-aggregated. Reads only the
+    state rows between the first key's predecessor and the last key.
+    """
+    keys = sorted(date_keys)
+    if not keys or not _has_table(conn, STATE_TABLE):
+        return {key: "" for key in keys}
+    rows = conn.execute(
+        f"""
+        SELECT RaceDate, History FROM {STATE_TABLE}
+        WHERE RaceDate < ?
+          AND RaceDate >= IFNULL((SELECT MAX(RaceDate) FROM {STATE_TABLE} WHERE RaceDate < ?), '')
+        ORDER BY RaceDate
+        """,
+        (keys[-1], keys[0]),
+    ).fetchall()
+    fingerprints: Dict[str, str] = {}
+    history, position = "", 0
+    for key in keys:
+        while position < len(rows) and rows[position][0] < key:
+            history = rows[position][1]
+            position += 1
+        fingerprints[key] = history
+    return fingerprints
+
+
+def _chain(previous: str, day: str, checksum: str) -> str:
+    return hashlib.sha1(f"{previous}|{day}={checksum}".encode("utf-8")).hexdigest()
+
+
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({STATE_TABLE})").fetchall()}
+    if columns and not set(STATE_COLUMNS) <= columns:
+        # State from an older layout: drop it, the next refresh rebuilds from scratch.
+        conn.execute(f"DROP TABLE {STATE_TABLE}")
+    conn.executescript(SCHEMA_SQL)
+
+
+def _rescan_start(conn: sqlite3.Connection) -> str:
+    """Last stored day, or the earliest recent day that still had entries without a finish."""
+    last = conn.execute(f"SELECT MAX(RaceDate) FROM {STATE_TABLE}").fetchone()[0]
+    window_start = (datetime.strptime(last, "%Y%m%d") - timedelta(days=PENDING_WINDOW_DAYS)).strftime("%Y%m%d")
+    pending = conn.execute(
+        f"SELECT MIN(RaceDate) FROM {TABLE_NAME} WHERE RaceDate >= ? AND DayPending > 0",
+        (window_start,),
+    ).fetchone()[0]
+    return min(last, pending) if pending else last
+
+
+def _scan_days(conn: sqlite3.Connection) -> Tuple[Dict[str, DayState], str]:
+    """Current state of the days that can have changed, and the day the full scan starts at."""
+    scan_from = _rescan_start(conn)
+    current = _day_states(conn, " WHERE Year >= ? AND (Year || MonthDay) >= ?", [scan_from[:4], scan_from])
+    watermark = conn.execute(f"SELECT MAX(MaxRowid) FROM {STATE_TABLE}").fetchone()[0]
+    rewritten = conn.execute(
+        "SELECT DISTINCT Year, MonthDay FROM N_UMA_RACE WHERE rowid > ?", (watermark,)
+    ).fetchall()
+    for year, month_day in rewritten:
+        if year + month_day < scan_from:
+            current.update(_day_states(conn, " WHERE Year = ? AND MonthDay = ?", [year, month_day]))
+    return current, scan_from
+
+
+def refresh_trainer_stats(conn: sqlite3.Connection, verify: bool = False) -> int:
+    """Bring ML_TRAINER_DAILY up to date with N_UMA_RACE; return rows (re)written.
+
+    With `verify` every race day is re-checksummed instead of only the recent
+    and rewritten ones.
+    """
+    _ensure_schema(conn)
+    stored: Dict[str, DayState] = {
+        day: (checksum, max_rowid)
+        for day, checksum, max_rowid in conn.execute(f"SELECT RaceDate, Checksum, MaxRowid FROM {STATE_TABLE}")
+    }
+    if verify or not stored:
+        current, scan_from = _day_states(conn), ""
+    else:
+        current, scan_from = _scan_days(conn)
+
+    removed = [day for day in stored if day >= scan_from and day not in current]
+    changed = sorted([day for day, state in current.items() if stored.get(day, ("", 0))[0] != state[0]] + removed)
+    # Rewritten but identical rows only move the watermark.
+    moved = [(state[1], day) for day, state in current.items() if day in stored and stored[day][1] != state[1]]
+    if stored and not changed:
+        with conn:
+            conn.executemany(f"UPDATE {STATE_TABLE} SET MaxRowid = ? WHERE RaceDate = ?", moved)
+        return 0
+    resume = changed[0] if stored else None
+
+    query = """
+        SELECT
+            ChokyosiCode,
+            Year || MonthDay AS RaceDate,
+            COUNT(*) AS DayStarts,
+            SUM(CASE WHEN KakuteiJyuni = '01' THEN 1 ELSE 0 END) AS DayWins,
+            SUM(CASE WHEN KakuteiJyuni IN ('01','02','03') THEN 1 ELSE 0 END) AS DayTop3,
+            TOTAL(
+                CASE
+                    WHEN KakuteiJyuni GLOB '[0-9][0-9]' AND KakuteiJyuni <> '00'
+                    THEN CAST(KakuteiJyuni AS INTEGER)
+                END
+            ) AS DayFinishSum,
+            SUM(CASE WHEN KakuteiJyuni GLOB '[0-9][0-9]' AND KakuteiJyuni <> '00' THEN 1 ELSE 0 END)
+                AS DayFinishCount
+        FROM N_UMA_RACE
+        WHERE IFNULL(ChokyosiCode,'') <> ''
+    """
+    params: list = []
+    if resume:
+        query += " AND Year >= ? AND (Year || MonthDay) >= ?"
+        params = [resume[:4], resume]
+    query += " GROUP BY ChokyosiCode, Year, MonthDay"
+    daily = pd.read_sql_query(query, conn, params=params)
+
+    # Days from the resume point keep their stored state unless rescanned.
+    states = {day: state for day, state in stored.items() if not resume or day >= resume}
+    states.update({day: state for day, state in current.items() if not resume or day >= resume})
+    for day in removed:
+        states.pop(day, None)
+
+    with conn:
+        conn.executemany(f"UPDATE {STATE_TABLE} SET MaxRowid = ? WHERE RaceDate = ?", moved)
+        history = ""
+        if resume:
+            conn.execute(f"DELETE FROM {TABLE_NAME} WHERE RaceDate >= ?", (resume,))
+            conn.execute(f"DELETE FROM {STATE_TABLE} WHERE RaceDate >= ?", (resume,))
+            row = conn.execute(
+                f"SELECT History FROM {STATE_TABLE} WHERE RaceDate < ? ORDER BY RaceDate DESC LIMIT 1", (resume,)
+            ).fetchone()
+            history = row[0] if row else ""
+        else:
+            conn.execute(f"DELETE FROM {TABLE_NAME}")
+            conn.execute(f"DELETE FROM {STATE_TABLE}")
+        state_rows: List[Tuple[str, str, int, str]] = []
+        for day in sorted(states):
+            checksum, max_rowid = states[day]
+            history = _chain(history, day, checksum)
+            state_rows.append((day, checksum, max_rowid, history))
+        conn.executemany(
+            f"INSERT INTO {STATE_TABLE} ({', '.join(STATE_COLUMNS)}) VALUES (?, ?, ?, ?)", state_rows
+        )
+        if daily.empty:
+            return 0
+
+        baseline = pd.read_sql_query(
+            f"""
+            SELECT T.ChokyosiCode, {", ".join(f"T.{c}" for c in CUM_COLUMNS)}
+            FROM {TABLE_NAME} T
+            JOIN (
+                SELECT ChokyosiCode, MAX(RaceDate) AS RaceDate
+                FROM {TABLE_NAME}
+                GROUP BY ChokyosiCode
+            ) L
+              ON T.ChokyosiCode = L.ChokyosiCode
+             AND T.RaceDate = L.RaceDate
+            """,
+            conn,
+        )
+
+        daily.sort_values(["ChokyosiCode", "RaceDate"], inplace=True, ignore_index=True)
+        daily["DayPending"] = daily["DayStarts"] - daily["DayFinishCount"]
+        cumulative = daily.groupby("ChokyosiCode", sort=False)[list(DAY_COLUMNS)].cumsum()
+        cumulative.columns = list(CUM_COLUMNS)
+        daily = pd.concat([daily, cumulative], axis=1)
+        if not baseline.empty:
+            daily = daily.merge(baseline, how="left", on="ChokyosiCode", suffixes=("", "_base"))
+            for column in CUM_COLUMNS:
+                daily[column] += daily.pop(f"{column}_base").fillna(0)
+
+        columns = ["ChokyosiCode", "RaceDate", *DAY_COLUMNS, "DayPending", *CUM_COLUMNS]
+        conn.executemany(
+            f"INSERT INTO {TABLE_NAME} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+            daily[columns].astype(object).itertuples(index=False, name=None),
+        )
+    return len(daily)
+
+
+def load_trainer_asof(
+    conn: sqlite3.Connection,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> pd.DataFrame:
+    """Load cumulative trainer stats needed to as-of join races in [date_from, date_to].
+
+    Besides rows inside the range, the latest row before `date_from` is loaded per
+    trainer so the first day of the range still sees the full history.
+    """
+    if not _has_table(conn, TABLE_NAME):
+        raise ValueError(
+            f"{TABLE_NAME} not found; run `python -m ml.features.trainer_stats --ecore <ecore.db>` "
+            "first (read-only builds cannot create it)."
+        )
+    cum_select = ", ".join(CUM_COLUMNS)
+    if date_from:
+        key_from = date_from.replace("-", "")
+        params: list = [key_from]
+        range_clause = "RaceDate >= ?"
+        if date_to:
+            range_clause += " AND RaceDate < ?"
+            params.append(date_to.replace("-", ""))
+        query = f"""
+            SELECT ChokyosiCode, RaceDate, {cum_select}
+            FROM {TABLE_NAME}
+            WHERE {range_clause}
+            UNION ALL
+            SELECT T.ChokyosiCode, T.RaceDate, {", ".join(f"T.{c}" for c in CUM_COLUMNS)}
+            FROM {TABLE_NAME} T
+            JOIN (
+                SELECT ChokyosiCode, MAX(RaceDate) AS RaceDate
+                FROM {TABLE_NAME}
+                WHERE RaceDate < ?
+                GROUP BY ChokyosiCode
+            ) L
+              ON T.ChokyosiCode = L.ChokyosiCode
+             AND T.RaceDate = L.RaceDate
+        """
+        params.append(key_from)
+    else:
+        query = f"SELECT ChokyosiCode, RaceDate, {cum_select} FROM {TABLE_NAME}"
+        params = []
+        if date_to:
+            query += " WHERE RaceDate < ?"
+            params.append(date_to.replace("-", ""))
+
+    stats = pd.read_sql_query(query, conn, params=params)
+    if stats.empty:
+        return stats
+    stats["StatsDate"] = pd.to_datetime(stats.pop("RaceDate"), format="%Y%m%d")
+    stats.rename(
+        columns={"CumStarts": "TrainerStarts", "CumWins": "TrainerWins", "CumTop3": "TrainerTop3"},
+        inplace=True,
+    )
+    stats["TrainerAvgFinish"] = stats.pop("CumFinishSum") / stats.pop("CumFinishCount").replace(0, np.nan)
+    stats["TrainerWinRate"] = stats["TrainerWins"] / stats["TrainerStarts"].replace(0, np.nan)
+    stats["TrainerTop3Rate"] = stats["TrainerTop3"] / stats["TrainerStarts"].replace(0, np.nan)
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Refresh point-in-time trainer statistics in ecore.db.")
+    parser.add_argument("--ecore", type=Path, default=Path("envs/cursor/my_keiba/ecore.db"))
+    parser.add_argument("--rebuild", action="store_true", help=f"Drop {TABLE_NAME} and rebuild from scratch.")
+    parser.add_argument("--verify", action="store_true",
+                        help="Re-checksum every race day, not only recent and rewritten ones.")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.ecore)
+    try:
+        if args.rebuild:
+            conn.execute(f"DROP TABLE IF EXISTS {TABLE_NAME}")
+            conn.execute(f"DROP TABLE IF EXISTS {STATE_TABLE}")
+        written = refresh_trainer_stats(conn, verify=args.verify)
+    finally:
+        conn.close()
+    print(f"[OK] {TABLE_NAME} refreshed ({written} rows written) -> {args.ecore}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Versioned model artifact bundles.
+
+A trained model is stored as one uncompressed joblib bundle,
+`{version}.bundle.joblib`, holding the model, the scaler and the metadata:
+feature list, feature dtypes, backend and the hash of the rank rules it was
+tuned with. Next to it, `{version}.json` keeps the same metadata plus the
+bundle's sha256 and size, readable without unpickling anything. `LATEST` names
+the version used when none is requested. It is replaced atomically, so
+promoting or rolling back a model is a one-line write and never a directory
+glob.
+
+Loading maps the bundle's numpy arrays with `mmap_mode="r"` instead of
+copying them. The checksum is verified once per process. The loaded bundle
+stays cached by (path, size, mtime), so a reload of an unchanged model in
+`ml.prediction_service` costs a `stat`. Only the latest load of each path is
+kept, so rewriting a bundle in place does not pin the old copy in memory.
+Directories from before bundles existed (`{version}.joblib` +
+`{version}_scaler.joblib`, newest `win-*.json` by name) still load.
+
+Example:
+    python -m ml.models.artifacts --model-dir ml/model_artifacts
+    python -m ml.models.artifacts --model-dir ml/model_artifacts --promote win-20251012
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import joblib
+
+LATEST_POINTER = "LATEST"
+BUNDLE_SUFFIX = ".bundle.joblib"
+
+# bundle path -> ((size, mtime_ns), (model, scaler, metadata)); one entry per path
+_BUNDLE_CACHE: Dict[str, Tuple[Tuple[int, int], Tuple[object, object, dict]]] = {}
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def read_latest(model_dir: Path) -> Optional[str]:
+    pointer = model_dir / LATEST_POINTER
+    if not pointer.exists():
+        return None
+    return pointer.read_text(encoding="utf-8").strip() or None
+
+
+def promote(model_dir: Path, version: str) -> None:
+    """Point LATEST at `version` (which must have metadata in `model_dir`)."""
+    if not (model_dir / f"{version}.json").exists():
+        raise FileNotFoundError(f"Model version metadata not found: {model_dir / f'{version}.json'}")
+    _write_atomic(model_dir / LATEST_POINTER, f"{version}\n")
+
+
+def write_bundle(model_dir: Path, model: object, scaler: object, metadata: dict, make_latest: bool = True) -> dict:
+    """Write `{version}.bundle.joblib` and `{version}.json`; returns the metadata written."""
+    model_dir.mkdir(parents=True, exist_ok=True)
+    version = metadata["version"]
+    bundle_path = model_dir / f"{version}{BUNDLE_SUFFIX}"
+    # Uncompressed, so numpy arrays can be memory-mapped on load.
+    joblib.dump({"model": model, "scaler": scaler, "metadata": metadata}, bundle_path)
+    manifest = {
+        **metadata,
+        "bundle": {"file": bundle_path.name, "sha256": file_sha256(bundle_path), "bytes": bundle_path.stat().st_size},
+    }
+    _write_atomic(model_dir / f"{version}.json", json.dumps(manifest, indent=2))
+    if make_latest:
+        promote(model_dir, version)
+    return manifest
+
+
+def resolve_version(model_dir: Path, version: Optional[str]) -> Path:
+    """Metadata path of `version`, of the LATEST pointer, or of the newest legacy `win-*.json`."""
+    if version:
+        metadata_path = model_dir / f"{version}.json"
+        if not metadata_path.exists():
+            raise FileNotFoundError(f"Specified model version metadata not found: {metadata_path}")
+        return metadata_path
+    latest = read_latest(model_dir)
+    if latest:
+        metadata_path = model_dir / f"{latest}.json"
+        if not metadata_path.exists():
+            raise FileNotFoundError(f"{model_dir / LATEST_POINTER} points to a missing model: {metadata_path}")
+        return metadata_path
+    artifacts = sorted(model_dir.glob("win-*.json"))
+    if not artifacts:
+        raise FileNotFoundError(f"No model metadata found in {model_dir}")
+    return artifacts[-1]
+
+
+def _load_verified_bundle(bundle_path: Path, expected_sha256: Optional[str]) -> Tuple[object, object, dict]:
+    stat = bundle_path.stat()
+    path, signature = str(bundle_path.resolve()), (stat.st_size, stat.st_mtime_ns)
+    cached = _BUNDLE_CACHE.get(path)
+    if cached is None or cached[0] != signature:
+        # Drop a stale entry first, so the old model is not held while loading the new one.
+        _BUNDLE_CACHE.pop(path, None)
+        if expected_sha256 and file_sha256(bundle_path) != expected_sha256:
+            raise ValueError(f"Checksum mismatch for {bundle_path}; the bundle is corrupt or was replaced.")
+        bundle = joblib.load(bundle_path, mmap_mode="r")
+        cached = _BUNDLE_CACHE[path] = (signature, (bundle["model"], bundle["scaler"], dict(bundle["metadata"])))
+    model, scaler, metadata = cached[1]
+    return model, scaler, dict(metadata)
+
+
+def load_artifacts(model_dir: Path, version: Optional[str] = None) -> Tuple[object, object, dict]:
+    """(model, scaler, metadata) of `version`, or of the LATEST model."""
+    metadata_path = resolve_version(model_dir, version)
+    manifest = json.loads(metadata_path.read_text(encoding="utf-8"))
+    bundle_info = manifest.get("bundle")
+    if bundle_info:
+        return _load_verified_bundle(model_dir / bundle_info["file"], bundle_info.get("sha256"))
+
+    # Legacy layout: two separate pickles next to the metadata.
+    version = manifest["version"]
+    model = joblib.load(model_dir / f"{version}.joblib")
+    scaler = joblib.load(model_dir / f"{version}_scaler.joblib")
+    return model, scaler, manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect, verify or promote model artifact bundles.")
+    parser.add_argument("--model-dir", type=Path, default=Path("ml/model_artifacts"))
+    parser.add_argument("--promote", type=str, help="Point LATEST at this model version.")
+    parser.add_argument("--verify", type=str, help="Verify the checksum of this version's bundle.")
+    args = parser.parse_args()
+
+    if args.promote:
+        promote(args.model_dir, args.promote)
+        print(f"[OK] LATEST -> {args.promote}")
+    if args.verify:
+        _, _, metadata = load_artifacts(args.model_dir, args.verify)
+        print(f"[OK] {metadata['version']} verified ({metadata.get('backend', 'logistic')})")
+
+    print(f"[INFO] LATEST: {read_latest(args.model_dir) or '(not set)'}")
+    for path in sorted(args.model_dir.glob("*.json")):
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+        layout = "bundle" if manifest.get("bundle") else "legacy"
+        print(f"  {manifest.get('version', path.stem):<28} {layout:<7} {manifest.get('backend', 'logistic'):<18} {manifest.get('trained_at', '')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Race-level conditional logit (softmax over the entries of each race).
+
+Every entry gets a linear utility z = X @ coef_, and its win probability is
+exp(z) / sum(exp(z)) over the entries of its race. Scores therefore sum to
+one per race, and a `min_win_score` threshold means the same share of the
+race's win chance in an 8-runner field as in an 18-runner one.
+
+Rows are grouped by race id once (`race_segments`). After that, training and
+scoring work on contiguous segments with `np.maximum.reduceat` /
+`np.add.reduceat`: a log-sum-exp per race, and the gradient as a single
+matrix product. Both stay linear in the number of entries, with no per-race
+Python loop. Training minimises the negative log-likelihood of the winners
+plus an L2 penalty with L-BFGS. A dead heat splits the target evenly between
+the winners; races without a winner carry no likelihood and are dropped.
+
+Example:
+    model = ConditionalLogitModel().fit(X, y, race_ids)
+    scores = model.predict_proba(X_today, race_ids_today)[:, 1]
+"""
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.optimize import minimize
+
+
+def race_segments(race_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(order, starts, counts): `order` sorts rows so each race is one contiguous segment."""
+    _, inverse, counts = np.unique(np.asarray(race_ids).astype(str), return_inverse=True, return_counts=True)
+    order = np.argsort(inverse, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return order, starts, counts
+
+
+def segment_log_sum_exp(z: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Numerically stable log(sum(exp(z))) of every segment."""
+    peak = np.maximum.reduceat(z, starts)
+    return peak + np.log(np.add.reduceat(np.exp(z - np.repeat(peak, counts)), starts))
+
+
+def segment_softmax(z: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    return np.exp(z - np.repeat(segment_log_sum_exp(z, starts, counts), counts))
+
+
+class ConditionalLogitModel:
+    """Linear utilities, normalised by a softmax within each race."""
+
+    def __init__(self, C: float = 1.0, max_iter: int = 1000) -> None:
+        self.C = C
+        self.max_iter = max_iter
+        self.coef_: Optional[np.ndarray] = None
+        self.n_iter_ = 0
+
+    def fit(self, X: np.ndarray, y: np.ndarray, race_ids: np.ndarray) -> "ConditionalLogitModel":
+        order, starts, counts = race_segments(race_ids)
+        X = np.ascontiguousarray(X[order], dtype=float)
+        y = np.asarray(y, dtype=float)[order]
+
+        winners = np.add.reduceat(y, starts)
+        keep = np.repeat(winners > 0, counts)
+        if not keep.any():
+            raise ValueError("Conditional logit needs at least one race with a winner.")
+        if not keep.all():
+            X, y = X[keep], y[keep]
+            counts = counts[winners > 0]
+            winners = winners[winners > 0]
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        target = y / np.repeat(winners, counts)  # dead heats share the win
+        penalty = 1.0 / self.C
+
+        def objective(coef: np.ndarray) -> Tuple[float, np.ndarray]:
+            z = X @ coef
+            log_norm = segment_log_sum_exp(z, starts, counts)
+            loss = log_norm.sum() - target @ z + 0.5 * penalty * coef @ coef
+            prob = np.exp(z - np.repeat(log_norm, counts))
+            grad = X.T @ (prob - target) + penalty * coef
+            return loss, grad
+
+        result = minimize(
+            objective,
+            np.zeros(X.shape[1]),
+            jac=True,
+            method="L-BFGS-B",
+            options={"maxiter": self.max_iter},
+        )
+        self.coef_ = result.x
+        self.n_iter_ = int(result.nit)
+        return self
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        return np.asarray(X, dtype=float) @ self.coef_
+
+    def predict_proba(self, X: np.ndarray, race_ids: np.ndarray) -> np.ndarray:
+        """[P(lose), P(win)] per row, with P(win) summing to one within each race."""
+        if len(X) == 0:
+            return np.empty((0, 2))
+        order, starts, counts = race_segments(race_ids)
+        win = np.empty(len(order))
+        win[order] = segment_softmax(self.decision_function(X)[order], starts, counts)
+        return np.column_stack([1.0 - win, win])
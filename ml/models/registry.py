@@ -0,0 +1,230 @@
+"""Pluggable model backends for the win model.
+
+Every backend produces the same (model, scaler) pair stored in the artifact
+bundle (`ml.models.artifacts`): a classifier with `predict_proba` and a
+"scaler" that transforms the feature matrix. The backend name is recorded in
+the model metadata (`"backend"`), and `predict_win_scores` picks the matching
+feature matrix from it. `predict_today` and the prediction service therefore
+switch backends through the metadata alone.
+
+Backends:
+
+* `logistic`: StandardScaler + LogisticRegression; missing values filled
+  with 0.0 (the original baseline).
+* `hist_gb`: sklearn HistGradientBoostingClassifier. NaNs are passed
+  through and handled natively. It stops early on a time-ordered stop set
+  and trains on all cores through OpenMP, or on `threads` of them.
+* `lightgbm`: LGBMClassifier with the same NaN handling and early stopping;
+  `threads` maps to `n_jobs`. Only available when lightgbm is installed.
+* `gbm`: alias for `lightgbm` when installed, otherwise `hist_gb`.
+* `sgd`: StandardScaler + SGDClassifier (log loss). Both support
+  `partial_fit`, so `ml.models.stream_train` can fit them out of core.
+* `conditional_logit`: StandardScaler + a race-level softmax
+  (`ml.models.conditional_logit`). Fitting and scoring need the race id of
+  every row, so win scores sum to one per race.
+
+Example:
+    backend = get_backend("gbm")
+    model, scaler, info = backend.fit(X_train, y_train, X_stop, y_stop, threads=8)
+"""
+from __future__ import annotations
+
+import abc
+import importlib.util
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.preprocessing import FunctionTransformer, StandardScaler
+from threadpoolctl import threadpool_limits
+
+from ml.models.conditional_logit import ConditionalLogitModel
+
+DEFAULT_BACKEND = "logistic"
+# Boosting rounds before early stopping; the stop set decides the actual count.
+MAX_BOOSTING_ROUNDS = 1000
+EARLY_STOPPING_ROUNDS = 30
+
+
+class ModelBackend(abc.ABC):
+    """Fit / matrix conventions shared by every backend."""
+
+    name = ""
+    keeps_missing = False  # True: NaN is passed to the model instead of 0.0
+    early_stopping = False  # True: fit() uses a stop set when given one
+    race_grouped = False  # True: fit() / predict() need the race id of every row
+    incremental = False  # True: create() returns a partial_fit-capable model and scaler
+
+    def matrix(self, df: pd.DataFrame, feature_columns: List[str]) -> np.ndarray:
+        values = df[feature_columns].astype(float)
+        if not self.keeps_missing:
+            values = values.fillna(0.0)
+        return values.to_numpy(dtype=float, na_value=np.nan)
+
+    @abc.abstractmethod
+    def fit(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        X_stop: Optional[np.ndarray] = None,
+        y_stop: Optional[np.ndarray] = None,
+        threads: Optional[int] = None,
+        race_ids: Optional[np.ndarray] = None,
+    ) -> Tuple[object, object, Dict[str, object]]:
+        """Fitted (model, scaler, info); info is merged into the model metadata."""
+
+    def create(self) -> Tuple[object, object]:
+        """Unfitted (model, scaler) for incremental training."""
+        raise ValueError(f"Backend '{self.name}' cannot be trained incrementally.")
+
+    def predict(
+        self,
+        model: object,
+        scaler: object,
+        X: np.ndarray,
+        race_ids: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Win probability of every row."""
+        return model.predict_proba(scaler.transform(X))[:, 1]
+
+
+class LogisticBackend(ModelBackend):
+    name = "logistic"
+
+    def fit(self, X, y, X_stop=None, y_stop=None, threads=None, race_ids=None):
+        scaler = StandardScaler()
+        model = LogisticRegression(max_iter=1000)
+        model.fit(scaler.fit_transform(X), y)
+        return model, scaler, {}
+
+
+def _identity_scaler(X: np.ndarray) -> FunctionTransformer:
+    """Pass-through transformer stored as `{version}_scaler.joblib` for tree models."""
+    return FunctionTransformer().fit(X)
+
+
+class HistGradientBoostingBackend(ModelBackend):
+    name = "hist_gb"
+    keeps_missing = True
+    early_stopping = True
+
+    def fit(self, X, y, X_stop=None, y_stop=None, threads=None, race_ids=None):
+        use_stop = X_stop is not None and len(X_stop) > 0 and len(np.unique(y_stop)) > 1
+        model = HistGradientBoostingClassifier(
+            learning_rate=0.05,
+            max_iter=MAX_BOOSTING_ROUNDS if use_stop else 200,
+            min_samples_leaf=40,
+            l2_regularization=1.0,
+            early_stopping=use_stop,
+            n_iter_no_change=EARLY_STOPPING_ROUNDS,
+            random_state=42,
+        )
+        # OpenMP uses every core unless `threads` caps it (e.g. for parallel CV folds).
+        with threadpool_limits(limits=threads, user_api="openmp") if threads else nullcontext():
+            if use_stop:
+                model.fit(X, y, X_val=X_stop, y_val=y_stop)
+            else:
+                model.fit(X, y)
+        return model, _identity_scaler(X), {"best_iteration": int(model.n_iter_)}
+
+
+class LightGBMBackend(ModelBackend):
+    name = "lightgbm"
+    keeps_missing = True
+    early_stopping = True
+
+    def fit(self, X, y, X_stop=None, y_stop=None, threads=None, race_ids=None):
+        import lightgbm
+
+        use_stop = X_stop is not None and len(X_stop) > 0 and len(np.unique(y_stop)) > 1
+        model = lightgbm.LGBMClassifier(
+            learning_rate=0.05,
+            n_estimators=MAX_BOOSTING_ROUNDS if use_stop else 200,
+            num_leaves=31,
+            min_child_samples=40,
+            reg_lambda=1.0,
+            n_jobs=threads or -1,
+            random_state=42,
+            verbose=-1,
+        )
+        if use_stop:
+            model.fit(
+                X,
+                y,
+                eval_set=[(X_stop, y_stop)],
+                callbacks=[lightgbm.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)],
+            )
+            best = int(model.best_iteration_ or model.n_estimators)
+        else:
+            model.fit(X, y)
+            best = int(model.n_estimators)
+        return model, _identity_scaler(X), {"best_iteration": best}
+
+
+class SGDBackend(ModelBackend):
+    name = "sgd"
+    incremental = True
+
+    def create(self):
+        model = SGDClassifier(
+            loss="log_loss", alpha=1e-3, learning_rate="adaptive", eta0=0.01, max_iter=50, random_state=42
+        )
+        return model, StandardScaler()
+
+    def fit(self, X, y, X_stop=None, y_stop=None, threads=None, race_ids=None):
+        model, scaler = self.create()
+        model.fit(scaler.fit_transform(X), y)
+        return model, scaler, {"best_iteration": int(model.n_iter_)}
+
+
+class ConditionalLogitBackend(ModelBackend):
+    name = "conditional_logit"
+    race_grouped = True
+
+    def fit(self, X, y, X_stop=None, y_stop=None, threads=None, race_ids=None):
+        if race_ids is None:
+            raise ValueError("Backend 'conditional_logit' needs the RaceKey of every training row.")
+        scaler = StandardScaler()
+        model = ConditionalLogitModel().fit(scaler.fit_transform(X), y, race_ids)
+        return model, scaler, {"best_iteration": model.n_iter_}
+
+    def predict(self, model, scaler, X, race_ids=None):
+        if race_ids is None:
+            raise ValueError("Backend 'conditional_logit' needs the RaceKey of every scored row.")
+        return model.predict_proba(scaler.transform(X), race_ids)[:, 1]
+
+
+BACKENDS: Dict[str, ModelBackend] = {
+    backend.name: backend
+    for backend in (
+        LogisticBackend(),
+        HistGradientBoostingBackend(),
+        LightGBMBackend(),
+        SGDBackend(),
+        ConditionalLogitBackend(),
+    )
+}
+
+
+def lightgbm_available() -> bool:
+    return importlib.util.find_spec("lightgbm") is not None
+
+
+def available_backends() -> List[str]:
+    names = [name for name in BACKENDS if name != "lightgbm" or lightgbm_available()]
+    return [*names, "gbm"]
+
+
+def get_backend(name: Optional[str]) -> ModelBackend:
+    """Backend by name; None means the logistic baseline (artifacts without a backend tag)."""
+    key = name or DEFAULT_BACKEND
+    if key == "gbm":
+        key = "lightgbm" if lightgbm_available() else "hist_gb"
+    if key not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{name}'. Available: {available_backends()}")
+    if key == "lightgbm" and not lightgbm_available():
+        raise ValueError("Model backend 'lightgbm' requires the lightgbm package.")
+    return BACKENDS[key]
@@ -0,0 +1,228 @@
+"""Out-of-core training of the win model from feature Parquet.
+
+`train_win_model` loads the whole feature set into one float64 matrix. This
+script streams it instead: Parquet row groups (one or more per feature store
+partition) are read column-pruned and cast to float32 mini-batches of about
+`--batch-rows` rows. Only an incremental backend (`partial_fit`, e.g.
+`--backend sgd`) is trained on them, so peak memory is one batch rather than
+every season in the store.
+
+Passes over the data:
+1. RaceDate only: the race days, the time-ordered holdout cutoff (same rule
+   as `train_win_model`) and the date range of every row group;
+2. training rows: `scaler.partial_fit`;
+3. `--epochs` passes of `model.partial_fit`, with the row groups shuffled per
+   epoch and the rows shuffled within each batch;
+4. validation rows (latest race days): scored for log loss, Brier and the
+   top-pick hit rate.
+
+Row groups entirely outside the pass's side of the cutoff are never read.
+Artifacts and metadata are written as by `train_win_model`, so
+`predict_today` loads the result unchanged.
+
+Example:
+    python -m ml.models.stream_train --features ml/feature_store --backend sgd --epochs 3
+"""
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ml.models.registry import available_backends, get_backend
+from ml.models.train_win_model import (
+    SPLIT_COLUMNS,
+    holdout_cutoff,
+    save_artifacts,
+    select_feature_columns,
+    validation_metrics,
+)
+
+Unit = Tuple[Path, int]  # (Parquet file, row group)
+Batch = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]  # X (float32), y, RaceDate, RaceKey
+
+
+@dataclass
+class StreamConfig:
+    features: Path
+    backend: str = "sgd"
+    batch_rows: int = 65536
+    epochs: int = 3
+    validation_size: float = 0.2
+    seed: int = 42
+
+
+def parquet_files(path: Path) -> List[Path]:
+    """Data files of a feature Parquet file or dataset directory, in name (= date) order."""
+    if path.is_dir():
+        files = sorted(p for p in path.rglob("*.parquet") if not p.name.startswith(("_", ".")))
+        if not files:
+            raise FileNotFoundError(f"No parquet partitions found in {path}")
+        return files
+    return [path]
+
+
+def row_group_units(files: List[Path]) -> List[Unit]:
+    return [(path, group) for path in files for group in range(pq.ParquetFile(path).num_row_groups)]
+
+
+def scan_race_days(units: List[Unit]) -> Tuple[np.ndarray, Dict[Unit, Tuple[np.datetime64, np.datetime64]]]:
+    """Sorted race days of the dataset and the (min, max) RaceDate of every row group."""
+    days: set = set()
+    ranges: Dict[Unit, Tuple[np.datetime64, np.datetime64]] = {}
+    for unit in units:
+        dates = _read(unit, ["RaceDate"]).column("RaceDate").to_numpy().astype("datetime64[ns]")
+        if len(dates):
+            days.update(np.unique(dates).tolist())
+            ranges[unit] = (dates.min(), dates.max())
+    return np.array(sorted(days), dtype="datetime64[ns]"), ranges
+
+
+def _read(unit: Unit, columns: List[str]) -> pa.Table:
+    path, group = unit
+    return pq.ParquetFile(path).read_row_group(group, columns=columns)
+
+
+def _to_batch(table: pa.Table, feature_columns: List[str]) -> Batch:
+    X = np.column_stack(
+        [
+            pc.fill_null(pc.cast(table.column(column), pa.float32()), 0.0).to_numpy()
+            for column in feature_columns
+        ]
+    ).astype(np.float32, copy=False)
+    y = pc.fill_null(pc.cast(table.column("WinLabel"), pa.int8()), 0).to_numpy()
+    dates = table.column("RaceDate").to_numpy().astype("datetime64[ns]")
+    race_ids = pc.cast(table.column("RaceKey"), pa.string()).to_numpy(zero_copy_only=False).astype(str)
+    return X, y, dates, race_ids
+
+
+def iter_batches(units: List[Unit], feature_columns: List[str], batch_rows: int) -> Iterator[Batch]:
+    """float32 mini-batches of roughly `batch_rows` rows, reading one row group at a time."""
+    columns = [*feature_columns, "WinLabel", *SPLIT_COLUMNS]
+    pending: List[pa.Table] = []
+    pending_rows = 0
+    for unit in units:
+        table = _read(unit, columns)
+        pending.append(table)
+        pending_rows += table.num_rows
+        if pending_rows >= batch_rows:
+            yield _to_batch(pa.concat_tables(pending), feature_columns)
+            pending, pending_rows = [], 0
+    if pending_rows:
+        yield _to_batch(pa.concat_tables(pending), feature_columns)
+
+
+def stream_fit_win_model(cfg: StreamConfig, feature_columns: List[str]) -> Tuple[object, object, Dict[str, object]]:
+    """Fit an incremental backend batch by batch; returns (model, scaler, metrics)."""
+    backend = get_backend(cfg.backend)
+    if not backend.incremental:
+        raise ValueError(f"Backend '{backend.name}' cannot be trained out of core; use an incremental backend such as 'sgd'.")
+
+    units = row_group_units(parquet_files(cfg.features))
+    days, ranges = scan_race_days(units)
+    cutoff = holdout_cutoff(days, cfg.validation_size) if cfg.validation_size > 0 else None
+    train_units = [u for u in units if u in ranges and (cutoff is None or ranges[u][0] < cutoff)]
+    validation_units = [u for u in units if u in ranges and cutoff is not None and ranges[u][1] >= cutoff]
+
+    def training_rows(batch: Batch) -> Tuple[np.ndarray, np.ndarray]:
+        X, y, dates, _ = batch
+        if cutoff is None:
+            return X, y
+        keep = dates < cutoff
+        return X[keep], y[keep]
+
+    model, scaler = backend.create()
+    n_train = 0
+    for batch in iter_batches(train_units, feature_columns, cfg.batch_rows):
+        X, _ = training_rows(batch)
+        if len(X):
+            scaler.partial_fit(X)
+            n_train += len(X)
+    if not n_train:
+        raise ValueError("No training rows before the validation cutoff.")
+
+    rng = np.random.default_rng(cfg.seed)
+    for _ in range(max(1, cfg.epochs)):
+        order = [train_units[i] for i in rng.permutation(len(train_units))]
+        for batch in iter_batches(order, feature_columns, cfg.batch_rows):
+            X, y = training_rows(batch)
+            if len(X):
+                rows = rng.permutation(len(X))
+                model.partial_fit(scaler.transform(X[rows]), y[rows], classes=np.array([0, 1]))
+
+    metrics: Dict[str, object] = {
+        "backend": backend.name,
+        "logloss": None,
+        "n_samples": n_train,
+        "stream": {"batch_rows": cfg.batch_rows, "epochs": max(1, cfg.epochs), "row_groups": len(units)},
+    }
+    if cutoff is None:
+        return model, scaler, metrics
+
+    labels: List[np.ndarray] = []
+    scores: List[np.ndarray] = []
+    race_ids: List[np.ndarray] = []
+    for X, y, dates, races in iter_batches(validation_units, feature_columns, cfg.batch_rows):
+        keep = dates >= cutoff
+        if keep.any():
+            labels.append(y[keep])
+            scores.append(backend.predict(model, scaler, X[keep], races[keep]))
+            race_ids.append(races[keep])
+    if labels:
+        y_val = np.concatenate(labels)
+        metrics.update(validation_metrics(y_val, np.concatenate(scores), np.concatenate(race_ids)))
+        metrics["n_samples"] = n_train + len(y_val)
+    return model, scaler, metrics
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the win model out of core from feature Parquet.")
+    parser.add_argument("--features", type=Path, required=True, help="Parquet file or feature store directory.")
+    parser.add_argument("--output-dir", type=Path, default=Path("ml/model_artifacts"),
+                        help="Directory to store model artifacts.")
+    parser.add_argument("--model-version", type=str, default=None,
+                        help="Manual model version tag; defaults to timestamp.")
+    parser.add_argument("--backend", choices=[n for n in available_backends() if get_backend(n).incremental],
+                        default="sgd", help="Incremental model backend (default: sgd).")
+    parser.add_argument("--batch-rows", type=int, default=65536, help="Rows per mini-batch (default: 65536).")
+    parser.add_argument("--epochs", type=int, default=3, help="Passes over the training rows (default: 3).")
+    parser.add_argument("--validation-size", type=float, default=0.2,
+                        help="Share of the latest race days held out (default: 0.2; 0 = train on all).")
+    parser.add_argument("--seed", type=int, default=42, help="Shuffle seed.")
+    parser.add_argument("--no-promote", action="store_true",
+                        help="Store the model without pointing LATEST at it.")
+    args = parser.parse_args()
+
+    cfg = StreamConfig(
+        features=args.features,
+        backend=args.backend,
+        batch_rows=max(1, args.batch_rows),
+        epochs=args.epochs,
+        validation_size=args.validation_size,
+        seed=args.seed,
+    )
+    available = set(pq.read_schema(parquet_files(cfg.features)[0]).names)
+    missing = [c for c in ["WinLabel", *SPLIT_COLUMNS] if c not in available]
+    if missing:
+        raise ValueError(f"Feature set must include {missing}.")
+    feature_columns = select_feature_columns(available)
+
+    model, scaler, metrics = stream_fit_win_model(cfg, feature_columns)
+    version = args.model_version or datetime.utcnow().strftime("win-%Y%m%d%H%M%S")
+    save_artifacts(args.output_dir, version, model, scaler, feature_columns, metrics, not args.no_promote)
+    val_logloss = "-" if metrics["logloss"] is None else f"{metrics['logloss']:.4f}"
+    print(
+        f"[OK] model stored at {args.output_dir}, version={version}, backend={metrics['backend']}, "
+        f"rows={metrics['n_samples']}, val_logloss={val_logloss}"
+    )
+
+
+if __name__ == "__main__":
+    main()
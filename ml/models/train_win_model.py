@@ -1,93 +1,369 @@
-"""Baseline training script for win probability models.
+"""Training script for the win probability model.
 
-Currently a scaffold:
-1. Loads feature parquet from `ml/features`.
-2. Splits into train/validation.
-3. Fits a logistic regression (placeholder).
-4. Writes model + metadata into `ml/model_artifacts/`.
+1. Loads feature parquet (file or feature store directory) from `ml/features`.
+2. Runs expanding-window cross-validation over race days (`--cv-folds`) and
+   records log loss, Brier score and top-pick hit rate per fold.
+3. Fits the chosen backend (`--backend`, see `ml.models.registry`) on all but
+   the latest race days (`--validation-size`) and reports the same metrics on
+   that holdout. Boosting backends stop early on the latest race days of their
+   own training rows.
+4. Writes the artifact bundle + metadata (holdout and per-fold CV metrics)
+   into `ml/model_artifacts/` and points `LATEST` at it unless `--no-promote`
+   is given (see `ml.models.artifacts`).
+
+Splits are by race day, never by row. Every entry of a race, and every race of
+a day, lands on the same side, and validation days always come after the
+training days. Fold k trains on all days before validation block k, the way
+the model is used live. Folds are independent and run in `--workers`
+processes. Besides log loss and Brier score, each fold reports the top-pick hit
+rate: the share of validation races whose highest-scored entry won.
+
+For feature sets too large for memory, `ml.models.stream_train` fits an
+incremental backend (`sgd`) from the Parquet row groups in float32 batches.
+
+Example:
+    python -m ml.models.train_win_model --features ml/feature_store --cv-folds 5 --workers 4
+    python -m ml.models.train_win_model --features ml/feature_store --backend gbm --threads 8
+    python -m ml.models.train_win_model --features ml/feature_store --backend conditional_logit
 """
 from __future__ import annotations
 
 import argparse
-import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
-import joblib
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import log_loss
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
+import pyarrow.parquet as pq
+from sklearn.metrics import brier_score_loss, log_loss
 
+from ml.features.schema import FEATURE_SCHEMA, load_feature_frame
+from ml.models.artifacts import write_bundle
+from ml.models.registry import DEFAULT_BACKEND, available_backends, get_backend
+from ml.rank_engine import rank_config_hash
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Train baseline win probability model.")
-    parser.add_argument("--features", type=Path, required=True, help="Parquet file with engineered features.")
-    parser.add_argument("--output-dir", type=Path, default=Path("ml/model_artifacts"),
-                        help="Directory to store model artifacts.")
-    parser.add_argument("--model-version", type=str, default=None,
-                        help="Manual model version tag; defaults to timestamp.")
-    args = parser.parse_args()
+DEFAULT_FEATURES = [
+    "PreTanOdds",
+    "PreTanPopularity",
+    "TrainerStarts",
+    "TrainerWins",
+    "TrainerTop3",
+    "TrainerAvgFinish",
+    "TrainerWinRate",
+    "TrainerTop3Rate",
+    "M5Value",
+    "M6Value",
+    "IsTurf",
+    "RaceDistance",
+]
 
-    df = pd.read_parquet(args.features)
-    if "WinLabel" not in df.columns:
-        raise ValueError("Feature set must include 'WinLabel' column (1=win,0=lose).")
+# Columns the time-ordered splits need besides the features and the label.
+SPLIT_COLUMNS = ["RaceDate", "RaceKey"]
+# Share of the latest training race days used as the early-stopping set.
+EARLY_STOPPING_SHARE = 0.1
 
-    default_features = [
-        "PreTanOdds",
-        "PreTanPopularity",
-        "TrainerStarts",
-        "TrainerWins",
-        "TrainerTop3",
-        "TrainerAvgFinish",
-        "TrainerWinRate",
-        "TrainerTop3Rate",
-        "M5Value",
-        "M6Value",
-        "IsTurf",
-        "RaceDistance",
-    ]
-    feature_columns = [c for c in default_features if c in df.columns]
+
+def _first_parquet(path: Path) -> Path:
+    """Return a Parquet file to read the schema from (file or dataset directory)."""
+    if path.is_dir():
+        files = sorted(p for p in path.glob("*.parquet") if not p.name.startswith(("_", ".")))
+        if not files:
+            raise FileNotFoundError(f"No parquet partitions found in {path}")
+        return files[0]
+    return path
+
+
+def select_feature_columns(available: Iterable[str]) -> List[str]:
+    """DEFAULT_FEATURES that exist in the feature set, in declared order."""
+    present = set(available)
+    feature_columns = [c for c in DEFAULT_FEATURES if c in present]
     if not feature_columns:
         raise ValueError("No usable numeric features found in the feature set.")
+    return feature_columns
+
+
+def feature_matrix(df: pd.DataFrame, feature_columns: List[str], backend: Optional[str] = None) -> np.ndarray:
+    """Model input matrix as at training time (0-filled, or NaN kept for tree backends)."""
+    return get_backend(backend).matrix(df, feature_columns)
+
+
+def predict_win_scores(
+    df: pd.DataFrame,
+    model: object,
+    scaler: object,
+    feature_columns: List[str],
+    backend: Optional[str] = None,
+) -> np.ndarray:
+    """Win probabilities for every row of a feature frame (`backend` from the model metadata).
+
+    Race-grouped backends normalise the scores within each RaceKey.
+    """
+    model_backend = get_backend(backend)
+    race_ids = df["RaceKey"].astype(str).to_numpy() if model_backend.race_grouped else None
+    return model_backend.predict(model, scaler, model_backend.matrix(df, feature_columns), race_ids)
+
+
+def holdout_cutoff(days: np.ndarray, validation_size: float) -> np.datetime64:
+    """First validation day: the latest `validation_size` share of the sorted race days validates."""
+    if len(days) < 2:
+        raise ValueError("A time-ordered holdout needs at least two race days.")
+    return days[min(len(days) - 1, max(1, int(round(len(days) * (1.0 - validation_size)))))]
+
+
+def time_holdout_split(race_dates: pd.Series, validation_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """(train, validation) row indices: the latest `validation_size` share of race days validates."""
+    cutoff = holdout_cutoff(np.sort(race_dates.unique()), validation_size)
+    dates = race_dates.to_numpy()
+    return np.flatnonzero(dates < cutoff), np.flatnonzero(dates >= cutoff)
+
+
+def expanding_window_folds(race_dates: pd.Series, n_folds: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Expanding-window folds over race days.
+
+    The sorted race days are cut into n_folds + 1 contiguous blocks; fold k
+    validates on block k and trains on every earlier day.
+    """
+    days = np.sort(race_dates.unique())
+    if len(days) < n_folds + 1:
+        raise ValueError(f"{n_folds} folds need at least {n_folds + 1} race days; found {len(days)}.")
+    dates = race_dates.to_numpy()
+    folds: List[Tuple[np.ndarray, np.ndarray]] = []
+    for block in np.array_split(days, n_folds + 1)[1:]:
+        train = np.flatnonzero(dates < block[0])
+        validation = np.flatnonzero((dates >= block[0]) & (dates <= block[-1]))
+        folds.append((train, validation))
+    return folds
+
+
+def top_pick_hit_rate(y: np.ndarray, scores: np.ndarray, race_ids: np.ndarray) -> Optional[float]:
+    """Share of races whose highest-scored entry won."""
+    if not len(y):
+        return None
+    order = np.lexsort((-scores, race_ids))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = race_ids[order][1:] != race_ids[order][:-1]
+    return float(y[order][first].mean())
+
+
+def validation_metrics(y: np.ndarray, scores: np.ndarray, race_ids: np.ndarray) -> Dict[str, Optional[float]]:
+    return {
+        "logloss": float(log_loss(y, scores, labels=[0, 1])),
+        "brier": float(brier_score_loss(y, scores)),
+        "top_pick_hit_rate": top_pick_hit_rate(y, scores, race_ids),
+    }
+
+
+def _fit(
+    X: np.ndarray,
+    y: np.ndarray,
+    dates: Optional[np.ndarray],
+    race_ids: Optional[np.ndarray],
+    backend: str,
+    threads: Optional[int],
+) -> Tuple[object, object, Dict[str, object]]:
+    """Fit one backend; early-stopping backends hold out their latest training days."""
+    model_backend = get_backend(backend)
+    if model_backend.early_stopping and dates is not None and len(np.unique(dates)) >= 2:
+        fit_rows, stop_rows = time_holdout_split(pd.Series(dates), EARLY_STOPPING_SHARE)
+        return model_backend.fit(
+            X[fit_rows],
+            y[fit_rows],
+            X[stop_rows],
+            y[stop_rows],
+            threads=threads,
+            race_ids=None if race_ids is None else race_ids[fit_rows],
+        )
+    return model_backend.fit(X, y, threads=threads, race_ids=race_ids)
 
-    numeric_df = df[feature_columns].copy()
-    numeric_df = numeric_df.astype(float).fillna(0.0)
 
-    X = numeric_df.to_numpy(dtype=float)
+def fit_win_model(
+    df: pd.DataFrame,
+    feature_columns: List[str],
+    validation_size: float = 0.2,
+    backend: str = DEFAULT_BACKEND,
+    threads: Optional[int] = None,
+) -> Tuple[object, object, Dict[str, object]]:
+    """Fit the model and its scaler; validation_size=0 trains on every row.
+
+    With validation_size > 0 the latest race days (by RaceDate) are held out.
+    """
+    model_backend = get_backend(backend)
+    name = model_backend.name
+    X = feature_matrix(df, feature_columns, name)
     y = df["WinLabel"].astype(int).to_numpy(dtype=int)
+    dates = df["RaceDate"].to_numpy() if "RaceDate" in df.columns else None
+    race_ids = df["RaceKey"].astype(str).to_numpy() if "RaceKey" in df.columns else None
+
+    if validation_size <= 0:
+        model, scaler, info = _fit(X, y, dates, race_ids, name, threads)
+        return model, scaler, {"backend": name, "logloss": None, "n_samples": len(df), **info}
+
+    missing = [c for c in SPLIT_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Time-ordered validation needs {missing} in the feature set.")
+    train, validation = time_holdout_split(df["RaceDate"], validation_size)
+    model, scaler, info = _fit(X[train], y[train], dates[train], race_ids[train], name, threads)
+    scores = model_backend.predict(model, scaler, X[validation], race_ids[validation])
+    return model, scaler, {
+        "backend": name,
+        **validation_metrics(y[validation], scores, race_ids[validation]),
+        "n_samples": len(df),
+        **info,
+    }
+
+
+# Worker-side state; set once per process by `_init_worker`.
+_STATE: Dict[str, object] = {}
+
+
+def _init_worker(
+    X: np.ndarray,
+    y: np.ndarray,
+    race_ids: np.ndarray,
+    dates: np.ndarray,
+    backend: str,
+    threads: Optional[int],
+) -> None:
+    _STATE.update(X=X, y=y, race_ids=race_ids, dates=dates, backend=backend, threads=threads)
 
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
+
+def _run_fold(fold: Tuple[np.ndarray, np.ndarray]) -> Dict[str, Optional[float]]:
+    train, validation = fold
+    X: np.ndarray = _STATE["X"]  # type: ignore[assignment]
+    y: np.ndarray = _STATE["y"]  # type: ignore[assignment]
+    race_ids: np.ndarray = _STATE["race_ids"]  # type: ignore[assignment]
+    dates: np.ndarray = _STATE["dates"]  # type: ignore[assignment]
+    if len(np.unique(y[train])) < 2:
+        return {"logloss": None, "brier": None, "top_pick_hit_rate": None}
+    backend = get_backend(_STATE["backend"])  # type: ignore[arg-type]
+    model, scaler, _ = _fit(
+        X[train], y[train], dates[train], race_ids[train], backend.name, _STATE["threads"]  # type: ignore[arg-type]
     )
+    scores = backend.predict(model, scaler, X[validation], race_ids[validation])
+    return validation_metrics(y[validation], scores, race_ids[validation])
+
 
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_val_scaled = scaler.transform(X_val)
+def cross_validate(
+    df: pd.DataFrame,
+    feature_columns: List[str],
+    n_folds: int = 5,
+    workers: int = 1,
+    backend: str = DEFAULT_BACKEND,
+    threads: Optional[int] = None,
+) -> List[Dict[str, object]]:
+    """Expanding-window CV over race days; one metrics dict per fold."""
+    name = get_backend(backend).name
+    X = feature_matrix(df, feature_columns, name)
+    y = df["WinLabel"].astype(int).to_numpy(dtype=int)
+    race_ids = df["RaceKey"].astype(str).to_numpy()
+    dates = df["RaceDate"].to_numpy()
+    folds = expanding_window_folds(df["RaceDate"], n_folds)
 
-    model = LogisticRegression(max_iter=1000, n_jobs=-1)
-    model.fit(X_train_scaled, y_train)
-    val_pred = model.predict_proba(X_val_scaled)[:, 1]
-    val_logloss = log_loss(y_val, val_pred)
+    if workers > 1 and len(folds) > 1:
+        pool_size = min(workers, len(folds))
+        # Split the cores between concurrent folds instead of oversubscribing them.
+        fold_threads = threads or max(1, (os.cpu_count() or 1) // pool_size)
+        with ProcessPoolExecutor(
+            max_workers=pool_size,
+            initializer=_init_worker,
+            initargs=(X, y, race_ids, dates, name, fold_threads),
+        ) as pool:
+            results = list(pool.map(_run_fold, folds))
+    else:
+        _init_worker(X, y, race_ids, dates, name, threads)
+        results = [_run_fold(fold) for fold in folds]
+
+    return [
+        {
+            "fold": number,
+            "train_rows": int(len(train)),
+            "validation_rows": int(len(validation)),
+            "validation_from": str(pd.Timestamp(dates[validation].min()).date()),
+            "validation_to": str(pd.Timestamp(dates[validation].max()).date()),
+            **metrics,
+        }
+        for number, ((train, validation), metrics) in enumerate(zip(folds, results), start=1)
+    ]
 
-    output_dir = args.output_dir
-    output_dir.mkdir(parents=True, exist_ok=True)
-    version = args.model_version or datetime.utcnow().strftime("win-%Y%m%d%H%M%S")
 
-    joblib.dump(model, output_dir / f"{version}.joblib")
-    joblib.dump(scaler, output_dir / f"{version}_scaler.joblib")
+def save_artifacts(
+    output_dir: Path,
+    version: str,
+    model: object,
+    scaler: object,
+    feature_columns: List[str],
+    metrics: Dict[str, object],
+    make_latest: bool = True,
+) -> dict:
+    """Write the `{version}` artifact bundle and metadata; `make_latest` moves LATEST to it."""
     metadata = {
         "version": version,
         "trained_at": datetime.utcnow().isoformat(),
         "features": feature_columns,
-        "logloss": float(val_logloss),
-        "n_samples": len(df),
+        "feature_dtypes": {column: FEATURE_SCHEMA.get(column, "float64") for column in feature_columns},
+        "rank_rules_hash": rank_config_hash(None),
+        **metrics,
     }
-    (output_dir / f"{version}.json").write_text(json.dumps(metadata, indent=2), encoding="utf-8")
-    print(f"[OK] model stored at {output_dir}, version={version}, val_logloss={val_logloss:.4f}")
+    return write_bundle(output_dir, model, scaler, metadata, make_latest)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train baseline win probability model.")
+    parser.add_argument("--features", type=Path, required=True, help="Parquet file or feature store directory with engineered features.")
+    parser.add_argument("--output-dir", type=Path, default=Path("ml/model_artifacts"),
+                        help="Directory to store model artifacts.")
+    parser.add_argument("--model-version", type=str, default=None,
+                        help="Manual model version tag; defaults to timestamp.")
+    parser.add_argument("--cv-folds", type=int, default=5,
+                        help="Expanding-window CV folds over race days (0 = skip CV).")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for CV folds.")
+    parser.add_argument("--backend", choices=available_backends(), default=DEFAULT_BACKEND,
+                        help="Model backend (default: logistic; gbm = LightGBM if installed, else hist_gb).")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Training threads for boosting backends (default: all cores).")
+    parser.add_argument("--validation-size", type=float, default=0.2,
+                        help="Share of the latest race days held out for the stored model (default: 0.2).")
+    parser.add_argument("--no-promote", action="store_true",
+                        help="Store the model without pointing LATEST at it.")
+    args = parser.parse_args()
+
+    available = set(pq.read_schema(_first_parquet(args.features)).names)
+    if "WinLabel" not in available:
+        raise ValueError("Feature set must include 'WinLabel' column (1=win,0=lose).")
+    missing = [c for c in SPLIT_COLUMNS if c not in available]
+    if missing:
+        raise ValueError(f"Feature set must include {missing} for time-ordered validation.")
+
+    feature_columns = select_feature_columns(available)
+
+    # Only the model inputs, the label and the split keys are read from Parquet.
+    df = load_feature_frame(args.features, columns=[*feature_columns, "WinLabel", *SPLIT_COLUMNS])
+    df = df.sort_values("RaceDate", kind="stable").reset_index(drop=True)
+
+    cv_results: List[Dict[str, object]] = []
+    if args.cv_folds > 0:
+        cv_results = cross_validate(
+            df, feature_columns, args.cv_folds, max(1, args.workers), args.backend, args.threads
+        )
+        print("=== Expanding-window CV (race days) ===")
+        print(pd.DataFrame(cv_results).to_string(index=False))
+
+    model, scaler, metrics = fit_win_model(df, feature_columns, args.validation_size, args.backend, args.threads)
+    if cv_results:
+        scored = [fold for fold in cv_results if fold["logloss"] is not None]
+        metrics["cv_folds"] = cv_results
+        metrics["cv_logloss"] = float(np.mean([fold["logloss"] for fold in scored])) if scored else None
+
+    version = args.model_version or datetime.utcnow().strftime("win-%Y%m%d%H%M%S")
+    save_artifacts(args.output_dir, version, model, scaler, feature_columns, metrics, not args.no_promote)
+    val_logloss = "-" if metrics["logloss"] is None else f"{metrics['logloss']:.4f}"
+    print(
+        f"[OK] model stored at {args.output_dir}, version={version}, "
+        f"backend={metrics['backend']}, val_logloss={val_logloss}"
+    )
 
 
 if __name__ == "__main__":
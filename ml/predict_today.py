@@ -1,218 +1,35 @@
-"""Generate predictions for a specific race day and store them in predictions.db."""
+"""Generate predictions for a race day (or a span of days) and store them in predictions.db.
+
+A span is built as one feature frame, scored with a single `predict_proba`
+call and written in one upsert, so a season-long backfill loads the model
+and trainer statistics once instead of once per day.
+
+Example:
+    python -m ml.predict_today --date 2025-10-13 --scenario PRE
+    python -m ml.predict_today --date-from 2025-01-04 --date-to 2025-06-29 --scenario PRE
+"""
 from __future__ import annotations
 
 import argparse
-import json
-import operator
-import sqlite3
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-import joblib
+import numpy as np
 import pandas as pd
 
+from ml.db.create_predictions_db import connect_predictions_db
 from ml.features.build_features import FeatureConfig, build_feature_frame
-
-
-CONDITION_DISPATCH: Dict[str, Tuple[str, Any]] = {
-    "min_win_score": ("WinScore", operator.ge),
-    "max_win_score": ("WinScore", operator.le),
-    "min_m5": ("M5Value", operator.ge),
-    "max_m5": ("M5Value", operator.le),
-    "min_zm": ("ZM_VALUE", operator.ge),
-    "max_zm": ("ZM_VALUE", operator.le),
-    "min_zi": ("ZI_INDEX", operator.ge),
-    "max_zi": ("ZI_INDEX", operator.le),
-    "min_trainer_win": ("TrainerWinRate", operator.ge),
-    "max_trainer_win": ("TrainerWinRate", operator.le),
-    "min_odds": ("PreTanOdds", operator.ge),
-    "max_odds": ("PreTanOdds", operator.le),
-}
-
-GRADE_ORDER: Tuple[str, ...] = ("S", "A", "B", "C", "D", "E")
-
-DEFAULT_RANK_CONFIG: Dict[str, Any] = {
-    "fallback_grade": "E",
-    "default_invest_grades": ["S", "A"],
-    "scenarios": {
-        "PRE": {
-            "invest_grades": ["S", "A"],
-            "rules": [
-                {
-                    "grade": "S",
-                    "conditions": {
-                        "min_win_score": 0.75,
-                        "max_m5": 1.5,
-                        "min_zm": 60,
-                        "min_zi": 55,
-                        "min_trainer_win": 0.12,
-                    },
-                },
-                {
-                    "grade": "A",
-                    "conditions": {
-                        "min_win_score": 0.62,
-                        "max_m5": 2.0,
-                        "min_zm": 55,
-                        "min_zi": 50,
-                    },
-                },
-                {
-                    "grade": "B",
-                    "conditions": {
-                        "min_win_score": 0.52,
-                        "min_zm": 48,
-                    },
-                },
-                {
-                    "grade": "C",
-                    "conditions": {
-                        "min_win_score": 0.45,
-                    },
-                },
-                {
-                    "grade": "D",
-                    "conditions": {
-                        "min_win_score": 0.35,
-                    },
-                },
-            ],
-        },
-        "LIVE": {
-            "invest_grades": ["S", "A"],
-            "rules": [
-                {
-                    "grade": "S",
-                    "conditions": {
-                        "min_win_score": 0.78,
-                        "max_m5": 1.6,
-                        "min_zm": 60,
-                        "max_odds": 6.0,
-                    },
-                },
-                {
-                    "grade": "A",
-                    "conditions": {
-                        "min_win_score": 0.65,
-                        "max_m5": 2.2,
-                        "min_zm": 55,
-                        "max_odds": 12.0,
-                    },
-                },
-                {
-                    "grade": "B",
-                    "conditions": {
-                        "min_win_score": 0.55,
-                        "min_zm": 50,
-                    },
-                },
-                {
-                    "grade": "C",
-                    "conditions": {
-                        "min_win_score": 0.45,
-                    },
-                },
-                {
-                    "grade": "D",
-                    "conditions": {
-                        "min_win_score": 0.35,
-                    },
-                },
-            ],
-        },
-    },
-}
-
-
-def _deep_merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
-    result = json.loads(json.dumps(base))
-
-    def _merge(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
-        for key, value in src.items():
-            if isinstance(value, dict) and isinstance(dst.get(key), dict):
-                _merge(dst[key], value)
-            else:
-                dst[key] = value
-
-    _merge(result, override)
-    return result
-
-
-@dataclass
-class RankRule:
-    grade: str
-    conditions: Dict[str, float]
-
-    def matches(self, row: pd.Series) -> bool:
-        for key, threshold in self.conditions.items():
-            column, comparator = CONDITION_DISPATCH.get(key, (None, None))
-            if not column:
-                return False
-            value = row.get(column, pd.NA)
-            if pd.isna(value):
-                return False
-            try:
-                numeric_value = float(value)
-            except (TypeError, ValueError):
-                return False
-            if not comparator(numeric_value, float(threshold)):
-                return False
-        return True
-
-
-def load_rank_config(scenario: str, explicit_path: Optional[Path]) -> Tuple[List[RankRule], Set[str], str, str]:
-    scenario_key = scenario.upper()
-    search_paths: List[Path] = []
-    if explicit_path:
-        search_paths.append(explicit_path)
-    search_paths.extend(
-        [
-            Path("ml/config/rank_rules.json"),
-            Path("config/rank_rules.json"),
-        ]
-    )
-
-    merged_config = DEFAULT_RANK_CONFIG
-    source = "built-in defaults"
-    for candidate in search_paths:
-        if not candidate.exists():
-            continue
-        try:
-            user_config = json.loads(candidate.read_text(encoding="utf-8"))
-        except json.JSONDecodeError as exc:
-            print(f"[WARN] Failed to parse rank rule config at {candidate}: {exc}. Continuing with defaults.")
-            continue
-        merged_config = _deep_merge(DEFAULT_RANK_CONFIG, user_config)
-        source = str(candidate)
-        break
-
-    scenario_map = merged_config.get("scenarios", {})
-    scenario_data = scenario_map.get(scenario_key) or scenario_map.get("DEFAULT", {})
-
-    default_invest = {grade.upper() for grade in merged_config.get("default_invest_grades", ["S", "A"])}
-    invest_grades = {grade.upper() for grade in scenario_data.get("invest_grades", list(default_invest))}
-    fallback_grade = scenario_data.get("fallback_grade", merged_config.get("fallback_grade", "E")).upper()
-
-    rules: List[RankRule] = []
-    for entry in scenario_data.get("rules", []):
-        grade = str(entry.get("grade", fallback_grade)).upper()
-        conditions_raw = entry.get("conditions", {})
-        conditions: Dict[str, float] = {}
-        for key, threshold in conditions_raw.items():
-            if key not in CONDITION_DISPATCH:
-                raise ValueError(f"Unknown rank condition '{key}' for scenario '{scenario_key}'.")
-            conditions[key] = float(threshold)
-        rules.append(RankRule(grade=grade, conditions=conditions))
-
-    return rules, invest_grades, fallback_grade, source
-
-
-def assign_rank_grade(row: pd.Series, cfg: "PredictionConfig") -> str:
-    for rule in cfg.rank_rules:
-        if rule.matches(row):
-            return rule.grade
-    return cfg.fallback_grade
+from ml.features.feature_store import FeatureStore
+from ml.models.artifacts import load_artifacts
+from ml.models.train_win_model import predict_win_scores
+from ml.rank_engine import (
+    GRADE_ORDER,
+    RankRule,
+    assign_rank_grades,
+    load_rank_config,
+    rank_config_hash,
+)
 
 
 def format_grade_distribution(grades: Iterable[str], invest_grades: Set[str]) -> str:
@@ -240,85 +57,167 @@ class PredictionConfig:
     model_dir: Path
     model_version: Optional[str]
     scenario: str
-    target_date: str  # YYYY-MM-DD
+    target_date: str  # YYYY-MM-DD (first date of a span)
     rank_rules: List[RankRule]
     invest_grades: Set[str]
     fallback_grade: str
     rank_config_source: str
+    date_to: Optional[str] = None  # YYYY-MM-DD, inclusive; None for a single day
+
+    def date_label(self) -> str:
+        if self.date_to and self.date_to != self.target_date:
+            return f"{self.target_date}..{self.date_to}"
+        return self.target_date
 
 
 def load_model_artifacts(config: PredictionConfig) -> Tuple[object, object, dict]:
-    artifacts = sorted(config.model_dir.glob("win-*.json"))
-    if not artifacts:
-        raise FileNotFoundError(f"No model metadata found in {config.model_dir}")
-
-    if config.model_version:
-        metadata_path = config.model_dir / f"{config.model_version}.json"
-        if not metadata_path.exists():
-            raise FileNotFoundError(f"Specified model version metadata not found: {metadata_path}")
+    """Model bundle of `model_version`, or of the model LATEST points at (cached per process)."""
+    return load_artifacts(config.model_dir, config.model_version)
+
+
+PREDICTION_COLUMNS: Tuple[str, ...] = (
+    "Year",
+    "MonthDay",
+    "JyoCD",
+    "RaceNum",
+    "Umaban",
+    "Scenario",
+    "WinScore",
+    "PlaceScore",
+    "Odds",
+    "InvestFlag",
+    "RankGrade",
+    "M5Value",
+    "TrainerScore",
+    "ModelVersion",
+)
+
+STAGING_SQL = f"""
+CREATE TEMP TABLE IF NOT EXISTS PredictionsStaging (
+    {", ".join(PREDICTION_COLUMNS)}
+)
+"""
+
+# `WHERE true` keeps SQLite from parsing ON CONFLICT as part of the SELECT's join.
+MERGE_STAGING_SQL = f"""
+INSERT INTO Predictions ({", ".join(PREDICTION_COLUMNS)})
+SELECT {", ".join(PREDICTION_COLUMNS)} FROM temp.PredictionsStaging WHERE true
+ON CONFLICT(Year, MonthDay, JyoCD, RaceNum, Umaban, Scenario, ModelVersion)
+DO UPDATE SET
+    WinScore=excluded.WinScore,
+    PlaceScore=excluded.PlaceScore,
+    Odds=excluded.Odds,
+    InvestFlag=excluded.InvestFlag,
+    RankGrade=excluded.RankGrade,
+    M5Value=excluded.M5Value,
+    TrainerScore=excluded.TrainerScore,
+    UpdatedAt=datetime('now')
+"""
+
+
+def _nullable_float(series: pd.Series) -> np.ndarray:
+    """Float column as an object array with None for NaN.
+
+    float32 feature columns go through their shortest decimal repr, so an
+    odds of 19.2 is stored as 19.2 rather than 19.200000762939453.
+    """
+    values = pd.to_numeric(series, errors="coerce")
+    if values.dtype == np.float32:
+        array = values.to_numpy(dtype=np.float32).astype(str).astype(np.float64)
     else:
-        metadata_path = artifacts[-1]
+        array = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    result = array.astype(object)
+    result[np.isnan(array)] = None
+    return result
 
-    metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
-    version = metadata["version"]
-    model = joblib.load(config.model_dir / f"{version}.joblib")
-    scaler = joblib.load(config.model_dir / f"{version}_scaler.joblib")
-    metadata["version"] = version
-    return model, scaler, metadata
+
+def _nullable_text(series: pd.Series) -> np.ndarray:
+    values = series.astype(object).to_numpy()
+    missing = pd.isna(values)
+    result = values.astype(str).astype(object)
+    result[missing] = None
+    return result
 
 
-def upsert_predictions(df: pd.DataFrame, metadata: dict, cfg: PredictionConfig) -> None:
+def prediction_rows(df: pd.DataFrame, metadata: dict, scenario: str) -> Iterable[tuple]:
+    """Predictions parameter tuples in PREDICTION_COLUMNS order, built column-wise."""
+    size = len(df)
+    columns: Dict[str, np.ndarray] = {
+        "Year": _nullable_text(df["Year"]),
+        "MonthDay": _nullable_text(df["MonthDay"]),
+        "JyoCD": _nullable_text(df["JyoCD"]),
+        "RaceNum": _nullable_text(df["RaceNum"]),
+        "Umaban": _nullable_text(df["Umaban"]),
+        "Scenario": np.full(size, scenario, dtype=object),
+        "WinScore": _nullable_float(df["WinScore"]),
+        "PlaceScore": np.full(size, None, dtype=object),
+        "Odds": _nullable_float(df["PreTanOdds"]),
+        "InvestFlag": df["InvestFlag"].to_numpy(dtype=np.int64).astype(object),
+        "RankGrade": _nullable_text(df["RankGrade"]),
+        "M5Value": _nullable_float(df["M5Value"]),
+        "TrainerScore": _nullable_float(df["TrainerWinRate"]),
+        "ModelVersion": np.full(size, metadata["version"], dtype=object),
+    }
+    return zip(*(columns[column] for column in PREDICTION_COLUMNS))
+
+
+def upsert_predictions(df: pd.DataFrame, metadata: dict, cfg: PredictionConfig) -> int:
+    """Stage all rows in a temp table, then merge them with one INSERT ... ON CONFLICT."""
     cfg.predictions_db.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(cfg.predictions_db)
+    conn = connect_predictions_db(cfg.predictions_db)
+    placeholders = ", ".join("?" for _ in PREDICTION_COLUMNS)
     try:
-        rows = []
-        for _, row in df.iterrows():
-            rows.append(
-                (
-                    row["Year"],
-                    row["MonthDay"],
-                    row["JyoCD"],
-                    row["RaceNum"],
-                    row["Umaban"],
-                    cfg.scenario,
-                    float(row["WinScore"]) if not pd.isna(row["WinScore"]) else None,
-                    None,
-                    float(row["PreTanOdds"]) if not pd.isna(row["PreTanOdds"]) else None,
-                    int(row["InvestFlag"]),
-                    str(row["RankGrade"]) if not pd.isna(row["RankGrade"]) else None,
-                    float(row["M5Value"]) if not pd.isna(row["M5Value"]) else None,
-                    float(row["TrainerWinRate"]) if not pd.isna(row["TrainerWinRate"]) else None,
-                    metadata["version"],
-                )
-            )
-
         with conn:
+            conn.execute(STAGING_SQL)
+            conn.execute("DELETE FROM temp.PredictionsStaging")
             conn.executemany(
-                """
-                INSERT INTO Predictions
-                (Year, MonthDay, JyoCD, RaceNum, Umaban, Scenario,
-                 WinScore, PlaceScore, Odds, InvestFlag, RankGrade, M5Value, TrainerScore, ModelVersion)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(Year, MonthDay, JyoCD, RaceNum, Umaban, Scenario, ModelVersion)
-                DO UPDATE SET
-                    WinScore=excluded.WinScore,
-                    PlaceScore=excluded.PlaceScore,
-                    Odds=excluded.Odds,
-                    InvestFlag=excluded.InvestFlag,
-                    RankGrade=excluded.RankGrade,
-                    M5Value=excluded.M5Value,
-                    TrainerScore=excluded.TrainerScore,
-                    UpdatedAt=datetime('now')
-                """,
-                rows,
+                f"INSERT INTO temp.PredictionsStaging VALUES ({placeholders})",
+                prediction_rows(df, metadata, cfg.scenario),
             )
+            conn.execute(MERGE_STAGING_SQL)
+            conn.execute("DELETE FROM temp.PredictionsStaging")
     finally:
         conn.close()
+    return len(df)
+
+
+def score_features(
+    features: pd.DataFrame,
+    model: object,
+    scaler: object,
+    metadata: dict,
+    cfg: PredictionConfig,
+) -> pd.DataFrame:
+    """Add WinScore, RankGrade and InvestFlag columns to a feature frame."""
+    selected_cols = metadata.get("features", [])
+    missing_cols = [c for c in selected_cols if c not in features.columns]
+    if missing_cols:
+        raise ValueError(f"Missing columns in feature set: {missing_cols}")
+
+    features["WinScore"] = predict_win_scores(features, model, scaler, selected_cols, metadata.get("backend"))
+    features["RankGrade"] = assign_rank_grades(features, cfg.rank_rules, cfg.fallback_grade)
+    features["InvestFlag"] = features["RankGrade"].isin(cfg.invest_grades).astype(int)
+    return features
+
+
+def print_prediction_summary(features: pd.DataFrame, cfg: PredictionConfig) -> None:
+    total_entries = len(features)
+    invest_total = int(features["InvestFlag"].sum())
+    grade_summary = format_grade_distribution(features["RankGrade"], cfg.invest_grades)
+    print(f"[INFO] rank config source: {cfg.rank_config_source}")
+    print(f"[INFO] grade distribution: {grade_summary}")
+    print(
+        f"[INFO] invest selections (grades {', '.join(sorted(cfg.invest_grades))}): "
+        f"{invest_total}/{total_entries}"
+    )
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Predict race outcomes and populate predictions.db.")
-    parser.add_argument("--date", required=True, help="Target date (YYYY-MM-DD)")
+    date_group = parser.add_mutually_exclusive_group(required=True)
+    date_group.add_argument("--date", help="Target date (YYYY-MM-DD)")
+    date_group.add_argument("--date-from", help="First date of a span (YYYY-MM-DD); use with --date-to")
+    parser.add_argument("--date-to", help="Last date of a span, inclusive (YYYY-MM-DD; default: --date-from)")
     parser.add_argument("--ecore", type=Path, default=Path("envs/cursor/my_keiba/ecore.db"))
     parser.add_argument("--excel", type=Path, default=Path("envs/cursor/my_keiba/excel_data.db"))
     parser.add_argument("--pred-db", type=Path, default=Path("envs/cursor/my_keiba/predictions.db"))
@@ -330,7 +229,23 @@ def main() -> None:
         type=Path,
         help="Optional path to rank rule configuration JSON (defaults to ml/config/rank_rules.json).",
     )
+    parser.add_argument(
+        "--feature-store",
+        type=Path,
+        help=(
+            "Optional feature store directory; the date's partition is refreshed only when its sources changed. "
+            "LIVE runs reuse the stored static features and reload odds only."
+        ),
+    )
     args = parser.parse_args()
+    if args.date_to and not args.date_from:
+        parser.error("--date-to requires --date-from")
+
+    date_from = args.date or args.date_from
+    date_to = args.date or args.date_to or date_from
+    if date_to < date_from:
+        parser.error("--date-to must not be earlier than --date-from")
+    single_day = date_from == date_to
 
     scenario = args.scenario.upper()
     rank_rules, invest_grades, fallback_grade, rank_source = load_rank_config(scenario, args.rank_rules)
@@ -342,50 +257,47 @@ def main() -> None:
         model_dir=args.model_dir,
         model_version=args.model_version,
         scenario=scenario,
-        target_date=args.date,
+        target_date=date_from,
         rank_rules=rank_rules,
         invest_grades=invest_grades,
         fallback_grade=fallback_grade,
         rank_config_source=rank_source,
+        date_to=date_to,
     )
 
     model, scaler, metadata = load_model_artifacts(cfg)
+    trained_hash = metadata.get("rank_rules_hash")
+    if trained_hash and trained_hash != rank_config_hash(args.rank_rules):
+        print(f"[WARN] Rank rules ({rank_source}) differ from those recorded with model {metadata['version']}.")
 
     feature_cfg = FeatureConfig(
         ecore_db=cfg.ecore_db,
         excel_db=cfg.excel_db if cfg.excel_db.exists() else None,
         output_path=None,
-        target_date=cfg.target_date,
+        target_date=date_from if single_day else None,
+        date_from=None if single_day else date_from,
+        date_to=None if single_day else date_to,
     )
-    features = build_feature_frame(feature_cfg)
+    if args.feature_store and cfg.scenario == "LIVE" and single_day:
+        # Intraday re-runs: reuse the static snapshot, reload odds only.
+        features = FeatureStore(args.feature_store).load_live(feature_cfg)
+    elif args.feature_store:
+        store = FeatureStore(args.feature_store)
+        store.refresh(feature_cfg)
+        features = store.load(date_from, date_to)
+    else:
+        features = build_feature_frame(feature_cfg)
     if features.empty:
-        print("[WARN] No entries found for the target date.")
+        print(f"[WARN] No entries found for {cfg.date_label()}.")
         return
 
-    selected_cols = metadata.get("features", [])
-    missing_cols = [c for c in selected_cols if c not in features.columns]
-    if missing_cols:
-        raise ValueError(f"Missing columns in feature set: {missing_cols}")
-
-    X = features[selected_cols].astype(float).fillna(0.0).to_numpy()
-    X_scaled = scaler.transform(X)
-    win_scores = model.predict_proba(X_scaled)[:, 1]
-    features["WinScore"] = win_scores
-    features["RankGrade"] = features.apply(lambda row: assign_rank_grade(row, cfg), axis=1)
-    features["InvestFlag"] = features["RankGrade"].isin(cfg.invest_grades).astype(int)
-
-    total_entries = len(features)
-    invest_total = int(features["InvestFlag"].sum())
-    grade_summary = format_grade_distribution(features["RankGrade"], cfg.invest_grades)
-    print(f"[INFO] rank config source: {cfg.rank_config_source}")
-    print(f"[INFO] grade distribution: {grade_summary}")
-    print(
-        f"[INFO] invest selections (grades {', '.join(sorted(cfg.invest_grades))}): "
-        f"{invest_total}/{total_entries}"
-    )
+    features = score_features(features, model, scaler, metadata, cfg)
+    if not single_day:
+        print(f"[INFO] {features['RaceDate'].nunique()} race day(s), {len(features)} entries")
+    print_prediction_summary(features, cfg)
 
     upsert_predictions(features, metadata, cfg)
-    print(f"[OK] predictions stored for {cfg.target_date} ({cfg.scenario}) using model {metadata['version']}")
+    print(f"[OK] predictions stored for {cfg.date_label()} ({cfg.scenario}) using model {metadata['version']}")
 
 
 if __name__ == "__main__":
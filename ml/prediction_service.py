@@ -0,0 +1,372 @@
+"""Resident prediction service for JVMonitor.
+
+Spawning `python -m ml.predict_today` per request pays interpreter start-up,
+pandas/sklearn imports, model loading and a full feature build every time.
+This module keeps one process alive instead. It holds the model, scaler,
+rank rules and the static feature snapshot of each requested date in memory.
+Each request re-reads only N_ODDS_TANPUKU and re-scores. A cached snapshot is
+revalidated against its static fingerprint (card, marks window, trainer
+history; no results or odds) at most every `STATIC_RECHECK_SECONDS`.
+
+The server listens on a loopback TCP port and speaks JSON lines: one request
+object per line, one response object per line. Commands:
+
+    {"cmd": "ping"}
+    {"cmd": "predict", "date": "2025-10-13", "scenario": "LIVE",
+     "jyo": "05", "race": "11", "store": true}
+    {"cmd": "reload"}      # re-read model artifacts and rank rules
+    {"cmd": "shutdown"}
+
+`date_to` may be added to `predict` to score a span of days in one request.
+
+Example:
+    python -m ml.prediction_service serve --feature-store ml/feature_store
+    python -m ml.prediction_service request --date 2025-10-13 --scenario LIVE --race 11
+    python -m ml.prediction_service request --cmd shutdown
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import socketserver
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from ml.features.build_features import (
+    FeatureConfig,
+    attach_odds,
+    build_feature_frame,
+    connect_db,
+    load_odds_frame,
+)
+from ml.features.feature_store import FeatureStore, static_fingerprints
+from ml.features.schema import apply_schema
+from ml.predict_today import (
+    PredictionConfig,
+    format_grade_distribution,
+    load_model_artifacts,
+    score_features,
+    upsert_predictions,
+)
+from ml.rank_engine import RankRule, load_rank_config
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Static snapshots kept in memory; older dates are evicted first.
+MAX_CACHED_DATES = 64
+# A cached snapshot's static fingerprint is re-checked at most this often.
+STATIC_RECHECK_SECONDS = 30.0
+
+RESPONSE_COLUMNS: Tuple[str, ...] = (
+    "Year",
+    "MonthDay",
+    "JyoCD",
+    "RaceNum",
+    "Umaban",
+    "Bamei",
+    "WinScore",
+    "RankGrade",
+    "InvestFlag",
+    "PreTanOdds",
+    "PreTanPopularity",
+    "M5Value",
+    "ZM_VALUE",
+    "ZI_INDEX",
+)
+
+
+@dataclass
+class ServiceConfig:
+    ecore_db: Path
+    excel_db: Optional[Path]
+    predictions_db: Path
+    model_dir: Path
+    model_version: Optional[str]
+    rank_rules_path: Optional[Path]
+    feature_store: Optional[Path]
+
+
+def _daterange(date_from: str, date_to: str) -> List[str]:
+    start, end = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    return [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1)]
+
+
+def _json_value(value: Any) -> Any:
+    if pd.isna(value):
+        return None
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+class PredictionService:
+    """Warm model + per-date static features; thread-safe scoring entry point."""
+
+    def __init__(self, config: ServiceConfig) -> None:
+        self.config = config
+        self.store = FeatureStore(config.feature_store) if config.feature_store else None
+        self._lock = threading.RLock()
+        self._static: Dict[str, Tuple[str, pd.DataFrame, float]] = {}  # date -> (fingerprint, snapshot, checked)
+        self._rank_configs: Dict[str, Tuple[List[RankRule], set, str, str]] = {}
+        self.reload()
+
+    def reload(self) -> str:
+        """(Re)load model artifacts and forget cached rank rules."""
+        with self._lock:
+            probe = self._prediction_config("PRE", "")
+            self.model, self.scaler, self.metadata = load_model_artifacts(probe)
+            self._rank_configs.clear()
+            return self.metadata["version"]
+
+    def _feature_config(self, target_date: str) -> FeatureConfig:
+        excel_db = self.config.excel_db if self.config.excel_db and self.config.excel_db.exists() else None
+        return FeatureConfig(ecore_db=self.config.ecore_db, excel_db=excel_db, output_path=None, target_date=target_date)
+
+    def _prediction_config(self, scenario: str, target_date: str) -> PredictionConfig:
+        if scenario not in self._rank_configs:
+            self._rank_configs[scenario] = load_rank_config(scenario, self.config.rank_rules_path)
+        rank_rules, invest_grades, fallback_grade, rank_source = self._rank_configs[scenario]
+        return PredictionConfig(
+            ecore_db=self.config.ecore_db,
+            excel_db=self.config.excel_db,
+            predictions_db=self.config.predictions_db,
+            model_dir=self.config.model_dir,
+            model_version=self.config.model_version,
+            scenario=scenario,
+            target_date=target_date,
+            rank_rules=rank_rules,
+            invest_grades=invest_grades,
+            fallback_grade=fallback_grade,
+            rank_config_source=rank_source,
+        )
+
+    def _static_features(self, feature_cfg: FeatureConfig) -> pd.DataFrame:
+        """Static snapshot for one date, rebuilt only when its card, marks or trainer history changed."""
+        key = feature_cfg.target_date.replace("-", "")
+        checked = time.monotonic()
+        cached = self._static.get(key)
+        if cached is not None and checked - cached[2] < STATIC_RECHECK_SECONDS:
+            return cached[1]
+        static = static_fingerprints(feature_cfg).get(key)
+        if static is None:
+            self._static.pop(key, None)
+            return pd.DataFrame()
+        if cached is not None and cached[0] == static:
+            self._static[key] = (static, cached[1], checked)
+            return cached[1]
+
+        if self.store is not None:
+            static, snapshot = self.store.load_static(feature_cfg)
+        else:
+            snapshot = build_feature_frame(feature_cfg)
+            # The build refreshed the trainer stats, which can move the fingerprint on.
+            static = static_fingerprints(feature_cfg).get(key, static)
+        self._static[key] = (static, snapshot, checked)
+        while len(self._static) > MAX_CACHED_DATES:
+            self._static.pop(min(self._static))
+        return snapshot
+
+    def features_for(self, target_date: str) -> pd.DataFrame:
+        """Cached static features for one date with freshly read odds."""
+        feature_cfg = self._feature_config(target_date)
+        snapshot = self._static_features(feature_cfg)
+        if snapshot.empty:
+            return snapshot
+        conn = connect_db(feature_cfg.ecore_db, read_only=True)
+        try:
+            odds = load_odds_frame(conn, feature_cfg)
+        finally:
+            conn.close()
+        return apply_schema(attach_odds(snapshot, odds))
+
+    def predict(
+        self,
+        target_date: str,
+        scenario: str = "PRE",
+        date_to: Optional[str] = None,
+        jyo: Optional[str] = None,
+        race: Optional[str] = None,
+        store: bool = False,
+    ) -> Dict[str, Any]:
+        scenario = scenario.upper()
+        started = time.perf_counter()
+        with self._lock:
+            frames = []
+            for day in _daterange(target_date, date_to or target_date):
+                features = self.features_for(day)
+                if jyo and not features.empty:
+                    features = features[features["JyoCD"].astype(str).str.zfill(2) == str(jyo).zfill(2)]
+                if race and not features.empty:
+                    features = features[features["RaceNum"].astype(str).str.zfill(2) == str(race).zfill(2)]
+                if not features.empty:
+                    frames.append(features)
+            if not frames:
+                return {
+                    "ok": True,
+                    "model_version": self.metadata["version"],
+                    "scenario": scenario,
+                    "grades": "",
+                    "stored": False,
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "rows": [],
+                }
+
+            # The whole span is scored in one predict_proba call and stored in one upsert.
+            cfg = self._prediction_config(scenario, target_date)
+            scored = score_features(
+                apply_schema(pd.concat(frames, ignore_index=True)), self.model, self.scaler, self.metadata, cfg
+            )
+            if store:
+                upsert_predictions(scored, self.metadata, cfg)
+
+        columns = [c for c in RESPONSE_COLUMNS if c in scored.columns]
+        rows = [
+            {column: _json_value(value) for column, value in zip(columns, values)}
+            for values in scored[columns].itertuples(index=False, name=None)
+        ]
+        return {
+            "ok": True,
+            "model_version": self.metadata["version"],
+            "scenario": scenario,
+            "grades": format_grade_distribution(scored["RankGrade"], cfg.invest_grades),
+            "stored": bool(store),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "rows": rows,
+        }
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        command = str(request.get("cmd", "predict")).lower()
+        if command == "ping":
+            return {"ok": True, "model_version": self.metadata["version"], "cached_dates": sorted(self._static)}
+        if command == "reload":
+            return {"ok": True, "model_version": self.reload()}
+        if command == "predict":
+            if not request.get("date"):
+                raise ValueError("'date' is required for predict.")
+            return self.predict(
+                request["date"],
+                scenario=request.get("scenario", "PRE"),
+                date_to=request.get("date_to"),
+                jyo=request.get("jyo"),
+                race=request.get("race"),
+                store=bool(request.get("store", False)),
+            )
+        raise ValueError(f"Unknown command '{command}'.")
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if str(request.get("cmd", "")).lower() == "shutdown":
+                    response: Dict[str, Any] = {"ok": True}
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                else:
+                    response = self.server.service.handle(request)
+            except Exception as exc:  # 1 リクエストの失敗でサーバーを落とさない
+                response = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class PredictionServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: PredictionService) -> None:
+        super().__init__(address, _RequestHandler)
+        self.service = service
+
+
+def send_request(request: Dict[str, Any], host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 300.0) -> Dict[str, Any]:
+    """Send one JSON request to a running service and return its response."""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("Prediction service closed the connection without a response.")
+    return json.loads(line)
+
+
+def _serve(args: argparse.Namespace) -> None:
+    service = PredictionService(
+        ServiceConfig(
+            ecore_db=args.ecore,
+            excel_db=args.excel,
+            predictions_db=args.pred_db,
+            model_dir=args.model_dir,
+            model_version=args.model_version,
+            rank_rules_path=args.rank_rules,
+            feature_store=args.feature_store,
+        )
+    )
+    with PredictionServer((args.host, args.port), service) as server:
+        print(f"[OK] prediction service listening on {args.host}:{args.port} (model {service.metadata['version']})")
+        server.serve_forever()
+    print("[INFO] prediction service stopped")
+
+
+def _request(args: argparse.Namespace) -> None:
+    request: Dict[str, Any] = {"cmd": args.cmd}
+    if args.cmd == "predict":
+        if not args.date:
+            raise SystemExit("--date is required for predict")
+        request.update(
+            {"date": args.date, "date_to": args.date_to, "scenario": args.scenario, "jyo": args.jyo, "race": args.race, "store": args.store}
+        )
+    response = send_request(request, args.host, args.port)
+    if args.json or args.cmd != "predict" or not response.get("ok"):
+        print(json.dumps(response, ensure_ascii=False, indent=2))
+        return
+
+    rows = pd.DataFrame(response["rows"])
+    if not rows.empty:
+        print(rows.to_string(index=False))
+    print(f"[INFO] grade distribution: {response.get('grades') or '-'}")
+    print(f"[OK] {len(rows)} entries scored with {response['model_version']} in {response.get('elapsed_ms', '-')} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Resident prediction service and its client.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="Start the service (blocks until shutdown).")
+    serve.add_argument("--ecore", type=Path, default=Path("envs/cursor/my_keiba/ecore.db"))
+    serve.add_argument("--excel", type=Path, default=Path("envs/cursor/my_keiba/excel_data.db"))
+    serve.add_argument("--pred-db", type=Path, default=Path("envs/cursor/my_keiba/predictions.db"))
+    serve.add_argument("--model-dir", type=Path, default=Path("ml/model_artifacts"))
+    serve.add_argument("--model-version", type=str)
+    serve.add_argument("--rank-rules", type=Path, help="Optional rank rule configuration JSON.")
+    serve.add_argument("--feature-store", type=Path, help="Optional feature store directory for static snapshots.")
+    serve.set_defaults(func=_serve)
+
+    request = subparsers.add_parser("request", help="Send one request to a running service.")
+    request.add_argument("--cmd", choices=["predict", "ping", "reload", "shutdown"], default="predict")
+    request.add_argument("--date", help="Target date (YYYY-MM-DD)")
+    request.add_argument("--date-to", help="Optional last date for a span (YYYY-MM-DD)")
+    request.add_argument("--scenario", default="PRE")
+    request.add_argument("--jyo", help="Optional JyoCD filter")
+    request.add_argument("--race", help="Optional RaceNum filter")
+    request.add_argument("--store", action="store_true", help="Also upsert the scores into predictions.db.")
+    request.add_argument("--json", action="store_true", help="Print the raw JSON response.")
+    request.set_defaults(func=_request)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Rank-rule definitions and a vectorised grading engine.
+
+Rules come from `DEFAULT_RANK_CONFIG` merged with `ml/config/rank_rules.json`.
+Each rule is a set of threshold conditions (see `CONDITION_DISPATCH`); the
+first rule whose conditions all hold assigns its grade. `assign_rank_grades`
+evaluates every rule as a boolean column mask and resolves first-match-wins
+with `np.select`, so whole backtests are graded in one pass. A missing column
+or a NaN value fails the condition, as with the row-wise `RankRule.matches`.
+
+Example:
+    rules, invest_grades, fallback, _ = load_rank_config("PRE", None)
+    frame["RankGrade"] = assign_rank_grades(frame, rules, fallback)
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import operator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+CONDITION_DISPATCH: Dict[str, Tuple[str, Any]] = {
+    "min_win_score": ("WinScore", operator.ge),
+    "max_win_score": ("WinScore", operator.le),
+    "min_m5": ("M5Value", operator.ge),
+    "max_m5": ("M5Value", operator.le),
+    "min_zm": ("ZM_VALUE", operator.ge),
+    "max_zm": ("ZM_VALUE", operator.le),
+    "min_zi": ("ZI_INDEX", operator.ge),
+    "max_zi": ("ZI_INDEX", operator.le),
+    "min_trainer_win": ("TrainerWinRate", operator.ge),
+    "max_trainer_win": ("TrainerWinRate", operator.le),
+    "min_odds": ("PreTanOdds", operator.ge),
+    "max_odds": ("PreTanOdds", operator.le),
+}
+
+GRADE_ORDER: Tuple[str, ...] = ("S", "A", "B", "C", "D", "E")
+
+DEFAULT_RANK_CONFIG: Dict[str, Any] = {
+    "fallback_grade": "E",
+    "default_invest_grades": ["S", "A"],
+    "scenarios": {
+        "PRE": {
+            "invest_grades": ["S", "A"],
+            "rules": [
+                {
+                    "grade": "S",
+                    "conditions": {
+                        "min_win_score": 0.75,
+                        "max_m5": 1.5,
+                        "min_zm": 60,
+                        "min_zi": 55,
+                        "min_trainer_win": 0.12,
+                    },
+                },
+                {
+                    "grade": "A",
+                    "conditions": {
+                        "min_win_score": 0.62,
+                        "max_m5": 2.0,
+                        "min_zm": 55,
+                        "min_zi": 50,
+                    },
+                },
+                {
+                    "grade": "B",
+                    "conditions": {
+                        "min_win_score": 0.52,
+                        "min_zm": 48,
+                    },
+                },
+                {
+                    "grade": "C",
+                    "conditions": {
+                        "min_win_score": 0.45,
+                    },
+                },
+                {
+                    "grade": "D",
+                    "conditions": {
+                        "min_win_score": 0.35,
+                    },
+                },
+            ],
+        },
+        "LIVE": {
+            "invest_grades": ["S", "A"],
+            "rules": [
+                {
+                    "grade": "S",
+                    "conditions": {
+                        "min_win_score": 0.78,
+                        "max_m5": 1.6,
+                        "min_zm": 60,
+                        "max_odds": 6.0,
+                    },
+                },
+                {
+                    "grade": "A",
+                    "conditions": {
+                        "min_win_score": 0.65,
+                        "max_m5": 2.2,
+                        "min_zm": 55,
+                        "max_odds": 12.0,
+                    },
+                },
+                {
+                    "grade": "B",
+                    "conditions": {
+                        "min_win_score": 0.55,
+                        "min_zm": 50,
+                    },
+                },
+                {
+                    "grade": "C",
+                    "conditions": {
+                        "min_win_score": 0.45,
+                    },
+                },
+                {
+                    "grade": "D",
+                    "conditions": {
+                        "min_win_score": 0.35,
+                    },
+                },
+            ],
+        },
+    },
+}
+
+
+def _deep_merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    result = json.loads(json.dumps(base))
+
+    def _merge(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
+        for key, value in src.items():
+            if isinstance(value, dict) and isinstance(dst.get(key), dict):
+                _merge(dst[key], value)
+            else:
+                dst[key] = value
+
+    _merge(result, override)
+    return result
+
+
+@dataclass
+class RankRule:
+    grade: str
+    conditions: Dict[str, float]
+
+    def matches(self, row: pd.Series) -> bool:
+        for key, threshold in self.conditions.items():
+            column, comparator = CONDITION_DISPATCH.get(key, (None, None))
+            if not column:
+                return False
+            value = row.get(column, pd.NA)
+            if pd.isna(value):
+                return False
+            try:
+                numeric_value = float(value)
+            except (TypeError, ValueError):
+                return False
+            if not comparator(numeric_value, float(threshold)):
+                return False
+        return True
+
+    def mask(self, frame: pd.DataFrame, columns: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """Boolean mask of the rows this rule matches (vectorised `matches`)."""
+        columns = {} if columns is None else columns
+        result = np.ones(len(frame), dtype=bool)
+        for key, threshold in self.conditions.items():
+            column, comparator = CONDITION_DISPATCH.get(key, (None, None))
+            if not column or column not in frame.columns:
+                return np.zeros(len(frame), dtype=bool)
+            if column not in columns:
+                columns[column] = numeric_column(frame, column)
+            # NaN compares False, so missing values fail the condition.
+            result &= comparator(columns[column], float(threshold))
+        return result
+
+
+def load_merged_rank_config(explicit_path: Optional[Path]) -> Tuple[Dict[str, Any], str]:
+    """Return the rank rule document merged over the defaults, and its source."""
+    search_paths: List[Path] = []
+    if explicit_path:
+        search_paths.append(explicit_path)
+    search_paths.extend(
+        [
+            Path("ml/config/rank_rules.json"),
+            Path("config/rank_rules.json"),
+        ]
+    )
+
+    for candidate in search_paths:
+        if not candidate.exists():
+            continue
+        try:
+            user_config = json.loads(candidate.read_text(encoding="utf-8"))
+        except json.JSONDecodeError as exc:
+            print(f"[WARN] Failed to parse rank rule config at {candidate}: {exc}. Continuing with defaults.")
+            continue
+        return _deep_merge(DEFAULT_RANK_CONFIG, user_config), str(candidate)
+    return _deep_merge(DEFAULT_RANK_CONFIG, {}), "built-in defaults"
+
+
+def rank_config_hash(explicit_path: Optional[Path]) -> str:
+    """sha256 of the merged rank rule document (key order does not matter)."""
+    merged_config, _ = load_merged_rank_config(explicit_path)
+    return hashlib.sha256(json.dumps(merged_config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_rank_config(scenario: str, explicit_path: Optional[Path]) -> Tuple[List[RankRule], Set[str], str, str]:
+    scenario_key = scenario.upper()
+    merged_config, source = load_merged_rank_config(explicit_path)
+
+    scenario_map = merged_config.get("scenarios", {})
+    scenario_data = scenario_map.get(scenario_key) or scenario_map.get("DEFAULT", {})
+
+    default_invest = {grade.upper() for grade in merged_config.get("default_invest_grades", ["S", "A"])}
+    invest_grades = {grade.upper() for grade in scenario_data.get("invest_grades", list(default_invest))}
+    fallback_grade = scenario_data.get("fallback_grade", merged_config.get("fallback_grade", "E")).upper()
+
+    rules: List[RankRule] = []
+    for entry in scenario_data.get("rules", []):
+        grade = str(entry.get("grade", fallback_grade)).upper()
+        conditions_raw = entry.get("conditions", {})
+        conditions: Dict[str, float] = {}
+        for key, threshold in conditions_raw.items():
+            if key not in CONDITION_DISPATCH:
+                raise ValueError(f"Unknown rank condition '{key}' for scenario '{scenario_key}'.")
+            conditions[key] = float(threshold)
+        rules.append(RankRule(grade=grade, conditions=conditions))
+
+    return rules, invest_grades, fallback_grade, source
+
+
+def numeric_column(frame: pd.DataFrame, column: str) -> np.ndarray:
+    """Column as float64 with unparsable / missing values as NaN."""
+    series = frame[column]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def assign_rank_grades(frame: pd.DataFrame, rules: Sequence[RankRule], fallback_grade: str) -> np.ndarray:
+    """Grade every row: the first matching rule wins, otherwise `fallback_grade`."""
+    if not rules:
+        return np.full(len(frame), fallback_grade, dtype=object)
+    columns: Dict[str, np.ndarray] = {}
+    masks = [rule.mask(frame, columns) for rule in rules]
+    return np.select(masks, [rule.grade for rule in rules], default=fallback_grade).astype(object)
@@ -0,0 +1,43 @@
+"""Segment-wise race softmax against a plain per-race loop."""
+from __future__ import annotations
+
+import numpy as np
+from scipy.special import logsumexp, softmax
+
+from ml.models.conditional_logit import ConditionalLogitModel, race_segments, segment_log_sum_exp
+
+
+def _races(seed: int = 3) -> np.ndarray:
+    """Shuffled race ids with 1 to 18 runners per race."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 19, size=40)
+    race_ids = np.repeat([f"2025010506{race:02d}" for race in range(len(sizes))], sizes)
+    return race_ids[rng.permutation(len(race_ids))]
+
+
+def test_segment_log_sum_exp_matches_per_race_loop() -> None:
+    race_ids = _races()
+    rng = np.random.default_rng(0)
+    # Utilities far outside exp()'s range still have to come out finite.
+    z = rng.normal(scale=3.0, size=len(race_ids)) + rng.choice([-800.0, 0.0, 800.0], size=len(race_ids))
+
+    order, starts, counts = race_segments(race_ids)
+    got = segment_log_sum_exp(z[order], starts, counts)
+
+    expected = [logsumexp(z[race_ids == race]) for race in np.unique(race_ids)]
+    assert np.isfinite(got).all()
+    np.testing.assert_allclose(got, expected, rtol=1e-12)
+
+
+def test_predict_proba_is_a_softmax_per_race() -> None:
+    race_ids = _races()
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(len(race_ids), 4))
+    model = ConditionalLogitModel()
+    model.coef_ = np.array([0.5, -1.0, 2.0, 0.0])
+
+    win = model.predict_proba(X, race_ids)[:, 1]
+
+    for race in np.unique(race_ids):
+        rows = race_ids == race
+        np.testing.assert_allclose(win[rows], softmax(X[rows] @ model.coef_), rtol=1e-12)
@@ -0,0 +1,92 @@
+"""Per-day evaluation cache: stale day detection and day replacement."""
+from __future__ import annotations
+
+import sqlite3
+
+import pandas as pd
+
+from ml.db.evaluation_cache import (
+    AGGREGATE_KEYS,
+    AGGREGATE_VALUES,
+    ensure_cache_tables,
+    load_aggregates,
+    replace_days,
+    stale_days,
+    stored_fingerprints,
+)
+from ml.evaluation.evaluate_predictions import _stale_runs
+
+JAN_5 = ("2025", "0105")
+JAN_6 = ("2025", "0106")
+JAN_12 = ("2025", "0112")
+
+
+def _aggregates(day: tuple, predictions: int) -> pd.DataFrame:
+    year, month_day = day
+    row = dict.fromkeys(AGGREGATE_VALUES, 0)
+    row.update(
+        {
+            "Year": year,
+            "MonthDay": month_day,
+            "ModelVersion": "win-1",
+            "RankGrade": "A",
+            "InvestFlag": 1,
+            "Predictions": predictions,
+            "PayoutSource": "N_HARAI",
+        }
+    )
+    return pd.DataFrame([row], columns=[*AGGREGATE_KEYS, *AGGREGATE_VALUES])
+
+
+def _cache() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    ensure_cache_tables(conn)
+    current = {JAN_5: ("p5", "r5"), JAN_6: ("p6", "r6")}
+    aggregates = pd.concat([_aggregates(JAN_5, 10), _aggregates(JAN_6, 20)], ignore_index=True)
+    replace_days(conn, "PRE", 100.0, [JAN_5, JAN_6], current, aggregates)
+    return conn
+
+
+def _predictions(conn: sqlite3.Connection) -> dict:
+    cached = load_aggregates(conn, "PRE", 100.0, "2025-01-01", "2025-01-31")
+    rows = cached[["Year", "MonthDay", "Predictions"]].itertuples(index=False)
+    return {(year, month_day): count for year, month_day, count in rows}
+
+
+def test_stale_days_finds_changed_new_and_removed_days() -> None:
+    stored = {JAN_5: ("p5", "r5"), JAN_6: ("p6", "r6")}
+    current = {JAN_5: ("p5", "r5-corrected"), JAN_12: ("p12", "r12")}
+    assert stale_days(current, stored) == [JAN_5, JAN_6, JAN_12]
+    assert stale_days(stored, stored) == []
+
+
+def test_replace_days_swaps_only_the_given_days() -> None:
+    conn = _cache()
+    current = {JAN_5: ("p5", "r5-corrected"), JAN_6: ("p6", "r6"), JAN_12: ("p12", "r12")}
+    aggregates = pd.concat([_aggregates(JAN_5, 11), _aggregates(JAN_12, 30)], ignore_index=True)
+    replace_days(conn, "PRE", 100.0, [JAN_5, JAN_12], current, aggregates)
+
+    assert _predictions(conn) == {JAN_5: 11, JAN_6: 20, JAN_12: 30}
+    assert stored_fingerprints(conn, "PRE", 100.0, "2025-01-01", "2025-01-31") == current
+    assert stale_days(current, stored_fingerprints(conn, "PRE", 100.0, None, None)) == []
+
+
+def test_replace_days_drops_days_without_predictions() -> None:
+    conn = _cache()
+    current = {JAN_5: ("p5", "r5")}
+    replace_days(conn, "PRE", 100.0, [JAN_6], current, _aggregates(JAN_6, 0).iloc[:0])
+
+    assert _predictions(conn) == {JAN_5: 10}
+    assert stored_fingerprints(conn, "PRE", 100.0, None, None) == current
+
+
+def test_cache_rows_are_kept_per_stake() -> None:
+    conn = _cache()
+    replace_days(conn, "PRE", 200.0, [JAN_5], {JAN_5: ("p5", "r5")}, _aggregates(JAN_5, 99))
+    assert _predictions(conn) == {JAN_5: 10, JAN_6: 20}
+
+
+def test_stale_runs_never_span_a_fresh_day() -> None:
+    days = [("2024", "1228"), ("2024", "1229"), JAN_5, JAN_6, JAN_12]
+    stale = [("2024", "1228"), ("2024", "1229"), JAN_6, JAN_12]
+    assert _stale_runs(stale, days) == [(("2024", "1228"), ("2024", "1229")), (JAN_6, JAN_12)]
@@ -0,0 +1,80 @@
+"""Vectorised rank grading against the row-wise rule matching it replaced."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.rank_engine import RankRule, assign_rank_grades, load_rank_config
+
+
+def _row_grades(frame: pd.DataFrame, rules, fallback_grade: str) -> np.ndarray:
+    """predict_today's grading before the rank engine: first `RankRule.matches` per row."""
+
+    def grade(row: pd.Series) -> str:
+        for rule in rules:
+            if rule.matches(row):
+                return rule.grade
+        return fallback_grade
+
+    return frame.apply(grade, axis=1).to_numpy(dtype=object)
+
+
+def _features(rows: int = 3000, seed: int = 7) -> pd.DataFrame:
+    """Values on and around the default thresholds, with gaps and raw text columns."""
+    rng = np.random.default_rng(seed)
+
+    def pick(values, missing: float = 0.1) -> np.ndarray:
+        column = rng.choice(np.asarray(values, dtype=float), size=rows)
+        column[rng.random(rows) < missing] = np.nan
+        return column
+
+    frame = pd.DataFrame(
+        {
+            "WinScore": pick([0.2, 0.35, 0.45, 0.52, 0.55, 0.62, 0.65, 0.75, 0.78, 0.9]),
+            "M5Value": pick([1.0, 1.5, 1.6, 2.0, 2.2, 3.0]),
+            "ZM_VALUE": pick([40, 48, 50, 55, 60, 70]),
+            "ZI_INDEX": pick([45, 50, 55, 65]),
+            "TrainerWinRate": pick([0.05, 0.12, 0.2]),
+            "PreTanOdds": pick([2.0, 6.0, 12.0, 30.0]),
+        }
+    )
+    # HORSE_MARKS columns arrive as text; the typed schema stores some as categories.
+    frame["ZI_INDEX"] = frame["ZI_INDEX"].map(lambda value: "" if np.isnan(value) else f"{value:.0f}")
+    frame["M5Value"] = frame["M5Value"].astype("category")
+    return frame
+
+
+@pytest.fixture
+def defaults(tmp_path: Path) -> Path:
+    path = tmp_path / "rank_rules.json"
+    path.write_text("{}", encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("scenario", ["PRE", "LIVE"])
+def test_grades_match_row_wise_rules(scenario: str, defaults: Path) -> None:
+    rules, _, fallback_grade, _ = load_rank_config(scenario, defaults)
+    frame = _features()
+
+    grades = assign_rank_grades(frame, rules, fallback_grade)
+    assert grades.tolist() == _row_grades(frame, rules, fallback_grade).tolist()
+    assert len(set(grades)) > 3
+
+
+def test_rule_on_missing_column_never_matches(defaults: Path) -> None:
+    rules, _, fallback_grade, _ = load_rank_config("LIVE", defaults)
+    frame = _features().drop(columns=["PreTanOdds"])
+
+    grades = assign_rank_grades(frame, rules, fallback_grade)
+    assert grades.tolist() == _row_grades(frame, rules, fallback_grade).tolist()
+    assert not set(grades) & {"S", "A"}
+
+
+def test_no_rules_fall_back() -> None:
+    frame = _features(rows=5)
+    assert assign_rank_grades(frame, [], "E").tolist() == ["E"] * 5
+    only = [RankRule(grade="B", conditions={"min_win_score": 2.0})]
+    assert assign_rank_grades(frame, only, "E").tolist() == _row_grades(frame, only, "E").tolist()
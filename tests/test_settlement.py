@@ -0,0 +1,127 @@
+"""N_HARAI payout settlement across the two column naming layouts."""
+from __future__ import annotations
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from ml.evaluation.settlement import harai_columns, load_payouts, payout_columns, settle, settle_entries
+
+RACE = ("2025", "0105", "06", "01")
+
+# JVLinkToSQLite (0-based, slot before field) and field-before-slot (1-based).
+LAYOUTS = {
+    "jvlink": {
+        "PayTansyo0Umaban": "03",
+        "PayTansyo0Pay": "450",
+        "PayFukusyo0Umaban": "03",
+        "PayFukusyo0Pay": "160",
+        "PayFukusyo1Umaban": "07",
+        "PayFukusyo1Pay": "230",
+    },
+    "numbered": {
+        "PayTansyoUmaban1": "03",
+        "PayTansyoPay1": "450",
+        "PayFukusyoUmaban1": "03",
+        "PayFukusyoPay1": "160",
+        "PayFukusyoUmaban2": "07",
+        "PayFukusyoPay2": "230",
+    },
+}
+
+
+def _harai(columns: dict) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    names = ["Year", "MonthDay", "JyoCD", "RaceNum", *columns]
+    conn.execute(f"CREATE TABLE N_HARAI ({', '.join(f'{name} TEXT' for name in names)})")
+    conn.execute(f"INSERT INTO N_HARAI VALUES ({', '.join('?' for _ in names)})", [*RACE, *columns.values()])
+    return conn
+
+
+def _entries() -> pd.DataFrame:
+    year, month_day, jyo, race = RACE
+    return pd.DataFrame(
+        {"Year": year, "MonthDay": month_day, "JyoCD": jyo, "RaceNum": race, "Umaban": ["3", "7", "11"]}
+    )
+
+
+@pytest.mark.parametrize("layout", sorted(LAYOUTS))
+def test_both_layouts_settle_the_same(layout: str) -> None:
+    conn = _harai(LAYOUTS[layout])
+    table = load_payouts(conn, "2025-01-05", "2025-01-05", ["win", "place"])
+    assert table.available == ("win", "place")
+
+    settled = settle_entries(_entries(), table, stake=100.0)
+    assert settled["PayoutSettled"].all()
+    assert settled["WinReturn"].tolist() == [450.0, 0.0, 0.0]
+    assert settled["PlaceReturn"].tolist() == [160.0, 230.0, 0.0]
+
+
+def test_columns_are_ordered_by_slot() -> None:
+    columns = payout_columns(harai_columns(_harai(LAYOUTS["jvlink"])), ["place"])
+    assert columns == {"place": [("PayFukusyo0Umaban", "PayFukusyo0Pay"), ("PayFukusyo1Umaban", "PayFukusyo1Pay")]}
+
+
+def test_missing_payout_columns_settle_nothing() -> None:
+    conn = _harai({"PayTansyoNinki1": "1"})
+    table = load_payouts(conn, "2025-01-05", "2025-01-05", ["win", "place"])
+    assert table.races.empty and table.available == ()
+
+    settled = settle_entries(_entries(), table, stake=100.0)
+    assert not settled["PayoutSettled"].any()
+    assert "WinReturn" not in settled.columns
+
+
+# Horse 11 scratched: flagged at index 10 (0-based) or 11 (1-based).
+REFUNDS = {"jvlink": {"HenkanUma10": "1", "HenkanUma0": "0"}, "numbered": {"HenkanUma11": "1", "HenkanUma1": "0"}}
+
+
+@pytest.mark.parametrize("layout", sorted(LAYOUTS))
+def test_scratched_runner_is_refunded(layout: str) -> None:
+    conn = _harai({**LAYOUTS[layout], **REFUNDS[layout]})
+    table = load_payouts(conn, "2025-01-05", "2025-01-05", ["win", "place"])
+
+    settled = settle_entries(_entries(), table, stake=100.0)
+    assert settled["WinReturn"].tolist() == [450.0, 0.0, 100.0]
+    assert settled["PlaceReturn"].tolist() == [160.0, 230.0, 100.0]
+    assert settled["WinRefund"].tolist() == [0, 0, 1]
+
+
+def test_combination_refunds() -> None:
+    conn = _harai(
+        {
+            "PayUmaren0Kumi": "0307",
+            "PayUmaren0Pay": "1250",
+            "PayWakuren0Kumi": "24",
+            "PayWakuren0Pay": "900",
+            "PaySanrentan0Kumi": "",
+            "PaySanrentan0Pay": "0",
+            # 0-based flags; slot 0 is always present and marks the layout.
+            "HenkanUma0": "0",
+            "HenkanUma10": "1",  # horse 11
+            "HenkanWaku0": "0",
+            "HenkanWaku5": "1",  # bracket 6
+            "FuseirituFlag0": "0",
+            "FuseirituFlag8": "1",  # 3連単 not formed
+        }
+    )
+    table = load_payouts(conn, "2025-01-05", "2025-01-05", ["quinella", "bracket_quinella", "trifecta"])
+    year, month_day, jyo, race = RACE
+    tickets = pd.DataFrame(
+        {
+            "Year": year,
+            "MonthDay": month_day,
+            "JyoCD": jyo,
+            "RaceNum": race,
+            "BetType": ["quinella", "quinella", "quinella", "bracket_quinella", "bracket_quinella"],
+            "Selection": ["7-3", "3-11", "3-5", "6-2", "4-5"],
+            "Stake": 100.0,
+        }
+    )
+    settled = settle(tickets, table)
+    assert settled["Return"].tolist() == [1250.0, 100.0, 0.0, 100.0, 0.0]
+    assert settled["Refund"].tolist() == [0, 1, 0, 1, 0]
+
+    void = tickets.iloc[:1].assign(BetType="trifecta", Selection="3-7-11")
+    assert settle(void, table)["Return"].tolist() == [100.0]
@@ -0,0 +1,89 @@
+"""Incremental ML_TRAINER_DAILY refreshes against a rebuild from scratch."""
+from __future__ import annotations
+
+import sqlite3
+
+from ml.features.trainer_stats import STATE_TABLE, TABLE_NAME, history_fingerprints, refresh_trainer_stats
+
+# Race days more than PENDING_WINDOW_DAYS apart, so older days fall outside the rescan window.
+DAYS = ["20250105", "20250112", "20250201", "20250208"]
+# (Umaban, ChokyosiCode, KakuteiJyuni) of the one race on every day.
+STARTERS = [("01", "01001", "01"), ("02", "01002", "02"), ("03", "01001", "03"), ("04", "01003", "04")]
+
+
+def _ecore() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        """
+        CREATE TABLE N_UMA_RACE (
+            Year TEXT, MonthDay TEXT, JyoCD TEXT, RaceNum TEXT, Umaban TEXT, ChokyosiCode TEXT, KakuteiJyuni TEXT,
+            PRIMARY KEY (Year, MonthDay, JyoCD, RaceNum, Umaban)
+        )
+        """
+    )
+    for day in DAYS:
+        _run(conn, day)
+    return conn
+
+
+def _run(conn: sqlite3.Connection, day: str, starters=STARTERS) -> None:
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO N_UMA_RACE VALUES (?, ?, '06', '01', ?, ?, ?)",
+            [(day[:4], day[4:], *starter) for starter in starters],
+        )
+
+
+def _tables(conn: sqlite3.Connection) -> tuple:
+    daily = conn.execute(f"SELECT * FROM {TABLE_NAME} ORDER BY ChokyosiCode, RaceDate").fetchall()
+    state = conn.execute(f"SELECT RaceDate, Checksum, History FROM {STATE_TABLE} ORDER BY RaceDate").fetchall()
+    return daily, state
+
+
+def _rebuilt(conn: sqlite3.Connection) -> tuple:
+    fresh = sqlite3.connect(":memory:")
+    conn.backup(fresh)
+    fresh.execute(f"DROP TABLE {TABLE_NAME}")
+    fresh.execute(f"DROP TABLE {STATE_TABLE}")
+    refresh_trainer_stats(fresh)
+    return _tables(fresh)
+
+
+def test_resume_after_rewritten_past_result() -> None:
+    conn = _ecore()
+    refresh_trainer_stats(conn)
+    before = history_fingerprints(conn, ["20250110", "20250120", "20250301"])
+
+    # JVLinkToSQLite rewrites a corrected record with INSERT OR REPLACE (new rowid).
+    _run(conn, "20250112", [("01", "01001", "02"), ("02", "01002", "01")])
+    assert refresh_trainer_stats(conn) > 0
+    assert _tables(conn) == _rebuilt(conn)
+
+    after = history_fingerprints(conn, ["20250110", "20250120", "20250301"])
+    assert after["20250110"] == before["20250110"]
+    assert after["20250120"] != before["20250120"]
+    assert after["20250301"] != before["20250301"]
+
+
+def test_unchanged_refresh_writes_nothing() -> None:
+    conn = _ecore()
+    refresh_trainer_stats(conn)
+    assert refresh_trainer_stats(conn) == 0
+
+
+def test_appended_day_writes_only_its_rows() -> None:
+    conn = _ecore()
+    refresh_trainer_stats(conn)
+    _run(conn, "20250215")
+    assert refresh_trainer_stats(conn) == len({trainer for _, trainer, _ in STARTERS})
+    assert _tables(conn) == _rebuilt(conn)
+
+
+def test_in_place_update_is_found_by_verify() -> None:
+    conn = _ecore()
+    refresh_trainer_stats(conn)
+    with conn:
+        conn.execute("UPDATE N_UMA_RACE SET KakuteiJyuni = '05' WHERE MonthDay = '0105' AND Umaban = '04'")
+    assert refresh_trainer_stats(conn) == 0
+    assert refresh_trainer_stats(conn, verify=True) > 0
+    assert _tables(conn) == _rebuilt(conn)